@@ -1,16 +1,18 @@
 from . import Pipeline, PipelineInterruptionException
+from .utilities import ResultsArchive, write_digest
 
 try:
 	from . import __version__
 except ImportError:
 	__version__ = None
 from argparse import ArgumentParser
+from asyncio import to_thread
 from atexit import register
 from json import load
-from os import PathLike, chmod
+from os import PathLike, chmod, getenv
 from os.path import splitext, isfile
 from pathlib import Path
-from shutil import make_archive
+from shutil import get_archive_formats, make_archive
 
 
 @register
@@ -24,6 +26,11 @@ def on_terminate():
 	logging.shutdown()
 
 
+def compression_formats() -> tuple[str, ...]:
+	"""The formats the results can be compressed into, either while the pipeline runs or with shutil once it's done."""
+	return tuple(dict.fromkeys((*ResultsArchive.available_formats(), *sorted(name for name, _ in get_archive_formats()))))
+
+
 async def run_pipeline(query=None, verbose:bool=False, compress:str=None, compress_location:str=None, journal_scraper:bool=False,
 				 pdf_scraper:bool=False, caption_distributor:bool=False, figure_separator:bool=False, **kwargs):
 	if query is None:
@@ -33,6 +40,9 @@ async def run_pipeline(query=None, verbose:bool=False, compress:str=None, compre
 	# 	raise ValueError("You must run the pipeline with at least one tool.")
 
 	compress = compress or ""
+	if compress and compress not in compression_formats():
+		# Checked before the run starts, rather than failing to compress the results once it's done
+		raise ValueError(f"Unsupported compression format \"{compress}\". Expected one of {', '.join(compression_formats())}.")
 
 	path = Path(query).absolute()
 	if not path.exists():
@@ -49,6 +59,12 @@ async def run_pipeline(query=None, verbose:bool=False, compress:str=None, compre
 			search_query["logging"].append("print")
 
 	pipeline = Pipeline(search_query)
+	name = search_query["name"]
+	save_location, _ = splitext(compress_location or str(pipeline.results_directory))
+	if ResultsArchive.supports(compress):
+		# Compresses the outputs of each stage while the rest of the pipeline runs
+		pipeline.archive = ResultsArchive(save_location, pipeline.results_directory.parent, name, compress,
+										  workers=search_query.get("archive_workers", None))
 	try:
 		results = await pipeline.run(caption_distributor=caption_distributor, pdf_scraper=pdf_scraper,
 									 journal_scraper=journal_scraper, figure_separator=figure_separator)
@@ -56,11 +72,13 @@ async def run_pipeline(query=None, verbose:bool=False, compress:str=None, compre
 		for handler in pipeline.logger.handlers:
 			handler.flush()
 
-		if compress:
-			name = search_query["name"]
-			save_location, _ = splitext(compress_location or str(pipeline.results_directory))
-			make_archive(save_location, compress, root_dir=str(pipeline.results_directory.parent), base_dir=name)
+		if pipeline.archive is not None:
+			save_location = await to_thread(pipeline.archive.close)
+		elif compress:
+			save_location = make_archive(save_location, compress, root_dir=str(pipeline.results_directory.parent), base_dir=name)
+			await to_thread(write_digest, save_location)
 
+		if compress:
 			try:
 				chmod(save_location, 0o775)
 				print("Changed the permissions.")
@@ -69,17 +87,45 @@ async def run_pipeline(query=None, verbose:bool=False, compress:str=None, compre
 				pipeline.logger.warning(f"Could not change the permissions of {save_location} to 775.")
 
 	except PipelineInterruptionException as e:
+		if pipeline.archive is not None:
+			pipeline.archive.abort()
 		pipeline.logger.exception("The pipeline could not successfully finish running.")
 		if hasattr(e, "errno"):
 			return e.errno
 		return -1
+	except BaseException:
+		# Any other error, or the run being cancelled, also leaves the archive incomplete
+		if pipeline.archive is not None:
+			pipeline.archive.abort()
+		raise
+
+	return 0
+
 
+async def worker(concurrency:int = 1, poll_interval:float = 2.0, name:str = None, lease:float = None):
+	from .worker import PipelineWorker
+	from asyncio import CancelledError, current_task, get_running_loop
+	from signal import SIGINT, SIGTERM
+	import logging
+
+	logging.basicConfig(level=logging.INFO)
+
+	# Stopping the worker stops its runs and puts them back in the queue
+	task = current_task()
+	for sig in (SIGINT, SIGTERM):
+		get_running_loop().add_signal_handler(sig, task.cancel)
+
+	try:
+		await PipelineWorker(concurrency=concurrency, poll_interval=poll_interval, name=name, lease=lease).run()
+	except CancelledError:
+		pass
 	return 0
 
 
 async def ui(dashboard_configuration:PathLike[str] = None, api_configuration:PathLike[str] = None, blocking:bool = False):
 	from signal import signal, SIGINT, SIGTERM, SIGQUIT
 	from subprocess import Popen
+	from sys import executable
 
 	exsclaim_dir = Path(__file__).parent.resolve()
 
@@ -99,11 +145,15 @@ async def ui(dashboard_configuration:PathLike[str] = None, api_configuration:Pat
 	api = Popen(["/usr/local/bin/hypercorn", "-c", api_configuration, "exsclaim.api:app"])
 	dashboard = Popen(["/usr/local/bin/gunicorn", "-c", dashboard_configuration, "exsclaim.dashboard:server"],
 		  cwd=str(exsclaim_dir / "dashboard"))
+	# Runs the queries submitted through the API
+	pipeline_worker = Popen([executable, "-m", "exsclaim", "worker", "--concurrency", getenv("EXSCLAIM_WORKER_CONCURRENCY", "1")])
 
 	if not blocking:
 		return 0
 
 	def signal_handler(*args):
+		# The worker is terminated rather than killed so it can requeue the runs it was in the middle of
+		pipeline_worker.terminate()
 		dashboard.kill()
 		api.kill()
 		return 0
@@ -113,6 +163,7 @@ async def ui(dashboard_configuration:PathLike[str] = None, api_configuration:Pat
 
 	api.wait()
 	dashboard.wait()
+	pipeline_worker.wait()
 	return 0
 
 
@@ -137,7 +188,7 @@ async def launch(args=None):
 	query_subparser.add_argument("--caption_distributor", "--caption", "-cd", action="store_true")
 	query_subparser.add_argument("--figure_separator", "--figure", "-fs", action="store_true")
 	query_subparser.add_argument("--html_scraper", "-hs", action="store_true")
-	query_subparser.add_argument("--compress", "-c", choices=["zip", "tar", "gztar", "bztar", "xztar"], help="Compress the search results into a tar.gz file to save space. Deletes the original folder after compression.")
+	query_subparser.add_argument("--compress", "-c", choices=compression_formats(), help="Compress the search results into a tar.gz file to save space. Deletes the original folder after compression.")
 	query_subparser.add_argument("--compress_location", "-cl", help="The location where the compressed search results will be stored.")
 	query_subparser.add_argument("--verbose", "-v", action="store_true")
 
@@ -148,6 +199,12 @@ async def launch(args=None):
 
 	db_subparser = subparsers.add_parser("initialize_db", help="Initializes the PostgreSQL database.")
 
+	worker_subparser = subparsers.add_parser("worker", help="Runs the queries submitted through the API.")
+	worker_subparser.add_argument("--concurrency", "-c", type=int, default=int(getenv("EXSCLAIM_WORKER_CONCURRENCY", "1")), help="The number of pipelines run at once.")
+	worker_subparser.add_argument("--poll_interval", type=float, default=2.0, help="How often (in seconds) the queue is checked for new queries and cancellations.")
+	worker_subparser.add_argument("--name", help="Identifies the worker in the job queue. Queries left running by a previous worker with the same name are restarted.")
+	worker_subparser.add_argument("--lease", type=float, default=None, help="How long (in seconds) a query can go without a heartbeat from its worker before another worker restarts it. Defaults to $EXSCLAIM_JOB_LEASE, or 120.")
+
 	for subparser in (query_subparser, view_subparser):
 		subparser.add_argument("--force_ollama", action="store_true", help="Fails if EXSCLAIM can't connect to the Ollama API.")
 
@@ -169,6 +226,9 @@ async def launch(args=None):
 			exit_code = await ui(**args)
 		case "initialize_db":
 			exit_code = await init_db()
+		case "worker":
+			del args["command"]
+			exit_code = await worker(**args)
 		case "train":
 			...
 
@@ -2,35 +2,39 @@ import exsclaim
 import logging
 
 from .settings import Settings
+from .cache import *
+from .reuse import *
+from ..db import JobQueue, clone_run, dispose_engines, get_async_engine, get_pool_metrics
+from ..utilities import ProgressReporter, read_digest, read_progress, write_digest
 from .models import *
 from .middleware import *
 from .routers import v1_router
+from .routers.v1 import response_cache
 
 from aiohttp import ClientSession
+from asyncio import sleep, to_thread
 from asyncpg import UndefinedTableError
 from contextlib import asynccontextmanager
 from datetime import datetime as dt
-from exsclaim.__main__ import run_pipeline as exsclaim_pipeline
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import Response, FileResponse, JSONResponse
-from io import BytesIO
-from json import dump
+from fastapi.responses import Response, FileResponse, JSONResponse, StreamingResponse
+from json import dump, dumps
 from logging.handlers import TimedRotatingFileHandler
-from os import listdir, getenv
+from os import getenv
 from pathlib import Path
 from pytz import utc as UTC
 from sqlmodel import select, update, insert
 from sqlmodel.ext.asyncio.session import AsyncSession
-from shutil import make_archive, rmtree, get_archive_formats
+from shutil import rmtree, get_archive_formats
+from starlette.background import BackgroundTask
 from starlette.middleware import Middleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
-from tarfile import open as tar_open
-from tempfile import TemporaryDirectory
-from typing import Literal
+from time import monotonic
+from typing import AsyncIterator, Literal
 from uuid import UUID
 from uuid_utils import uuid7
 
@@ -99,16 +103,32 @@ def flush_logger():
 		handler.flush()
 
 
+def get_checkpoint_folder() -> Path:
+	return Path(getenv("EXSCLAIM_CHECKPOINTS", "/exsclaim/checkpoints")).resolve()
+
+
+def write_checkpoint_digests():
+	"""Writes the digest sidecars of checkpoints that were copied into the checkpoint folder without one."""
+	folder = get_checkpoint_folder()
+	if not folder.is_dir():
+		return
+	for path in folder.iterdir():
+		if path.is_file() and not path.name.startswith(".") and path.suffix != ".sha256":
+			read_digest(path)
+
+
 @asynccontextmanager
 async def lifespan(app:FastAPI):
 	# Runs before the application starts
 	for _dir in ("results", "logs"):
 		path = Path("/exsclaim") / _dir
 		path.mkdir(exist_ok=True, parents=True)
+	await to_thread(write_checkpoint_digests)
 
 	yield # Runs the application
 
 	# Runs after the application has finished
+	await dispose_engines()
 	flush_logger()
 
 
@@ -129,6 +149,7 @@ def get_middleware() -> list[Middleware]:
 		allow_credentials=True,
 		allow_methods=["GET", "POST"],
 		allow_headers=["*"],
+		expose_headers=["Link", "X-Next-After"],
 	))
 	# endregion
 
@@ -347,33 +368,53 @@ async def healthcheck(request:Request) -> Response:
 	return response
 
 
-async def run_exsclaim(_id:UUID, search_query_location:Path, session: AsyncSession):
-	db_result: Status = Status.ERROR
-	result_code = -1
-	try:
-		result_code = await exsclaim_pipeline(query=search_query_location, journal_scraper=True, caption_distributor=True, figure_separator=True,
-											  compress="gztar", compress_location=f"/exsclaim/results/{_id}", verbose=settings.DEBUG)
-		if result_code == 0:
-			db_result = Status.FINISHED
-
-		results_dir = search_query_location.parent
-		if results_dir.is_dir():
-			rmtree(results_dir.absolute(), ignore_errors=True)
-	except KeyboardInterrupt:
-		db_result = Status.KILLED
-	except Exception as e:
-		logging.getLogger(f"run_exsclaim_{_id}").exception(e)
+@app.get("/metrics/database", tags=["System Check"],
+		 responses={
+			 200: {
+				 "description": "The connection pool metrics of this API worker, keyed by the database they're connected to.",
+				 "content": {
+					 "application/json": {
+						 "example": {
+							 "postgresql+asyncpg://exsclaim:***@db:5432/exsclaim": {
+								 "pool_size": 5,
+								 "max_overflow": 10,
+								 "checked_out": 2,
+								 "idle": 3,
+								 "overflow": 0,
+								 "saturation": 0.1333,
+								 "peak_checked_out": 6,
+								 "checkouts": 1_520,
+								 "timeouts": 0,
+								 "checkout_seconds": {"mean": 0.0004, "p50": 0.0001, "p95": 0.0012, "p99": 0.0105, "max": 0.0913},
+							 }
+						 }
+					 }
+				 }
+			 },
+		 })
+async def database_metrics() -> Response:
+	"""How long requests wait to check a connection out of the pool, and how much of the pool is in use. Each API
+	worker process has its own pools, so the metrics are those of the worker that handled the request."""
+	return JSONResponse(get_pool_metrics(), headers={"Cache-Control": "no-store"})
 
-	# "UPDATE results SET status = %s, end_time = NOW() WHERE id = %s", (db_result, _id)
-	logger.debug("\n\n\nAbout to update result to finished\n\n\n")
-	await session.exec(update(Results).where(Results.id == _id).values(status=db_result, end_time=dt.now()))
-	await session.commit()
-	logger.debug("\n\n\nCode should have gone through.\n\n\n")
 
-	return result_code
+archive_cache = ArchiveCache()
+job_queue = JobQueue(get_async_engine())
 
 
 @app.post("/query", responses={
+	200: {
+		"description": "The same search finished recently, so its results were reused and are available right away.",
+		"content": {
+			"application/json": {
+				"example": {
+					"message": "The results of an identical recent query were reused, and are available now.",
+					"result_id": str(_EXAMPLE_UUID),
+					"reused_from": "0198c5a4-2f1e-7b6a-9d3c-5e8f1a2b3c4d"
+				}
+			}
+		}
+	},
 	202: {
 		"description": "Query successfully submitted.",
 		"content": {
@@ -452,7 +493,7 @@ async def run_exsclaim(_id:UUID, search_query_location:Path, session: AsyncSessi
 		}
 	}
 }, tags=["Using EXSCLAIM"])
-async def query(request:Request, search_query: Query, background_tasks:BackgroundTasks) -> Response:
+async def query(request:Request, search_query: Query) -> Response:
 	session = request.state.session
 	logger: logging.Logger = request.state.logger
 
@@ -463,7 +504,6 @@ async def query(request:Request, search_query: Query, background_tasks:Backgroun
 		uuid = UUID(str_uuid)
 
 		results_dir = Path("/exsclaim") / "results" / str_uuid
-		results_dir.mkdir(exist_ok=True, parents=True)
 
 		exsclaim_input = {
 			"name": search_query.name if search_query else "exsclaim_results",
@@ -489,10 +529,6 @@ async def query(request:Request, search_query: Query, background_tasks:Backgroun
 			}
 		}
 
-		with open(results_dir / "search_query.json", "w") as f:
-			dump(exsclaim_input, f, indent='\t')
-		background_tasks.add_task(run_exsclaim, uuid, results_dir / "search_query.json", session)
-
 		db_json = exsclaim_input.copy()
 		db_json["model_key"] = "model_key" in db_json.keys()
 		for unnecessary_key in ["notifications", "results_dir", "logging"]:
@@ -502,8 +538,39 @@ async def query(request:Request, search_query: Query, background_tasks:Backgroun
 		for sanitized_keys in ("name", "term", "synonyms"):
 			... # TODO: Sanitize these user inputs
 
+		# A recent run of the same search has its results copied instead of running the pipeline again
+		db_json[FINGERPRINT_KEY] = query_fingerprint(exsclaim_input)
+		if (source_id := await find_reusable_run(session, db_json[FINGERPRINT_KEY])) is not None:
+			source_archive = (results_dir.parent / str(source_id)).with_suffix(".tar.gz")
+			if await to_thread(link_archive, source_archive, results_dir.with_suffix(".tar.gz")):
+				db_json["reused_from"] = str(source_id)
+				now = dt.now(tz=UTC)
+				await session.exec(insert(Results).values(id=uuid, search_query=db_json, extension=SaveExtensions.TAR,
+														  status=Status.FINISHED, start_time=now, end_time=now))
+				copied = await clone_run(session, source_id, uuid)
+				await session.commit()
+				# Nothing should have been cached about the new run yet, but pages read before the rows were copied can't be kept
+				response_cache.invalidate(uuid)
+				logger.info(f"Reused the results of {source_id} for {uuid} ({sum(copied.values()):,} rows copied).")
+
+				message = "The results of an identical recent query were reused, and are available now."
+				headers = {"Location": f"/results/{str_uuid}"}
+				# The notifications are sent once the response has been, as the pipeline would have when it finished
+				notify = BackgroundTask(notify_reused, exsclaim_input, source_id, logger)
+				if send_json:
+					return JSONResponse({"message": message, "result_id": str_uuid, "reused_from": str(source_id)},
+										status_code=200, media_type="application/json", headers=headers, background=notify)
+				return Response(f"{message} The results can be found using id: {str_uuid}.", status_code=200,
+								media_type="text/plain", headers=headers, background=notify)
+
+		results_dir.mkdir(exist_ok=True, parents=True)
+		with open(results_dir / "search_query.json", "w") as f:
+			dump(exsclaim_input, f, indent='\t')
+
 		# "INSERT INTO results(id, search_query, extension) VALUES(%s, %s, %s);", (uuid, dumps(db_json), "tar.gz")
 		await session.exec(insert(Results).values(id=uuid, search_query=db_json, extension=SaveExtensions.TAR))
+		# The query is run by an `exsclaim worker` process once one is free
+		job_queue.enqueue(session, uuid, str(results_dir / "search_query.json"))
 		await session.commit()
 
 		if send_json:
@@ -703,6 +770,94 @@ async def status(request:Request, result_id: UUID):
 	return response
 
 
+@app.post("/query/{result_id}/cancel", tags=["Using EXSCLAIM"], status_code=202,
+		  responses={
+			  202: {"description": "The run was cancelled, or will be stopped by the worker running it."},
+			  404: {"description": "ID Not Found."},
+			  409: {"description": "The run has already ended."},
+		  })
+async def cancel(request:Request, result_id: UUID):
+	"""Cancels a query. Queued runs are marked as killed right away, and running ones once their worker stops them."""
+	session = request.state.session
+	if await job_queue.cancel(result_id):
+		return JSONResponse({"message": f"The query {result_id} is being cancelled.", "result_id": str(result_id)},
+							status_code=202, media_type="application/json", headers={"Location": f"/status/{result_id}"})
+
+	result = (await session.exec(select(Results.id).where(Results.id == result_id))).one_or_none()
+	if result is None:
+		return JSONResponse({"message": f"There is no query recorded in our database with id: {result_id}."},
+							status_code=404, media_type="application/json")
+	return JSONResponse({"message": f"The query {result_id} has already ended."}, status_code=409, media_type="application/json")
+
+
+def server_sent_event(event:str, data:dict, _id:int = None) -> str:
+	lines = [f"event: {event}"]
+	if _id is not None:
+		lines.append(f"id: {_id}")
+	lines.append(f"data: {dumps(data, separators=(',', ':'))}")
+	return "\n".join(lines) + "\n\n"
+
+
+async def progress_events(request:Request, result_id:UUID, name:str, status:Status, poll_interval:float = 0.5,
+						  status_interval:float = 5.0, keep_alive:float = 15.0) -> AsyncIterator[str]:
+	"""Sends a progress event each time the run's progress.json changes, and a status event once the run has ended.
+
+	Following the run only reads the file its pipeline writes to, so the database is only queried for the run's status
+	when there's no progress to read: while the run is queued, and after it ends (when its results directory is removed).
+	"""
+	progress_path = Path("/exsclaim") / "results" / str(result_id) / name / ProgressReporter.FILENAME
+	sequence = None
+	last_event = last_status_check = monotonic()
+
+	while status == Status.RUNNING:
+		if await request.is_disconnected():
+			return
+
+		progress = await to_thread(read_progress, progress_path)
+		now = monotonic()
+		if progress is not None and progress.get("sequence") != sequence:
+			sequence = progress.get("sequence")
+			last_event = now
+			yield server_sent_event("progress", progress, sequence)
+		elif now - last_event >= keep_alive:
+			last_event = now
+			# Comments keep proxies from closing an idle connection
+			yield ": keep-alive\n\n"
+
+		if (progress is None or progress.get("state") != "running") and now - last_status_check >= status_interval:
+			last_status_check = now
+			async with AsyncSession(get_async_engine()) as session:
+				status = (await session.exec(select(Results.status).where(Results.id == result_id))).one()
+			continue
+
+		await sleep(poll_interval)
+
+	yield server_sent_event("status", dict(status=f"{status}.", result_id=str(result_id)))
+
+
+@app.get("/progress/{result_id}", tags=["Using EXSCLAIM"],
+		 responses={
+			 200: {
+				 "description": "A stream of server-sent events. Each \"progress\" event holds the done and total counts of each of the run's stages, and a final \"status\" event is sent once the run ends.",
+				 "content": {"text/event-stream": {"schema": {"type": "string"}}},
+			 },
+			 404: {"description": "ID Not Found."},
+		 })
+async def progress(request:Request, result_id:UUID) -> Response:
+	"""Streams the progress of a run's stages (articles scraped, captions split, figures separated) while it's running."""
+	session = request.state.session
+	result: Results | None = (await session.exec(select(Results).where(Results.id == result_id))).one_or_none()
+	if result is None:
+		return JSONResponse({"message": f"There is no query recorded in our database with id: {result_id}."},
+							status_code=404, media_type="application/json")
+
+	name = result.search_query.get("name", "exsclaim_results")
+	headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+	# The stream outlives the request's session, so the events query the database with their own sessions
+	return StreamingResponse(progress_events(request, result_id, name, result.status), media_type="text/event-stream",
+							 headers=headers)
+
+
 @app.get("/results/{result_id}", tags=["Using EXSCLAIM"],
 		 responses={
 			 200: {
@@ -821,33 +976,30 @@ async def download(request:Request, result_id:UUID, compression:str = "default",
 
 	if compression == "gztar":
 		return FileResponse(path=str(results_file), media_type="application/octet-stream", filename=results_file.name,
-							status_code=200)
-
-	tmp_dir = Path(TemporaryDirectory().name)
-
-	with tar_open(results_file) as f:
-		f.extractall(tmp_dir)
-
-	name = [file for file in listdir(tmp_dir) if "." not in file][0]
-
-	try:
-		results_file = Path(make_archive(str(tmp_dir / str(result_id)), compression, root_dir=str(tmp_dir), base_dir=name))
-
-		buffer = BytesIO()
+							status_code=200, headers={"X-Sha256-Hash": await to_thread(read_digest, results_file)})
 
-		with open(results_file, "rb") as f:
-			buffer.write(f.read())
+	if compression not in ARCHIVE_EXTENSIONS:
+		return Response(f"Archive format '{compression}' cannot be created from the results.", status_code=422, media_type="text/plain")
 
-		rmtree(tmp_dir)
+	if filename == "name":
+		name = await to_thread(archive_name, results_file)
+		filename = f"{name or result_id}{ARCHIVE_EXTENSIONS[compression]}"
+	elif filename == "id":
+		filename = f"{result_id}{ARCHIVE_EXTENSIONS[compression]}"
 
-		if filename == "name":
-			filename = results_file.with_stem(name).name
-		elif filename == "id":
-			filename = results_file.name
+	# Repeat downloads are served from the files cached by earlier ones
+	cached_file = await to_thread(archive_cache.get, result_id, compression)
+	if cached_file is not None:
+		return FileResponse(path=str(cached_file), media_type="application/octet-stream", status_code=200,
+							headers={"Content-Disposition": f"inline ; filename = \"{filename}\"",
+									 "X-Sha256-Hash": await to_thread(read_digest, cached_file)})
 
-		return Response(content=buffer.getvalue(), media_type="application/octet-stream", headers={"Content-Disposition": f"inline ; filename = \"{filename}\""})
-	except ValueError as e:
-		return Response(str(e), status_code=422, media_type="text/plain")
+	# The archive is transcoded into the cache before it's sent, so the first download also carries its digest
+	path, digest, cached = await to_thread(archive_cache.build, result_id, compression,
+										   transcode_archive(results_file, compression))
+	return FileResponse(path=str(path), media_type="application/octet-stream", status_code=200,
+						headers={"Content-Disposition": f"inline ; filename = \"{filename}\"", "X-Sha256-Hash": digest},
+						background=None if cached else BackgroundTask(path.unlink, missing_ok=True))
 
 
 @app.get("/compression_types", tags=["Using EXSCLAIM"],
@@ -952,7 +1104,7 @@ async def classification_codes(request:Request) -> Response:
 
 @app.get("/checkpoints/{checkpoint}", tags=["EXSCLAIM Model Checkpoints"])
 async def download_checkpoint(checkpoint:str) -> Response:
-	checkpoint_folder = Path(getenv("EXSCLAIM_CHECKPOINTS", "/exsclaim/checkpoints")).resolve()
+	checkpoint_folder = get_checkpoint_folder()
 
 	if not checkpoint_folder.exists() or not checkpoint_folder.is_dir():
 		return Response("Could not find any checkpoints. Please try again later.", status_code=503, media_type="text/plain")
@@ -961,5 +1113,10 @@ async def download_checkpoint(checkpoint:str) -> Response:
 	if not checkpoint_path.exists():
 		return Response(f"Could not find checkpoint \"{checkpoint}\". ", status_code=404, media_type="text/plain")
 
+	# The digest is read from the sidecar file written when the checkpoint was saved, or when the API started
+	digest = await to_thread(read_digest, checkpoint_path, compute=False)
+	if digest is None:
+		logger.warning(f"The checkpoint \"{checkpoint}\" has no up to date digest, so it is being hashed while it's requested.")
+		digest = await to_thread(write_digest, checkpoint_path)
 	return FileResponse(path=str(checkpoint_path), media_type="application/octet-stream", filename=checkpoint,
-						status_code=200)
+						status_code=200, headers={"X-Sha256-Hash": digest})
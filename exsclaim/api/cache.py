@@ -0,0 +1,330 @@
+"""Caches for the API's responses: transcoded results archives on disk, and the serialized results of finished runs in memory"""
+from ..utilities import digest_path, write_digest
+
+from collections import OrderedDict
+from contextlib import suppress
+from gzip import compress, decompress
+from hashlib import sha256
+from os import PathLike, getenv, replace, utime
+from pathlib import Path
+from tempfile import mkstemp
+from tarfile import TarFile, TarInfo, open as tar_open
+from threading import Lock
+from time import localtime, monotonic, time
+from starlette.requests import Request
+from starlette.responses import Response
+from typing import Iterator
+from uuid import UUID, uuid4
+from zipfile import ZIP_DEFLATED, ZIP64_LIMIT, ZipFile, ZipInfo
+
+
+__all__ = ["ARCHIVE_EXTENSIONS", "ArchiveCache", "archive_name", "transcode_archive", "CachedResponse", "ResponseCache"]
+
+
+ARCHIVE_EXTENSIONS = {
+	"zip": ".zip",
+	"tar": ".tar",
+	"gztar": ".tar.gz",
+	"bztar": ".tar.bz2",
+	"xztar": ".tar.xz",
+}
+
+
+class _ChunkSink:
+	"""A write-only file object that collects what's written to it until it's drained by the response."""
+	def __init__(self):
+		self._chunks: list[bytes] = []
+
+	def write(self, data:bytes) -> int:
+		if data:
+			self._chunks.append(bytes(data))
+		return len(data)
+
+	def flush(self):
+		pass
+
+	def drain(self) -> bytes:
+		data = b"".join(self._chunks)
+		self._chunks.clear()
+		return data
+
+
+def archive_name(source:PathLike[str]) -> str | None:
+	"""The name of the top level folder in a results archive, read from its first member without decompressing the rest."""
+	with tar_open(source, "r:*") as tar:
+		member = tar.next()
+	return None if member is None else member.name.split("/", 1)[0]
+
+
+def _zip_info(member:TarInfo) -> ZipInfo:
+	name = f"{member.name.rstrip('/')}/" if member.isdir() else member.name
+	# Zip timestamps can't be earlier than 1980
+	info = ZipInfo(name, date_time=max(localtime(member.mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+	info.external_attr = ((member.mode | (0o040000 if member.isdir() else 0o100000)) & 0xFFFF) << 16
+	if member.isdir():
+		info.external_attr |= 0x10
+	else:
+		info.compress_type = ZIP_DEFLATED
+	return info
+
+
+def transcode_archive(source:PathLike[str], compression:str, chunk_size:int = 1 << 16) -> Iterator[bytes]:
+	"""Reads the members of a tar archive one at a time and yields them re-encoded as a zip or another tar format.
+	Nothing is extracted to disk, and only about chunk_size bytes (plus the compressors' buffers) are held in memory.
+	:param source: The path to the tar archive.
+	:param str compression: One of ARCHIVE_EXTENSIONS, other than "gztar".
+	:param int chunk_size: The number of bytes read from a member at a time.
+	:raises ValueError: If the compression isn't supported.
+	"""
+	if compression not in ARCHIVE_EXTENSIONS or compression == "gztar":
+		raise ValueError(f"Cannot transcode to \"{compression}\".")
+
+	sink = _ChunkSink()
+	# Opened with gzip.GzipFile rather than as a stream, since archives written by ResultsArchive hold several gzip members
+	with tar_open(source, "r:*") as tar:
+		if compression == "zip":
+			writer = ZipFile(sink, "w", compression=ZIP_DEFLATED, allowZip64=True)
+		else:
+			mode = {"tar": "w|", "bztar": "w|bz2", "xztar": "w|xz"}[compression]
+			writer = tar_open(fileobj=sink, mode=mode)
+
+		with writer:
+			for member in tar:
+				if isinstance(writer, TarFile):
+					fileobj = tar.extractfile(member) if member.isfile() else None
+					writer.addfile(member, fileobj)
+				elif member.isdir():
+					writer.writestr(_zip_info(member), b"")
+				elif member.isfile():
+					source_file = tar.extractfile(member)
+					with writer.open(_zip_info(member), "w", force_zip64=member.size >= ZIP64_LIMIT) as destination:
+						while chunk := source_file.read(chunk_size):
+							destination.write(chunk)
+							if data := sink.drain():
+								yield data
+				# Links and special files aren't written to zips
+
+				if data := sink.drain():
+					yield data
+
+	if data := sink.drain():
+		yield data
+
+
+class ArchiveCache:
+	"""A bounded on-disk cache of transcoded results archives, evicting the least recently downloaded files first.
+	:param directory: Where the files are stored. Defaults to $EXSCLAIM_ARCHIVE_CACHE_DIR or /exsclaim/cache/archives.
+	:param int max_bytes: The total size of the cached files. Defaults to $EXSCLAIM_ARCHIVE_CACHE_BYTES or 5 GiB.
+	"""
+	def __init__(self, directory:PathLike[str] = None, max_bytes:int = None):
+		self.directory = Path(directory or getenv("EXSCLAIM_ARCHIVE_CACHE_DIR", None) or "/exsclaim/cache/archives")
+		self.max_bytes = int(max_bytes or getenv("EXSCLAIM_ARCHIVE_CACHE_BYTES", None) or 5 << 30)
+		self._lock = Lock()
+		# Maps each cached file to its [size, last access time], loaded from the directory the first time it's needed
+		self._index: dict[str, list] | None = None
+		self._size = 0
+
+	def path(self, result_id, compression:str) -> Path:
+		return self.directory / f"{result_id}{ARCHIVE_EXTENSIONS[compression]}"
+
+	def get(self, result_id, compression:str) -> Path | None:
+		"""Returns the cached file, marking it as recently used, or None if it isn't cached."""
+		path = self.path(result_id, compression)
+		if not path.is_file():
+			return None
+
+		now = time()
+		with suppress(OSError):
+			utime(path, (now, now))
+		with self._lock:
+			self._load_index()
+			if path.name in self._index:
+				self._index[path.name][1] = now
+		return path
+
+	def build(self, result_id, compression:str, chunks:Iterator[bytes]) -> tuple[Path, str, bool]:
+		"""Writes all of the chunks to a file before any of them are sent, so the response can carry its sha256 digest,
+		which is also written to a sidecar file. A file that's interrupted part way through leaves nothing behind.
+		:returns: The file, its digest, and if it was added to the cache. A file that wasn't (it's larger than the whole
+			cache, or the cache can't be written to) is a temporary file the caller deletes once it has been sent.
+		"""
+		path = self.path(result_id, compression)
+		try:
+			self.directory.mkdir(parents=True, exist_ok=True)
+			temporary = path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+			f = open(temporary, "wb")
+		except OSError:
+			# The archive is still built, outside of the cache, if the cache can't be written to
+			descriptor, temporary = mkstemp(suffix=ARCHIVE_EXTENSIONS[compression])
+			temporary, f, path = Path(temporary), open(descriptor, "wb"), None
+
+		hasher = sha256()
+		try:
+			with f:
+				for chunk in chunks:
+					f.write(chunk)
+					hasher.update(chunk)
+			digest = hasher.hexdigest()
+			if path is None or temporary.stat().st_size > self.max_bytes:
+				return temporary, digest, False
+			replace(temporary, path)
+			write_digest(path, digest)
+		except BaseException:
+			with suppress(OSError):
+				temporary.unlink()
+			raise
+
+		self._add(path)
+		return path, digest, True
+
+	def _load_index(self):
+		if self._index is not None:
+			return
+		self._index = {}
+		self._size = 0
+		for path in self.directory.glob("*"):
+			if path.name.startswith(".") or path.suffix == ".sha256":
+				continue
+			with suppress(OSError):
+				stat = path.stat()
+				self._index[path.name] = [stat.st_size, stat.st_mtime]
+				self._size += stat.st_size
+
+	def _add(self, path:Path):
+		with suppress(OSError), self._lock:
+			self._load_index()
+			size = path.stat().st_size
+			# The index may have been loaded with the file in it already
+			previous = self._index.pop(path.name, None)
+			self._size -= previous[0] if previous else 0
+			if size > self.max_bytes:
+				path.unlink()
+				digest_path(path).unlink(missing_ok=True)
+				return
+			self._size += size
+			self._index[path.name] = [size, time()]
+			self._evict(keep=path.name)
+
+	def _evict(self, keep:str):
+		for name, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+			if self._size <= self.max_bytes:
+				break
+			if name == keep:
+				continue
+			with suppress(OSError):
+				(self.directory / name).unlink()
+				digest_path(self.directory / name).unlink(missing_ok=True)
+			del self._index[name]
+			self._size -= size
+
+
+class CachedResponse:
+	"""A serialized JSON response, kept gzipped, along with the strong ETag of its uncompressed body."""
+	__slots__ = ("body", "etag", "headers")
+
+	def __init__(self, body:bytes, headers:dict[str, str] = None):
+		self.etag = f'"{sha256(body).hexdigest()}"'
+		self.body = compress(body, compresslevel=6)
+		self.headers = dict(headers or {})
+
+	@property
+	def size(self) -> int:
+		return len(self.body) + len(self.etag) + sum(len(key) + len(value) for key, value in self.headers.items())
+
+	def matches(self, request:Request) -> bool:
+		"""If the request's If-None-Match header lists this response's ETag."""
+		if_none_match = request.headers.get("If-None-Match", "")
+		etags = {etag.strip().removeprefix("W/") for etag in if_none_match.split(",")}
+		return "*" in etags or self.etag in etags
+
+	def to_response(self, request:Request) -> Response:
+		"""A 304 response if the client already has this body, otherwise the body, gzipped if the client accepts it."""
+		headers = dict(self.headers, ETag=self.etag, Vary="Accept-Encoding")
+		headers["Cache-Control"] = "no-cache"
+		if self.matches(request):
+			return Response(status_code=304, headers=headers)
+
+		if "gzip" in request.headers.get("Accept-Encoding", ""):
+			headers["Content-Encoding"] = "gzip"
+			return Response(self.body, media_type="application/json", headers=headers)
+		return Response(decompress(self.body), media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+	"""An in-memory LRU cache of the responses about finished runs, whose results don't change.
+
+	Responses are keyed by their path and query parameters, and are stored gzipped, so a hit is served without querying
+	the database, serializing or compressing anything. The least recently used responses are evicted once the cache holds
+	more than max_bytes. Responses (and the knowledge that a run has finished) expire after ttl seconds, so rows changed
+	by another process (e.g. a worker, or a run whose rows were removed) are read again. A process that changes a run's
+	rows itself should call invalidate.
+	:param int max_bytes: The memory budget of the cache. Defaults to $EXSCLAIM_RESPONSE_CACHE_BYTES or 64 MiB.
+	:param float ttl: How long (in seconds) responses are kept. Defaults to $EXSCLAIM_RESPONSE_CACHE_TTL or 600.
+	"""
+	def __init__(self, max_bytes:int = None, ttl:float = None):
+		self.max_bytes = int(max_bytes or getenv("EXSCLAIM_RESPONSE_CACHE_BYTES", None) or 64 << 20)
+		self.ttl = float(ttl if ttl is not None else getenv("EXSCLAIM_RESPONSE_CACHE_TTL", 600))
+		# The responses, with the (monotonic) time they expire at
+		self._entries: OrderedDict[tuple, tuple[float, CachedResponse]] = OrderedDict()
+		self._size = 0
+		# The runs known to have finished, whose responses can be cached, with the time that's no longer assumed at.
+		# Since every run is kept for ttl, they're in the order they expire
+		self._finished_runs: OrderedDict[UUID, float] = OrderedDict()
+
+	@staticmethod
+	def key(request:Request) -> tuple:
+		return request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+	def get(self, request:Request) -> CachedResponse | None:
+		key = self.key(request)
+		if (entry := self._entries.get(key)) is None:
+			return None
+
+		expires, response = entry
+		if expires <= monotonic():
+			self._remove(key)
+			return None
+		self._entries.move_to_end(key)
+		return response
+
+	def put(self, request:Request, response:CachedResponse) -> CachedResponse:
+		size = response.size
+		if size > self.max_bytes or self.ttl <= 0:
+			return response
+
+		key = self.key(request)
+		self._remove(key)
+		self._entries[key] = (monotonic() + self.ttl, response)
+		self._size += size
+
+		while self._size > self.max_bytes:
+			_, (_, evicted) = self._entries.popitem(last=False)
+			self._size -= evicted.size
+		return response
+
+	def is_finished(self, run_id:UUID) -> bool:
+		"""If the run was recently found to have finished, so its responses can be cached."""
+		expires = self._finished_runs.get(run_id, None)
+		if expires is not None and expires <= monotonic():
+			del self._finished_runs[run_id]
+			return False
+		return expires is not None
+
+	def mark_finished(self, run_id:UUID):
+		now = monotonic()
+		# Drops the runs that have expired, which may never be looked up again
+		while self._finished_runs and next(iter(self._finished_runs.values())) <= now:
+			self._finished_runs.popitem(last=False)
+		self._finished_runs[run_id] = now + self.ttl
+		self._finished_runs.move_to_end(run_id)
+
+	def invalidate(self, run_id:UUID):
+		"""Forgets every response about the run, e.g. after its rows were added to or removed."""
+		self._finished_runs.pop(run_id, None)
+		run_id = str(run_id)
+		for key in [key for key in self._entries if run_id in key[0].split("/")]:
+			self._remove(key)
+
+	def _remove(self, key:tuple):
+		if (entry := self._entries.pop(key, None)) is not None:
+			self._size -= entry[1].size
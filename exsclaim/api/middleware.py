@@ -1,6 +1,6 @@
 import logging
 
-from ..db import async_engine
+from ..db import get_async_engine
 
 from contextvars import ContextVar
 from hashlib import sha256
@@ -108,7 +108,7 @@ class SQLAlchemyMiddleware(BaseHTTPMiddleware):
 	def __init__(self, app:ASGIApp, logger, dispatch=None):
 		super().__init__(app, dispatch)
 		self.logger = logger
-		self.session_factory = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+		self.session_factory = sessionmaker(bind=get_async_engine(), class_=AsyncSession, expire_on_commit=False)
 
 	async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
 		session = self.session_factory()
@@ -128,38 +128,45 @@ class SQLAlchemyMiddleware(BaseHTTPMiddleware):
 
 
 class HashMiddleware(BaseHTTPMiddleware):
-	"""Sends the hash of the content to the user for certain paths."""
-	__slots__ = ("hashes",)
+	"""Sends the sha256 hash of the content to the user for certain paths.
 
-	def __init__(self, app:ASGIApp, dispatch=None):
+	Files (archives and checkpoints) are streamed untouched, with the digest their endpoints read from the file's sidecar.
+	Other responses get the digest from their strong ETag, or, if they are small enough, by hashing their body.
+	"""
+	__slots__ = ("max_buffered_size",)
+
+	def __init__(self, app:ASGIApp, dispatch=None, max_buffered_size:int = 1 << 20):
 		super().__init__(app, dispatch)
-		self.hashes = dict()
+		self.max_buffered_size = max_buffered_size
 
 	async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
 		response = await call_next(request)
 
 		path = request.url.path
-		path_with_params = f"{path}?{request.query_params}"
 
-		if response.status_code > 400 or not any((
+		if response.status_code >= 400 or "X-Sha256-Hash" in response.headers or not any((
 			# Specify the conditions of the responses that should be hashes
 			path.startswith("/checkpoints"),	# Any of the model checkpoint files
 			path.startswith("/results")			# Any of the result files
 		)):
 			return response
 
-		content = [section async for section in response.body_iterator]
-		response.body_iterator = iterate_in_threadpool(iter(content))
+		etag = response.headers.get("ETag", "").strip('"')
+		if len(etag) == 64 and all(character in "0123456789abcdef" for character in etag):
+			# The strong ETags of the results are already the sha256 of their (uncompressed) bodies
+			response.headers["X-Sha256-Hash"] = etag
+			return response
 
-		digest = self.hashes.get(path_with_params, None)
+		content_length = response.headers.get("Content-Length")
+		if "Content-Encoding" in response.headers or content_length is None or int(content_length) > self.max_buffered_size:
+			return response
 
-		if not digest:
-			hash_obj = sha256()
-			for part in content:
-				hash_obj.update(part)
-			digest = hash_obj.hexdigest()
-			self.hashes[path_with_params] = digest
+		content = [section async for section in response.body_iterator]
+		response.body_iterator = iterate_in_threadpool(iter(content))
 
-		response.headers["X-Sha256-Hash"] = digest
+		hash_obj = sha256()
+		for part in content:
+			hash_obj.update(part)
+		response.headers["X-Sha256-Hash"] = hash_obj.hexdigest()
 
 		return response
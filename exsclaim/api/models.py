@@ -8,7 +8,7 @@ from fastapi import Path
 from httpx import Client, InvalidURL, Response
 from os import getenv
 from pydantic import BaseModel, field_validator
-from sqlalchemy import Enum as SAEnum, Column
+from sqlalchemy import Enum as SAEnum, Column, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import text, SQLModel, Field, DateTime
 from typing import Annotated, Literal, Optional
@@ -41,6 +41,10 @@ class Status(StrEnum):
 
 class Results(SQLModel, table=True):
 	__tablename__ = "results"
+	__table_args__ = (
+		# Finds earlier runs of the same search, whose results can be reused
+		Index("results_search_query_fingerprint", text("(search_query ->> 'fingerprint')")),
+	)
 
 	id: UUID = Field(
 		default_factory=lambda: UUID(str(uuid7)),
@@ -135,7 +139,7 @@ class Query(BaseModel):
 	sortby: Annotated[Literal["relevant", "recent"], Path(title="How the search feature should sort the articles, by the relevancy or the recent publish date.")] = "relevant"
 	term: Annotated[str, Path(title="The term or phrase that you want searched.")]
 	synonyms: Annotated[list[str], Path(title="Any synonyms that you're term might be related to.")] = []
-	save_format: Annotated[list[Literal["subfigures", "visualization", "boxes", "postgres", "csv", "mongo"]],
+	save_format: Annotated[list[Literal["subfigures", "visualization", "boxes", "postgres", "csv", "parquet", "mongo"]],
 		Path(title="How the results should be saved.")] = ["boxes", "postgres"]
 	open_access: Annotated[bool, Path(title="Determines if EXSCLAIM only uses open-access articles (True).")] = False
 	llm: Annotated[str,	Path(title="The Large Language Model (LLM) that is used to separate captions and generate keywords for articles and figures.")] = "llama3.2"
@@ -0,0 +1,109 @@
+"""Reuses the results of a recent run of the same search instead of running the pipeline again"""
+from .models import Results, Status
+from ..notifications import CouldNotNotifyException, Notifications
+from ..utilities import digest_path
+
+from datetime import datetime as dt, timedelta, timezone as tz
+from hashlib import sha256
+from json import dumps
+from logging import Logger, getLogger
+from os import PathLike, getenv, link
+from pathlib import Path
+from re import sub
+from shutil import copy2
+from sqlalchemy import literal_column
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid import UUID
+
+
+__all__ = ["FINGERPRINT_KEY", "query_fingerprint", "reuse_max_age", "find_reusable_run", "link_archive", "notify_reused"]
+
+
+FINGERPRINT_KEY = "fingerprint"
+# Written as a literal (rather than with a bound key) so that Postgres matches it to the results_search_query_fingerprint index
+_FINGERPRINT = literal_column(f"results.search_query ->> '{FINGERPRINT_KEY}'")
+
+
+def _normalize_text(text:str | None) -> str:
+	return sub(r"\s+", " ", text or "").strip().casefold()
+
+
+def query_fingerprint(exsclaim_input:dict) -> str:
+	"""The sha256 digest of the parts of a query that decide its results. The run's name, id, notifications and API keys
+	are left out, and the text is normalized, so queries that only differ in case, whitespace or the order of their
+	synonyms have the same fingerprint."""
+	search_fields = exsclaim_input.get("query", {})
+	terms = [
+		dict(
+			term=_normalize_text(field.get("term")),
+			synonyms=sorted({_normalize_text(synonym) for synonym in field.get("synonyms", []) if _normalize_text(synonym)}),
+		)
+		for _, field in sorted(search_fields.items())
+	]
+	normalized = dict(
+		journal_family=_normalize_text(exsclaim_input.get("journal_family")),
+		query=terms,
+		sortby=_normalize_text(exsclaim_input.get("sortby")),
+		open=bool(exsclaim_input.get("open", False)),
+		maximum_scraped=exsclaim_input.get("maximum_scraped"),
+		llm=exsclaim_input.get("llm"),
+		save_format=sorted(set(exsclaim_input.get("save_format", []))),
+	)
+	return sha256(dumps(normalized, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def reuse_max_age() -> timedelta:
+	"""How old a run's results can be and still be reused, from $EXSCLAIM_REUSE_MAX_AGE (in seconds, default 1 day).
+	0 turns reuse off."""
+	return timedelta(seconds=float(getenv("EXSCLAIM_REUSE_MAX_AGE", 86_400)))
+
+
+async def find_reusable_run(session:AsyncSession, fingerprint:str, max_age:timedelta = None) -> UUID | None:
+	"""The most recent run with the fingerprint that finished within max_age, if there is one."""
+	max_age = reuse_max_age() if max_age is None else max_age
+	if max_age <= timedelta(0):
+		return None
+
+	statement = (select(Results.id)
+				 .where(_FINGERPRINT == fingerprint,
+						Results.status == Status.FINISHED,
+						Results.end_time >= dt.now(tz.utc) - max_age)
+				 .order_by(Results.end_time.desc())
+				 .limit(1))
+	return (await session.exec(statement)).first()
+
+
+def link_archive(source:PathLike[str], destination:PathLike[str]) -> bool:
+	"""Hard links (or copies, if they're on different file systems) a results archive and its digest to a new path.
+	:returns: False if the source archive doesn't exist.
+	"""
+	source, destination = Path(source), Path(destination)
+	if not source.is_file():
+		return False
+
+	for source_file, destination_file in ((source, destination), (digest_path(source), digest_path(destination))):
+		if not source_file.is_file():
+			continue
+		try:
+			link(source_file, destination_file)
+		except OSError:
+			copy2(source_file, destination_file)
+	return True
+
+
+async def notify_reused(exsclaim_input:dict, source_id:UUID, logger:Logger = None):
+	"""Sends the notifications a query asked for once its results were reused, since it never runs the pipeline that
+	would otherwise send them."""
+	logger = logger or getLogger(__name__)
+	name = exsclaim_input.get("name", "exsclaim_results")
+	message = (f"EXSCLAIM! query `{exsclaim_input['run_id']}` finished at: {dt.now():%Y-%m-%dT%H:%M%z}, reusing the "
+			   f"results of the identical query `{source_id}`.")
+
+	notifications = exsclaim_input.get("notifications", {})
+	for key, _class in Notifications.notifiers().items():
+		for json in notifications.get(key, []):
+			try:
+				await _class.from_json(json).notify(message, name=name)
+			except CouldNotNotifyException:
+				logger.exception(f"Could not send notification regarding the completion of \"{name}\".")
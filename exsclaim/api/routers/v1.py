@@ -1,18 +1,133 @@
+from ..cache import CachedResponse, ResponseCache
 from ..models import *
+from ...db import get_async_engine
 
-from fastapi import APIRouter
-from starlette.responses import JSONResponse
+from fastapi import APIRouter, Query as QueryParameter
+from fastapi.encoders import jsonable_encoder
+from json import dumps
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.requests import Request
-from sqlmodel import SQLModel
+from sqlalchemy import and_
+from sqlalchemy.sql import ColumnElement, Select
+from sqlmodel import SQLModel, select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from typing import Any, Callable
+from typing import Annotated, Any, AsyncIterator, Callable, Literal
 from uuid import UUID
 
-__all__ = ["router", "get_items_responses", "articles", "figures", "subfigures", "article", "figure", "subfigure"]
+__all__ = ["router", "response_cache", "get_items_responses", "articles", "figures", "subfigures", "article", "figure",
+		   "subfigure", "bundle"]
 
 router = APIRouter()
+response_cache = ResponseCache()
 DJANGO_COMPATIBILITY = "Django API Backwards Compatibility"
 
+After = Annotated[str | None, QueryParameter(description="Only return items whose id comes after this one. Use the X-Next-After header of the previous page.")]
+Limit = Annotated[int | None, QueryParameter(ge=1, le=5_000, description="The maximum number of items in a page.")]
+Page = Annotated[int | None, QueryParameter(deprecated=True, description="No longer supported, use after and limit instead. Requests that pass it are rejected with a 400 error.")]
+# The size of a page when a client passes after without a limit
+PAGE_SIZE = 1_000
+PAGINATION_DESCRIPTION = (
+	"Without `after` or `limit`, every item of the run is sent at once, as before. Passing either sends the items in "
+	f"pages of up to `limit` (default {PAGE_SIZE:,}) items, ordered by id. When there are more, the `X-Next-After` "
+	"header holds the `after` value of the next page, and the `Link` header its URL.\n\n"
+	"**Breaking change:** the `page` parameter, which used to be ignored, is now rejected with a 400 error."
+)
+
+
+def page_removed(page:int | None) -> Response | None:
+	"""The 400 response sent to clients that still pass the page parameter, which would otherwise get just the first page."""
+	if page is None:
+		return None
+	return JSONResponse(dict(message="The page parameter is no longer supported. Use after and limit, following the "
+									 "X-Next-After header of each page."), status_code=400, media_type="application/json")
+
+
+async def get_items_page(cls, request:Request, results_id:UUID, after:str | None, limit:int, page:int | None,
+						 *where:ColumnElement[bool]) -> Response:
+	"""Gets a page of a run's items, and points the Link and X-Next-After headers at the next page if there is one.
+	Without after or limit, every item is sent, so clients written before the lists were paginated still get all of them.
+	Pages of finished runs don't change, so they're kept in response_cache for a while and revalidated with their ETags.
+	"""
+	if (error := page_removed(page)) is not None:
+		return error
+	if (cached := response_cache.get(request)) is not None:
+		return cached.to_response(request)
+
+	if limit is None and after is not None:
+		limit = PAGE_SIZE
+
+	session = request.state.session
+	# One more item than requested is read to find out if there's another page
+	items = await cls.get_items(results_id, session, after=after, limit=None if limit is None else limit + 1, where=where)
+	key = cls.key_column().name
+	return await page_response(request, results_id, items, limit, lambda item: getattr(item, key))
+
+
+async def page_response(request:Request, results_id:UUID, items:list, limit:int | None, key:Callable[[Any], str]) -> Response:
+	"""Sends up to limit of the items, read with one extra to find out if there's another page, and caches the page if
+	the run has finished. A limit of None sends every item.
+	:param key: Gets the key that the items are paginated by from an item.
+	"""
+	session = request.state.session
+	headers = {}
+	if limit is not None and len(items) > limit:
+		items = items[:limit]
+		next_after = key(items[-1])
+		headers["X-Next-After"] = next_after
+		headers["Link"] = f"<{request.url.include_query_params(after=next_after, limit=limit)}>; rel=\"next\""
+
+	finished = response_cache.is_finished(results_id)
+	if not finished:
+		status = (await session.exec(select(Results.status).where(Results.id == results_id))).one_or_none()
+		if finished := status == Status.FINISHED:
+			response_cache.mark_finished(results_id)
+
+	if not finished:
+		# Pages of unfinished runs can still change, so they're sent without being hashed and compressed for the cache
+		return JSONResponse(jsonable_encoder(items), headers=headers)
+
+	response = response_cache.put(request, CachedResponse(JSONResponse(jsonable_encoder(items)).body, headers))
+	return response.to_response(request)
+
+
+def has_license(figure_run_id, figure_article_id, license:str) -> ColumnElement[bool]:
+	"""If the article that a figure came from has a license starting with the given one (e.g. http://creativecommons.org/licenses/by)."""
+	return (select(Article.id)
+			.where(Article.run_id == figure_run_id, Article.id == figure_article_id, Article.license.startswith(license))
+			.exists())
+
+
+# The columns of each row of a run's bundle: a subfigure, the URL of its figure, and the details of the figure's article
+BUNDLE_COLUMNS = (
+	*(column for column in Subfigure.__table__.columns if column.name != "run_id"),
+	Figure.url.label("figure_url"),
+	Figure.article_id.label("article_id"),
+	Article.title.label("article_title"),
+	Article.url.label("article_url"),
+	Article.license.label("article_license"),
+	Article.open.label("article_open"),
+)
+
+
+def bundle_statement(results_id:UUID, *where:ColumnElement[bool]) -> Select:
+	"""Selects a run's subfigures, ordered by id, each joined with its figure and article through their primary keys."""
+	return (select(*BUNDLE_COLUMNS)
+			.select_from(Subfigure)
+			.join(Figure, and_(Figure.run_id == Subfigure.run_id, Figure.id == Subfigure.figure_id), isouter=True)
+			.join(Article, and_(Article.run_id == Figure.run_id, Article.id == Figure.article_id), isouter=True)
+			.where(Subfigure.run_id == results_id, *where)
+			.order_by(Subfigure.id))
+
+
+async def stream_ndjson(statement:Select, batch_size:int = 1_000) -> AsyncIterator[bytes]:
+	"""Sends each row as a line of JSON, reading batch_size rows at a time from a server-side cursor."""
+	# The stream outlives the request's session, so the rows are read through a connection of its own
+	async with get_async_engine().connect() as connection:
+		result = await connection.stream(statement.execution_options(yield_per=batch_size))
+		async for rows in result.mappings().partitions(batch_size):
+			lines = (dumps(jsonable_encoder(dict(row)), separators=(",", ":")) for row in rows)
+			yield ("\n".join(lines) + "\n").encode()
+
 
 async def get_item(cls, results_id:UUID, _id:str, session: AsyncSession, error_msg:Callable[[str], str]):
 	item = await cls.get_item(results_id, _id, session)
@@ -89,7 +204,7 @@ def get_item_responses(*args, **kwargs):
 
 
 # region Lists of Objects
-@router.get("/{results_id}/articles", tags=[DJANGO_COMPATIBILITY], response_model=list[Article],
+@router.get("/{results_id}/articles", tags=[DJANGO_COMPATIBILITY], description=PAGINATION_DESCRIPTION, response_model=list[Article],
 		 responses=get_items_responses("Article", "articles", [
 			 {
 				 "id": "s41467-024-50040-6",
@@ -119,44 +234,109 @@ def get_item_responses(*args, **kwargs):
 				 "abstract": "null"
 			 }
 		 ]))
-async def articles(request: Request, results_id:UUID):
-	session = request.state.session
-	return await Article.get_items(results_id, session)
+async def articles(request: Request, results_id:UUID, after:After = None, limit:Limit = None, page:Page = None,
+				   license:str = None):
+	where = () if license is None else (Article.license.startswith(license),)
+	return await get_items_page(Article, request, results_id, after, limit, page, *where)
 
 
-@router.get("/{results_id}/figures/", tags=[DJANGO_COMPATIBILITY], response_model=list[Figure],
+@router.get("/{results_id}/figures/", tags=[DJANGO_COMPATIBILITY], description=PAGINATION_DESCRIPTION, response_model=list[Figure],
 		 responses=get_items_responses("Figure", "figures", []))
-async def figures(request: Request, results_id:UUID, page=None):
-	session = request.state.session
-	return await Figure.get_items(results_id, session)
+async def figures(request: Request, results_id:UUID, after:After = None, limit:Limit = None, page:Page = None,
+				  license:str = None):
+	where = () if license is None else (has_license(Figure.run_id, Figure.article_id, license),)
+	return await get_items_page(Figure, request, results_id, after, limit, page, *where)
 
 
-@router.get("/{results_id}/subfigures/", tags=[DJANGO_COMPATIBILITY], response_model=list[Subfigure],
+@router.get("/{results_id}/subfigures/", tags=[DJANGO_COMPATIBILITY], description=PAGINATION_DESCRIPTION, response_model=list[Subfigure],
 		 responses=get_items_responses("Subfigure", "subfigures", []))
-async def subfigures(request: Request, results_id:UUID, page=None):
+async def subfigures(request: Request, results_id:UUID, after:After = None, limit:Limit = None, page:Page = None,
+					 classification_code:Annotated[list[str] | None, QueryParameter(description="Only return subfigures with one of these classification codes.")] = None,
+					 keyword:Annotated[list[str] | None, QueryParameter(description="Only return subfigures with at least one of these keywords.")] = None,
+					 license:str = None):
+	where = []
+	if classification_code:
+		where.append(Subfigure.classification_code.in_(classification_code))
+	if keyword:
+		where.append(Subfigure.keywords.overlap(keyword))
+	if license is not None:
+		where.append(
+			select(Figure.id)
+			.where(Figure.run_id == Subfigure.run_id, Figure.id == Subfigure.figure_id,
+				   has_license(Figure.run_id, Figure.article_id, license))
+			.exists()
+		)
+	return await get_items_page(Subfigure, request, results_id, after, limit, page, *where)
+
+
+@router.get("/{results_id}/bundle", tags=["Using EXSCLAIM"],
+			responses={
+				200: {
+					"description": "The run's subfigures, each with its figure's URL and its article's title, URL and license.",
+					"content": {
+						"application/json": {
+							"example": [{
+								"id": "s41467-024-50040-6_fig1_a", "classification_code": "GR", "height": 344.0,
+								"width": 512.0, "nm_height": None, "nm_width": None, "x1": 12, "y1": 8, "x2": 524,
+								"y2": 352, "caption": "Installed capacity by technology.", "keywords": ["capacity"],
+								"figure_id": "s41467-024-50040-6_fig1.jpg",
+								"figure_url": "https://media.springernature.com/full/s41467-024-50040-6_fig1.jpg",
+								"article_id": "s41467-024-50040-6",
+								"article_title": "Offshore wind and wave energy can reduce total installed capacity required in zero-emissions grids | Nature Communications",
+								"article_url": "https://www.nature.com/articles/s41467-024-50040-6",
+								"article_license": "http://creativecommons.org/licenses/by/4.0/",
+								"article_open": True,
+							}],
+						},
+						"application/x-ndjson": {"schema": {"type": "string"}},
+					},
+				},
+			})
+async def bundle(request: Request, results_id:UUID, after:After = None, limit:Limit = PAGE_SIZE,
+				 format:Annotated[Literal["json", "ndjson"] | None, QueryParameter(description="\"ndjson\" streams every row as a line of JSON instead of sending pages of them. Also selected by an Accept: application/x-ndjson header.")] = None,
+				 classification_code:Annotated[list[str] | None, QueryParameter(description="Only return subfigures with one of these classification codes.")] = None,
+				 keyword:Annotated[list[str] | None, QueryParameter(description="Only return subfigures with at least one of these keywords.")] = None,
+				 license:str = None):
+	"""Everything needed to display a run's subfigures in one request, joined in the database rather than by the client."""
+	where = []
+	if classification_code:
+		where.append(Subfigure.classification_code.in_(classification_code))
+	if keyword:
+		where.append(Subfigure.keywords.overlap(keyword))
+	if license is not None:
+		where.append(Article.license.startswith(license))
+	if after is not None:
+		where.append(Subfigure.id > after)
+	statement = bundle_statement(results_id, *where)
+
+	if format == "ndjson" or (format is None and "application/x-ndjson" in request.headers.get("Accept", "")):
+		return StreamingResponse(stream_ndjson(statement), media_type="application/x-ndjson")
+
+	if (cached := response_cache.get(request)) is not None:
+		return cached.to_response(request)
+
 	session = request.state.session
-	return await Subfigure.get_items(results_id, session)
+	# One more row than requested is read to find out if there's another page
+	rows = (await session.exec(statement.limit(limit + 1))).mappings().all()
+	return await page_response(request, results_id, [dict(row) for row in rows], limit, lambda row: row["id"])
 
 
-@router.get("/{results_id}/scales/", tags=[DJANGO_COMPATIBILITY], response_model=list[Scale],
+@router.get("/{results_id}/scales/", tags=[DJANGO_COMPATIBILITY], description=PAGINATION_DESCRIPTION, response_model=list[Scale],
 		 responses=get_items_responses("Scale", "scales", []))
-async def scales(request: Request, results_id:UUID):
-	session = request.state.session
-	return await Scale.get_items(results_id, session)
+async def scales(request: Request, results_id:UUID, after:After = None, limit:Limit = None, page:Page = None):
+	return await get_items_page(Scale, request, results_id, after, limit, page)
 
 
-@router.get("/{results_id}/subfigure_labels/", tags=[DJANGO_COMPATIBILITY], response_model=list[SubfigureLabel],
+@router.get("/{results_id}/subfigure_labels/", tags=[DJANGO_COMPATIBILITY], description=PAGINATION_DESCRIPTION, response_model=list[SubfigureLabel],
 		 responses=get_items_responses("SubfigureLabel", "subfigure labels", []))
-async def subfigure_labels(request: Request, results_id:UUID):
-	session = request.state.session
-	return await SubfigureLabel.get_items(results_id, session)
+async def subfigure_labels(request: Request, results_id:UUID, after:After = None, limit:Limit = None, page:Page = None):
+	return await get_items_page(SubfigureLabel, request, results_id, after, limit, page)
 
 
-@router.get("/{results_id}/scale_labels/", tags=[DJANGO_COMPATIBILITY], response_model=list[ScaleLabel],
+@router.get("/{results_id}/scale_labels/", tags=[DJANGO_COMPATIBILITY], description=PAGINATION_DESCRIPTION, response_model=list[ScaleLabel],
 		 responses=get_items_responses("ScaleLabel", "scale labels", []))
-async def scale_labels(request: Request, results_id:UUID):
-	session = request.state.session
-	return await ScaleLabel.get_items(results_id, session)
+async def scale_labels(request: Request, results_id:UUID, after:After = None, limit:Limit = None, page:Page = None):
+	return await get_items_page(ScaleLabel, request, results_id, after, limit, page)
 
 
 @router.get("/{results_id}/articles/{id}", tags=[DJANGO_COMPATIBILITY], response_model=Article,
@@ -1,9 +1,23 @@
 from exsclaim.api import Status
 from httpx import AsyncClient
+from json import loads
 from typing import Any
 
 
-__all__ = ["fetch_status", "fetch_articles", "fetch_figures", "fetch_subfigures"]
+__all__ = ["parse_status", "fetch_status", "fetch_pages", "fetch_articles", "fetch_figures", "fetch_subfigures",
+		   "fetch_bundle"]
+
+
+def parse_status(status:str) -> Status:
+	"""Converts a status sent by the API (e.g. "Finished.") to a Status."""
+	match status:
+		case "Finished.":
+			return Status.FINISHED
+		case "Killed.":
+			return Status.KILLED
+		case "Closed due to an error.":
+			return Status.ERROR
+	return Status.RUNNING
 
 
 async def fetch_status(client:AsyncClient, base_url: str, result_id: str) -> Status:
@@ -11,13 +25,7 @@ async def fetch_status(client:AsyncClient, base_url: str, result_id: str) -> Sta
 	try:
 		response = await client.get(f"{base_url}/status/{result_id}")
 		if response.is_success:
-			data = response.json()
-			match data["status"]:
-				case "Finished.":
-					return Status.FINISHED
-				case "Killed.":
-					return Status.KILLED
-			return Status.RUNNING
+			return parse_status(response.json()["status"])
 
 		return Status.ERROR
 	except Exception as e:
@@ -25,37 +33,60 @@ async def fetch_status(client:AsyncClient, base_url: str, result_id: str) -> Sta
 		return Status.ERROR
 
 
-async def fetch_articles(client:AsyncClient, base_url: str, result_id: str) -> list[dict[str, Any]]:
+async def fetch_pages(client:AsyncClient, url:str, params:dict[str, Any] = None) -> list[dict[str, Any]]:
+	"""Fetches every page of a paginated endpoint by following the X-Next-After header of each page."""
+	params = dict(limit=1_000) | (params or {})
+	items = []
+	while True:
+		response = await client.get(url, params=params)
+		response.raise_for_status()
+		items.extend(response.json())
+
+		next_after = response.headers.get("X-Next-After")
+		if next_after is None:
+			return items
+		params["after"] = next_after
+
+
+async def fetch_articles(client:AsyncClient, base_url: str, result_id: str, **filters) -> list[dict[str, Any]]:
 	"""Fetch articles from the API."""
 	try:
-		response = await client.get(f"{base_url}/results/v1/{result_id}/articles")
-		if response.status_code == 200:
-			return response.json()
-		return []
+		return await fetch_pages(client, f"{base_url}/results/v1/{result_id}/articles", filters)
 	except Exception as e:
 		print(f"Error fetching articles: {e}")
 		return []
 
 
-async def fetch_figures(client:AsyncClient, base_url: str, result_id: str, page: int = 1) -> list[dict[str, Any]]:
+async def fetch_figures(client:AsyncClient, base_url: str, result_id: str, **filters) -> list[dict[str, Any]]:
 	"""Fetch figures from the API."""
 	try:
-		response = await client.get(f"{base_url}/results/v1/{result_id}/figures/?page={page}")
-		if response.status_code == 200:
-			return response.json()
-		return []
+		return await fetch_pages(client, f"{base_url}/results/v1/{result_id}/figures/", filters)
 	except Exception as e:
 		print(f"Error fetching figures: {e}")
 		return []
 
 
-async def fetch_subfigures(client:AsyncClient, base_url: str, result_id: str, page: int = 1) -> list[dict[str, Any]]:
-	"""Fetch subfigures from the API."""
+async def fetch_subfigures(client:AsyncClient, base_url: str, result_id: str, **filters) -> list[dict[str, Any]]:
+	"""Fetch subfigures from the API. The filters (classification_code, keyword, license) are applied by the API."""
 	try:
-		response = await client.get(f"{base_url}/results/v1/{result_id}/subfigures/?page={page}")
-		if response.status_code == 200:
-			return response.json()
-		return []
+		return await fetch_pages(client, f"{base_url}/results/v1/{result_id}/subfigures/", filters)
 	except Exception as e:
 		print(f"Error fetching subfigures: {e}")
 		return []
+
+
+async def fetch_bundle(client:AsyncClient, base_url: str, result_id: str, **filters) -> list[dict[str, Any]] | None:
+	"""Fetch every subfigure of a result, each joined with its figure's URL and its article's title, URL and license,
+	streamed from the API in one request. Returns None if they couldn't be fetched, so the caller can try again."""
+	try:
+		subfigures = []
+		async with client.stream("GET", f"{base_url}/results/v1/{result_id}/bundle",
+								 params=dict(filters, format="ndjson")) as response:
+			response.raise_for_status()
+			async for line in response.aiter_lines():
+				if line:
+					subfigures.append(loads(line))
+		return subfigures
+	except Exception as e:
+		print(f"Error fetching the results bundle: {e}")
+		return None
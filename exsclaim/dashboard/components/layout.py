@@ -9,7 +9,7 @@ from .api_client import *
 
 from exsclaim.api import Status
 from certifi import where
-from dash import html, dcc, callback, clientside_callback, Output, Input, State
+from dash import html, dcc, callback, clientside_callback, no_update, Output, Input, State
 from httpx import AsyncClient, Client
 from re import sub
 from typing import Dict, List, Any
@@ -31,8 +31,6 @@ def create_layout_component(result_id: UUID, base_url: str):
 		# Store components for state management
 		dcc.Store(id="layout-state", data={
 			"results_id": str(result_id),
-			"articles": [],
-			"figures": [],
 			"all_subfigures": [],
 			"subfigures": [],
 			"license": False,
@@ -53,10 +51,15 @@ def create_layout_component(result_id: UUID, base_url: str):
 			"subfigure_page": 1
 		}),
 
-		# Interval component for polling API status
+		# The run whose progress is streamed, and its status, set by the stream once the run ends
+		dcc.Store(id="progress-source", data=str(result_id)),
+		dcc.Store(id="run-status", data=None),
+
+		# Polls the API's status if the progress stream can't be opened, and retries loading the results if that fails
 		dcc.Interval(
 			id="api-polling-interval",
-			interval=60_000
+			interval=60_000,
+			disabled=True
 		),
 
 		# Interval to fix the padding of the slider once the page loads
@@ -66,7 +69,10 @@ def create_layout_component(result_id: UUID, base_url: str):
 		),
 
 		# Loading component
-		html.Div(id="loading-container", children=create_loading_component()),
+		html.Div(id="loading-container", children=[
+			create_loading_component(),
+			create_progress_component()
+		]),
 
 		# Main content (hidden while loading)
 		html.Div(id="main-content", style={"display": "none", "width": "95%"}, children=[
@@ -119,6 +125,23 @@ def create_loading_component():
 	], fluid=True)
 
 
+def create_progress_component():
+	"""Create the progress bars of the run's stages, which are updated by the API's progress stream."""
+	stages = (
+		("articles", "Articles scraped"),
+		("captions", "Captions separated"),
+		("figures", "Figures separated"),
+		("results", "Results saved"),
+	)
+	return dbc.Container(id="run-progress", children=[
+		html.Div([
+			dbc.Label(label, html_for=f"progress-{stage}"),
+			dbc.Progress(id=f"progress-{stage}", value=0, striped=True, animated=True)
+		], className="mb-3")
+		for stage, label in stages
+	], style={"maxWidth": "600px"})
+
+
 def create_search_page_component(base_url):
 	"""Create the search page component (left side menu)."""
 	return html.Div(id="filter-components", style={"width": "100%"}, children=[
@@ -334,19 +357,24 @@ def create_images_page_component():
 		Output("loading-container", "style"),
 		Output("main-content", "style")
 	],
-	[Input("api-polling-interval", "n_intervals")],
+	[
+		Input("run-status", "data"),
+		Input("api-polling-interval", "n_intervals")
+	],
 	[
 		State("layout-state", "data"),
 		State("exsclaim-store", "data"),
-	]
+	],
+	prevent_initial_call=True
 )
-async def update_layout_state(n_intervals, current_data:dict, data):
-	"""Update layout state by fetching data from API."""
+async def update_layout_state(run_status, n_intervals, current_data:dict, data):
+	"""Update layout state by fetching data from API, once the progress stream reports that the run has ended.
+	Until the results are loaded, the API keeps being polled, so e.g. a failed fetch of the results is tried again."""
 	results_pending = {"display": "block"}, {"display": "none"}
 	results_loaded = {"display": "none"}, {"display": "block"}
 
 	if not current_data:
-		return current_data, False, *results_pending
+		return current_data, no_update, *results_pending
 
 	result_id = current_data.get("results_id")
 	fast_api_url = data["fast_api_url"]
@@ -356,7 +384,12 @@ async def update_layout_state(n_intervals, current_data:dict, data):
 
 	async with AsyncClient(verify=ssl_context) as client:
 		# Check if results are ready
-		match (status := await fetch_status(client, fast_api_url, result_id)):
+		if run_status:
+			status = parse_status(run_status.get("status"))
+		else:
+			status = await fetch_status(client, fast_api_url, result_id)
+
+		match status:
 			case Status.RUNNING:
 				return current_data, False, *results_pending  # Still loading, return current state
 			case Status.FINISHED:
@@ -371,18 +404,16 @@ async def update_layout_state(n_intervals, current_data:dict, data):
 				})
 				return updated_data, True, *results_loaded
 
-		# Results are ready, fetch all data
-		articles = await fetch_articles(client, fast_api_url, result_id)
-		figures = await fetch_figures(client, fast_api_url, result_id)
-		subfigures = await fetch_subfigures(client, fast_api_url, result_id)
+		# Results are ready, fetch the subfigures along with their figures and articles
+		subfigures = await fetch_bundle(client, fast_api_url, result_id)
+		if subfigures is None:
+			return current_data, False, *results_pending
 
 	# Update the state
 	all_subfigures = updated_data.get("all_subfigures", [])
 	all_subfigures.extend(subfigures)
 	updated_data.update({
 		"results_available": True,
-		"articles": articles,
-		"figures": figures,
 		"all_subfigures": all_subfigures,
 		"subfigures": subfigures,
 		"articles_loaded": True,
@@ -400,6 +431,55 @@ async def update_layout_state(n_intervals, current_data:dict, data):
 		return updated_data, False, *results_pending
 
 
+# Follows the run's progress through server-sent events instead of polling its status
+clientside_callback(
+	"""
+	function subscribeToProgress(result_id, store){
+		if(!result_id || !store){ return window.dash_clientside.no_update; }
+
+		// Only one stream is followed at a time, even if the page is rendered again
+		if(window.exsclaimProgress !== undefined){ window.exsclaimProgress.close(); }
+		const source = new EventSource(`${store.public_fastapi_url}/progress/${result_id}`);
+		window.exsclaimProgress = source;
+
+		source.addEventListener("progress", (event) => {
+			const progress = JSON.parse(event.data);
+			for(const [stage, counts] of Object.entries(progress.stages)){
+				if(document.getElementById(`progress-${stage}`) === null){ continue; }
+
+				const finished = counts.state === "done";
+				const total = counts.total || 0;
+				window.dash_clientside.set_props(`progress-${stage}`, {
+					value: finished && total === 0 ? 1 : counts.done,
+					max: Math.max(total, counts.done, 1),
+					label: total ? `${counts.done.toLocaleString()} of ${total.toLocaleString()}` : counts.done.toLocaleString(),
+					animated: !finished,
+					color: finished ? "success" : "primary"
+				});
+			}
+		});
+
+		source.addEventListener("status", (event) => {
+			source.close();
+			window.dash_clientside.set_props("run-status", {data: JSON.parse(event.data)});
+		});
+
+		source.onerror = () => {
+			// EventSource reconnects by itself, unless the stream couldn't be opened at all
+			if(source.readyState === EventSource.CLOSED){
+				window.dash_clientside.set_props("api-polling-interval", {disabled: false});
+			}
+		};
+
+		return window.dash_clientside.no_update;
+	}
+	""",
+	Output("run-status", "data"),
+	Input("progress-source", "data"),
+	State("exsclaim-store", "data"),
+)
+
+
 @callback(
 	Output("result-id-display", "children"),
 	Input("layout-state", "data"),
@@ -424,7 +504,6 @@ def update_keywords(keyword_type, data):
 		return []
 
 	all_subfigures = data.get("all_subfigures", [])
-	articles = data.get("articles", [])
 
 	keywords = []
 
@@ -438,9 +517,9 @@ def update_keywords(keyword_type, data):
 						keywords.extend(subfigure[keyword_type])
 
 		case "title":
-			for article in articles:
-				if article.get("title"):
-					keywords.extend(article["title"].split(" "))
+			for title in {subfigure.get("article_title") for subfigure in all_subfigures}:
+				if title:
+					keywords.extend(title.split(" "))
 
 	# Remove duplicates and create options
 	unique_keywords = sorted(set(map(lambda kw: sub(r"[^a-zA-Z\d_-]", "", kw), keywords)), key=lambda kw: kw.upper())
@@ -474,8 +553,6 @@ async def update_images(data, n_clicks, keywords, classifications, license_only)
 				return html.Div("The results for this run are unavailable due to an error interrupting the pipeline. Please re-submit your query later.", className="text-center")
 
 	subfigures = data.get("subfigures", [])
-	figures = data.get("figures", [])
-	articles = data.get("articles", [])
 
 	if not subfigures:
 		return html.Div("No articles/figures available.", className="text-center")
@@ -502,7 +579,7 @@ async def update_images(data, n_clicks, keywords, classifications, license_only)
 	# Filter by license
 	if license_only:
 		filtered_subfigures = filter(
-			lambda subfigure: subfigure.get("license", False),
+			lambda subfigure: subfigure.get("article_open", False),
 			filtered_subfigures
 		)
 
@@ -514,15 +591,10 @@ async def update_images(data, n_clicks, keywords, classifications, license_only)
 	image_items = []
 	# figure_sizes = dict()
 	for subfigure in filtered_subfigures:
-		figure = next(filter(lambda figure: subfigure["figure_id"] == figure["id"], figures), None)
-		article = dict()
-		if figure:
-			article = next(filter(lambda article: figure["article_id"] == article["id"], articles), article)
-
 		x1, y1 = subfigure["x1"], subfigure["y1"]
 		width, height = subfigure["width"], subfigure["height"]
 
-		url = figure["url"]
+		url = subfigure["figure_url"]
 
 		scale = 290 / max(width, height)
 
@@ -546,10 +618,10 @@ async def update_images(data, n_clicks, keywords, classifications, license_only)
 					),
 					html.Small(
 						html.A(
-							article.get("title", "Unknown"),
-							href=article.get("url", "#"),
+							subfigure.get("article_title") or "Unknown",
+							href=subfigure.get("article_url") or "#",
 							target="_blank"
-						) if article else "Unknown",
+						) if subfigure.get("article_id") else "Unknown",
 						className="card-text"
 					)
 				])
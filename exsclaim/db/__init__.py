@@ -1,2 +1,4 @@
+from .content import *
+from .jobs import *
 from .postgres import *
 from .models import *
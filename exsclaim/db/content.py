@@ -0,0 +1,166 @@
+"""A content-addressed store of the articles, figures and per-figure results shared by every query"""
+from contextlib import closing, suppress
+from hashlib import sha256
+from json import dumps, loads
+from os import PathLike, getenv, link, replace
+from pathlib import Path
+from shutil import copyfile
+from sqlite3 import Connection, connect
+from time import time
+from typing import Any
+from uuid import uuid4
+
+
+__all__ = ["ContentStore"]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+	article_id TEXT PRIMARY KEY,
+	url TEXT NOT NULL,
+	figures TEXT NOT NULL,
+	stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS figures (
+	image_url TEXT PRIMARY KEY,
+	sha256 TEXT NOT NULL,
+	extension TEXT NOT NULL,
+	stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS figures_sha256 ON figures (sha256);
+CREATE TABLE IF NOT EXISTS results (
+	digest TEXT NOT NULL,
+	stage TEXT NOT NULL,
+	key TEXT NOT NULL DEFAULT '',
+	result TEXT NOT NULL,
+	stored_at REAL NOT NULL,
+	PRIMARY KEY (digest, stage, key)
+);
+"""
+
+
+class ContentStore:
+	"""Keeps the articles, figure images and model results of past runs, so overlapping queries can reuse them.
+
+	Figure images are stored once by the sha256 of their content, and new runs hard link them (or copy them, across file
+	systems) into their own results directory. An SQLite index maps article ids to their scraped figure JSONs, image URLs to
+	the stored images, and (digest, stage, key) triples to the result of a pipeline stage, e.g. the subfigures found in an
+	image, or the captions an LLM separated out of a caption.
+
+	All methods block, so async code should call them through asyncio.to_thread. Each call opens its own connection, which
+	makes the store safe to use from several threads and processes at once.
+	:param directory: Where the index and the images are stored. Defaults to $EXSCLAIM_CONTENT_STORE or ~/.exsclaim/content_store.
+	"""
+	def __init__(self, directory:PathLike[str] = None):
+		if directory is None:
+			directory = getenv("EXSCLAIM_CONTENT_STORE", None) or Path.home() / ".exsclaim" / "content_store"
+		self.directory = Path(directory)
+		self.directory.mkdir(parents=True, exist_ok=True)
+		self.index = self.directory / "index.sqlite3"
+
+		with closing(self._connect()) as connection, connection:
+			connection.executescript(_SCHEMA)
+
+	@classmethod
+	def from_query(cls, search_query:dict) -> "ContentStore | None":
+		"""Creates the store selected by the query's "content_store" key (True or a directory), or by $EXSCLAIM_CONTENT_STORE.
+		:returns: The store, or None if neither selects one.
+		"""
+		config = search_query.get("content_store", None)
+		if config is False or (config is None and not getenv("EXSCLAIM_CONTENT_STORE", None)):
+			return None
+		return cls(None if config in (True, None) else config)
+
+	def _connect(self) -> Connection:
+		connection = connect(self.index, timeout=30)
+		connection.execute("PRAGMA journal_mode=WAL")
+		return connection
+
+	@staticmethod
+	def digest(data:bytes | str) -> str:
+		"""The sha256 hex digest used to address content."""
+		return sha256(data.encode("utf-8") if isinstance(data, str) else data).hexdigest()
+
+	@staticmethod
+	def file_digest(path:PathLike[str]) -> str:
+		hasher = sha256()
+		with open(path, "rb") as f:
+			for chunk in iter(lambda: f.read(1 << 20), b""):
+				hasher.update(chunk)
+		return hasher.hexdigest()
+
+	def _blob(self, digest:str, extension:str) -> Path:
+		return self.directory / "figures" / digest[:2] / f"{digest}{extension}"
+
+	# region Articles
+	def get_article(self, article_id:str) -> dict | None:
+		"""Returns the figure JSONs (keyed by figure name) scraped from an article by a previous run."""
+		with closing(self._connect()) as connection:
+			row = connection.execute("SELECT figures FROM articles WHERE article_id = ?", (article_id,)).fetchone()
+		return loads(row[0]) if row else None
+
+	def put_article(self, article_id:str, url:str, figures:dict):
+		with closing(self._connect()) as connection, connection:
+			connection.execute("INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)", (article_id, url, dumps(figures), time()))
+	# endregion
+
+	# region Figures
+	def add_figure(self, image_url:str, path:PathLike[str]) -> str:
+		"""Stores the image at path under its content hash and records that it was downloaded from image_url.
+		:returns: The sha256 of the image.
+		"""
+		path = Path(path)
+		digest = self.file_digest(path)
+		blob = self._blob(digest, path.suffix)
+		if not blob.exists():
+			blob.parent.mkdir(parents=True, exist_ok=True)
+			_link_or_copy(path, blob)
+
+		with closing(self._connect()) as connection, connection:
+			connection.execute("INSERT OR REPLACE INTO figures VALUES (?, ?, ?, ?)", (image_url, digest, path.suffix, time()))
+		return digest
+
+	def link_figure(self, image_url:str, destination:PathLike[str]) -> str | None:
+		"""Hard links (or copies) the image previously downloaded from image_url to destination.
+		:returns: The sha256 of the image, or None if it isn't in the store.
+		"""
+		with closing(self._connect()) as connection:
+			row = connection.execute("SELECT sha256, extension FROM figures WHERE image_url = ?", (image_url,)).fetchone()
+		if row is None:
+			return None
+
+		try:
+			_link_or_copy(self._blob(*row), Path(destination))
+		except OSError:
+			return None
+		return row[0]
+	# endregion
+
+	# region Results
+	def get_result(self, digest:str, stage:str, key:str = "") -> Any:
+		"""Returns the result of a pipeline stage on the content with the given digest, or None if it hasn't been stored."""
+		with closing(self._connect()) as connection:
+			row = connection.execute("SELECT result FROM results WHERE digest = ? AND stage = ? AND key = ?",
+									 (digest, stage, key)).fetchone()
+		return loads(row[0]) if row else None
+
+	def put_result(self, digest:str, stage:str, result:Any, key:str = ""):
+		with closing(self._connect()) as connection, connection:
+			connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+							   (digest, stage, key, dumps(result), time()))
+	# endregion
+
+
+def _link_or_copy(source:Path, destination:Path):
+	"""Atomically places a hard link to (or, across file systems, a copy of) source at destination."""
+	temporary = destination.with_name(f".{destination.name}.{uuid4().hex}.tmp")
+	try:
+		try:
+			link(source, temporary)
+		except OSError:
+			copyfile(source, temporary)
+		replace(temporary, destination)
+	except OSError:
+		with suppress(OSError):
+			temporary.unlink()
+		raise
@@ -0,0 +1,204 @@
+"""A persistent queue of the pipeline runs submitted through the API, drained by `exsclaim worker` processes"""
+from asyncio import to_thread
+from datetime import datetime as dt, timedelta, timezone as tz
+from enum import StrEnum
+from pathlib import Path
+from shutil import rmtree
+from sqlalchemy import Column, DateTime, Enum as SAEnum, Index, and_, or_, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Field, SQLModel, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+from uuid import UUID
+
+
+__all__ = ["JobStatus", "Job", "JobQueue"]
+
+
+class JobStatus(StrEnum):
+	QUEUED = "queued"
+	RUNNING = "running"
+	DONE = "done"
+
+
+class Job(SQLModel, table=True):
+	__tablename__ = "jobs"
+	__table_args__ = (
+		# The queued jobs, oldest first, which is the order workers claim them in
+		Index("jobs_queued_created_at", "created_at", postgresql_where=text("status = 'queued'")),
+	)
+
+	id: UUID = Field(
+		primary_key=True,
+		nullable=False,
+		description="The id of the run, which is also the id of its row in results.",
+	)
+	search_query: str = Field(
+		nullable=False,
+		description="The path to the JSON file holding the run's search query.",
+	)
+	status: JobStatus = Field(
+		default=JobStatus.QUEUED,
+		sa_column=Column(
+			SAEnum(
+				JobStatus,
+				name="job_status",
+				create_constraint=True,
+				values_callable=lambda x: [i.value for i in x]
+			),
+			server_default=text("'queued'::job_status"),
+			nullable=False,
+		),
+	)
+	cancel_requested: bool = Field(
+		default=False,
+		nullable=False,
+		description="Set to stop the run. The worker running it checks this periodically.",
+	)
+	worker: Optional[str] = Field(
+		default=None,
+		max_length=255,
+		description="The name of the worker running, or that last ran, the job.",
+	)
+	attempts: int = Field(
+		default=0,
+		nullable=False,
+	)
+	created_at: dt = Field(
+		default_factory=lambda: dt.now(tz.utc),
+		sa_column=Column(DateTime(timezone=True), server_default=text("NOW()"), nullable=False),
+	)
+	started_at: Optional[dt] = Field(
+		default=None,
+		sa_column=Column(DateTime(timezone=True), nullable=True),
+	)
+	finished_at: Optional[dt] = Field(
+		default=None,
+		sa_column=Column(DateTime(timezone=True), nullable=True),
+	)
+	heartbeat_at: Optional[dt] = Field(
+		default=None,
+		sa_column=Column(DateTime(timezone=True), nullable=True),
+		description="When the worker running the job last reported that it's alive. Once this is older than the "
+					"lease, any worker can claim the job again.",
+	)
+
+
+class JobQueue:
+	"""The operations on the jobs table. Claiming uses SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can
+	drain the queue at once without claiming the same job twice or waiting on each other's locks.
+
+	Workers hold a lease on the jobs they run, which they renew with heartbeat. A running job whose lease has expired
+	(e.g. because its worker crashed or was killed) is claimed again like a queued one.
+	:param AsyncEngine engine: The engine connected to the EXSCLAIM database.
+	:param float lease: How long (in seconds) a running job is kept by its worker without a heartbeat.
+	"""
+	def __init__(self, engine:AsyncEngine, lease:float = 120.0):
+		self.engine = engine
+		self.lease = timedelta(seconds=lease)
+
+	def _session(self) -> AsyncSession:
+		return AsyncSession(self.engine, expire_on_commit=False)
+
+	@staticmethod
+	def enqueue(session:AsyncSession, job_id:UUID, search_query:str) -> Job:
+		"""Adds a job to the session, so it's queued when the session commits (e.g. with the run's row in results)."""
+		job = Job(id=job_id, search_query=search_query)
+		session.add(job)
+		return job
+
+	async def claim(self, worker:str) -> Job | None:
+		"""Marks the oldest queued job, or running job whose lease has expired, as running on the worker and returns it.
+		Returns None if there's no such job."""
+		from ..api.models import Results, Status
+
+		while True:
+			async with self._session() as session, session.begin():
+				now = dt.now(tz.utc)
+				expired = and_(Job.status == JobStatus.RUNNING,
+							   or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < now - self.lease))
+				statement = (select(Job)
+							 .where(or_(Job.status == JobStatus.QUEUED, expired))
+							 .order_by(Job.created_at)
+							 .limit(1)
+							 .with_for_update(skip_locked=True))
+				job = (await session.exec(statement)).first()
+				if job is None:
+					return None
+
+				if job.cancel_requested:
+					# Its worker died before it could stop the job, so it's finished as killed rather than run again
+					job.status = JobStatus.DONE
+					job.finished_at = now
+					session.add(job)
+					await session.exec(update(Results).where(Results.id == job.id).values(status=Status.KILLED, end_time=now))
+					continue
+
+				job.status = JobStatus.RUNNING
+				job.worker = worker
+				job.attempts += 1
+				job.started_at = now
+				job.heartbeat_at = now
+				session.add(job)
+			return job
+
+	async def heartbeat(self, job_id:UUID) -> bool:
+		"""Renews the lease on a running job.
+		:returns: If the job has been asked to stop.
+		"""
+		async with self._session() as session, session.begin():
+			result = await session.exec(update(Job)
+										.where(Job.id == job_id)
+										.values(heartbeat_at=dt.now(tz.utc))
+										.returning(Job.cancel_requested))
+			return bool(result.scalar_one_or_none())
+
+	async def finish(self, job_id:UUID, status:StrEnum):
+		"""Marks a job as done, and records its outcome (a Status) and end time in results."""
+		from ..api.models import Results
+
+		async with self._session() as session, session.begin():
+			now = dt.now(tz.utc)
+			await session.exec(update(Job).where(Job.id == job_id).values(status=JobStatus.DONE, finished_at=now))
+			await session.exec(update(Results).where(Results.id == job_id).values(status=status, end_time=now))
+
+	async def release(self, job_id:UUID):
+		"""Puts a running job back in the queue, e.g. when its worker is shut down before it finishes."""
+		async with self._session() as session, session.begin():
+			await session.exec(update(Job).where(Job.id == job_id, Job.status == JobStatus.RUNNING)
+							   .values(status=JobStatus.QUEUED, worker=None, started_at=None, heartbeat_at=None))
+
+	async def recover(self, worker:str) -> int:
+		"""Requeues the jobs left running by a previous process with the same worker name, which must have crashed.
+		:returns: The number of requeued jobs.
+		"""
+		async with self._session() as session, session.begin():
+			result = await session.exec(update(Job).where(Job.worker == worker, Job.status == JobStatus.RUNNING)
+										.values(status=JobStatus.QUEUED, worker=None, started_at=None, heartbeat_at=None))
+		return result.rowcount
+
+	async def cancel(self, job_id:UUID) -> bool:
+		"""Cancels a job. A queued job is finished as killed right away and its results directory is removed, and a
+		running job is stopped by its worker.
+		:returns: False if there's no such job or it's already done.
+		"""
+		from ..api.models import Results, Status
+
+		async with self._session() as session, session.begin():
+			job = (await session.exec(select(Job).where(Job.id == job_id).with_for_update())).first()
+			if job is None or job.status == JobStatus.DONE:
+				return False
+
+			was_queued = job.status == JobStatus.QUEUED
+			if was_queued:
+				now = dt.now(tz.utc)
+				job.status = JobStatus.DONE
+				job.finished_at = now
+				await session.exec(update(Results).where(Results.id == job_id).values(status=Status.KILLED, end_time=now))
+			job.cancel_requested = True
+			session.add(job)
+
+		if was_queued:
+			# The directory /query created for the run, which no worker will remove since none will run it
+			await to_thread(rmtree, Path(job.search_query).parent, ignore_errors=True)
+		return True
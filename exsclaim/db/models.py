@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, ARRAY, ForeignKeyConstraint
+from sqlalchemy import Column, String, ForeignKeyConstraint, Index
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import ColumnElement
 from sqlmodel import Field, SQLModel, select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from typing import Optional
+from typing import Iterable, Optional
 from uuid import UUID
 
 
@@ -17,8 +19,28 @@ class ExsclaimSQLModel(SQLModel):
 	)
 
 	@classmethod
-	async def get_items(cls, results_id:UUID, session: AsyncSession) -> list["ExsclaimSQLModel"]:
-		statement = select(cls).where(cls.run_id == results_id)
+	def key_column(cls):
+		"""The primary key column (other than run_id) that the rows of a run are ordered and paginated by."""
+		return next(column for column in cls.__table__.primary_key.columns if column.name != "run_id")
+
+	@classmethod
+	async def get_items(cls, results_id:UUID, session: AsyncSession, after:str = None, limit:int = None,
+						where:Iterable[ColumnElement[bool]] = ()) -> list["ExsclaimSQLModel"]:
+		"""Gets the rows of a run in the order of their key, optionally only those after a key (keyset pagination).
+		Since the rows are read from the (run_id, key) primary key index, a page takes the same time no matter how deep it is.
+		:param results_id: The run the rows belong to.
+		:param session: The database session.
+		:param str after: Only rows whose key is greater than this are returned.
+		:param int limit: The maximum number of rows returned.
+		:param where: Any additional conditions the rows must satisfy.
+		"""
+		key = cls.key_column()
+		statement = select(cls).where(cls.run_id == results_id, *where)
+		if after is not None:
+			statement = statement.where(key > after)
+		statement = statement.order_by(key)
+		if limit is not None:
+			statement = statement.limit(limit)
 		results = await session.exec(statement)
 		return results.all()
 
@@ -90,6 +112,8 @@ class Figure(ExsclaimSQLModel, table=True):
 	__tablename__ = "figure"
 	__table_args__ = (
 		ForeignKeyConstraint(["run_id", "article_id"], ["results.article.run_id", "results.article.id"], ondelete="CASCADE"),
+		# Joining figures to their articles, e.g. when filtering by license
+		Index("figure_run_id_article_id", "run_id", "article_id"),
 		dict(schema="results")
 	)
 
@@ -127,6 +151,10 @@ class Subfigure(ExsclaimSQLModel, table=True):
 	__tablename__ = "subfigure"
 	__table_args__ = (
 		ForeignKeyConstraint(["run_id", "figure_id"], ["results.figure.run_id", "results.figure.id"], ondelete="CASCADE"),
+		Index("subfigure_run_id_figure_id", "run_id", "figure_id"),
+		# Pages of a single classification, in key order
+		Index("subfigure_run_id_classification_code_id", "run_id", "classification_code", "id"),
+		Index("subfigure_keywords", "keywords", postgresql_using="gin"),
 		dict(schema="results")
 	)
 
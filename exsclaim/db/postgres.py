@@ -2,20 +2,26 @@
 from .models import *
 
 from asyncpg.exceptions import FeatureNotSupportedError
+from collections import deque
 from configparser import ConfigParser, NoSectionError
-from logging import exception
+from logging import Logger, getLogger
 from os import PathLike, getenv
 from pathlib import Path
 from shutil import copy
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import insert, literal, select
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
-from typing import Any
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Iterable
 from uuid import UUID
 
 
-__all__ = ["async_engine", "modify_database_configuration", "get_database_connection_string", "Database"]
+__all__ = ["get_async_engine", "get_pool_metrics", "dispose_engines", "PoolMetrics", "modify_database_configuration",
+		   "get_database_connection_string", "clone_run", "Database"]
 
 
 def get_database_connection_string(configuration_file:PathLike[str] = None, section:str = "Postgres", password_file:PathLike[str]=None) -> str:
@@ -77,66 +83,264 @@ def modify_database_configuration(config_path:str):
 	copy(config_path, database_ini)
 
 
-async_engine = create_async_engine(
-	get_database_connection_string(),
-	echo=False,
+class PoolMetrics:
+	"""The checkout latency and saturation of a connection pool.
+	:param int pool_size: The number of connections the pool keeps open.
+	:param int max_overflow: The number of connections the pool can open beyond pool_size when they're all checked out.
+	:param int window: The number of recent checkouts the latency percentiles are computed from.
+	"""
+	def __init__(self, pool_size:int, max_overflow:int, window:int = 1_024):
+		self.pool_size = pool_size
+		self.max_overflow = max_overflow
+		self.checkouts = 0
+		self.timeouts = 0
+		self.peak_checked_out = 0
+		self.total_wait = 0.0
+		self.max_wait = 0.0
+		self._recent_waits: deque[float] = deque(maxlen=window)
+		self._lock = Lock()
+
+	@property
+	def capacity(self) -> int:
+		return self.pool_size + max(self.max_overflow, 0)
+
+	def record(self, wait:float, checked_out:int, timed_out:bool = False):
+		with self._lock:
+			if timed_out:
+				self.timeouts += 1
+			else:
+				self.checkouts += 1
+				self.total_wait += wait
+				self._recent_waits.append(wait)
+			self.max_wait = max(self.max_wait, wait)
+			self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+	def to_json(self, pool:AsyncAdaptedQueuePool) -> dict[str, Any]:
+		with self._lock:
+			waits = sorted(self._recent_waits)
+			checkouts, timeouts, total_wait, max_wait = self.checkouts, self.timeouts, self.total_wait, self.max_wait
+
+		def percentile(fraction:float) -> float | None:
+			return waits[min(int(fraction * len(waits)), len(waits) - 1)] if waits else None
+
+		checked_out = pool.checkedout()
+		return dict(
+			pool_size=self.pool_size,
+			max_overflow=self.max_overflow,
+			checked_out=checked_out,
+			idle=pool.checkedin(),
+			overflow=max(pool.overflow(), 0),
+			saturation=checked_out / self.capacity if self.capacity else None,
+			peak_checked_out=self.peak_checked_out,
+			checkouts=checkouts,
+			timeouts=timeouts,
+			checkout_seconds=dict(
+				mean=total_wait / checkouts if checkouts else None,
+				p50=percentile(0.5),
+				p95=percentile(0.95),
+				p99=percentile(0.99),
+				max=max_wait,
+			),
+		)
+
+
+class _MeteredPool(AsyncAdaptedQueuePool):
+	"""A queue pool that records how long each checkout waits for a connection in its PoolMetrics."""
+	metrics: PoolMetrics | None = None
+
+	def _do_get(self):
+		start = perf_counter()
+		try:
+			connection = super()._do_get()
+		except PoolTimeoutError:
+			if self.metrics is not None:
+				self.metrics.record(perf_counter() - start, self.checkedout(), timed_out=True)
+			raise
+		if self.metrics is not None:
+			self.metrics.record(perf_counter() - start, self.checkedout())
+		return connection
+
+	def recreate(self) -> "_MeteredPool":
+		# Disposing of the engine replaces its pool, which keeps adding to the same metrics
+		pool = super().recreate()
+		pool.metrics = self.metrics
+		return pool
+
+
+_engines: dict[str, AsyncEngine] = {}
+_engines_lock = Lock()
+
+
+def get_async_engine(url:str = None, echo:bool = None) -> AsyncEngine:
+	"""Returns the engine connected to a database, creating it the first time it's requested.
+
+	Every part of a process (e.g. the API's sessions and job queue, or a pipeline's uploads) shares the engine, and so the
+	connection pool, of each database. The pool is configured through the environment variables:
+	EXSCLAIM_DB_POOL_SIZE (default 5), EXSCLAIM_DB_MAX_OVERFLOW (default 10), EXSCLAIM_DB_POOL_TIMEOUT (seconds to wait
+	for a connection, default 30), EXSCLAIM_DB_POOL_RECYCLE (seconds before a connection is replaced, default 1800) and
+	EXSCLAIM_DB_ECHO (logs every statement if set to true).
+	:param str url: The connection string. Defaults to the one get_database_connection_string creates from the environment.
+	:param bool echo: Overrides EXSCLAIM_DB_ECHO when the engine is created.
+	"""
+	url = url or get_database_connection_string()
+	with _engines_lock:
+		if (engine := _engines.get(url)) is not None:
+			return engine
+
+		pool_size = int(getenv("EXSCLAIM_DB_POOL_SIZE", 5))
+		max_overflow = int(getenv("EXSCLAIM_DB_MAX_OVERFLOW", 10))
+		if echo is None:
+			echo = getenv("EXSCLAIM_DB_ECHO", "false").lower() in ("true", "1", "yes")
+
+		engine = create_async_engine(
+			url,
+			echo=echo,
+			poolclass=_MeteredPool,
+			pool_size=pool_size,
+			max_overflow=max_overflow,
+			pool_timeout=float(getenv("EXSCLAIM_DB_POOL_TIMEOUT", 30)),
+			pool_recycle=int(getenv("EXSCLAIM_DB_POOL_RECYCLE", 1_800)),
+		)
+		engine.pool.metrics = PoolMetrics(pool_size, max_overflow)
+		_engines[url] = engine
+		return engine
+
+
+def get_pool_metrics() -> dict[str, dict[str, Any]]:
+	"""The PoolMetrics of each engine created in this process, keyed by its connection string (without the password)."""
+	with _engines_lock:
+		engines = tuple(_engines.values())
+	return {
+		engine.url.render_as_string(hide_password=True): engine.pool.metrics.to_json(engine.pool)
+		for engine in engines
+		if getattr(engine.pool, "metrics", None) is not None
+	}
+
+
+async def dispose_engines():
+	"""Closes the connections of every engine, e.g. when the API shuts down."""
+	with _engines_lock:
+		engines = tuple(_engines.values())
+		_engines.clear()
+	for engine in engines:
+		await engine.dispose()
+
+
+_RESULT_MODELS: dict[str, type[ExsclaimSQLModel]] = dict(
+	article=Article,
+	figure=Figure,
+	subfigure=Subfigure,
+	scale=Scale,
+	scale_label=ScaleLabel,
+	subfigure_label=SubfigureLabel
 )
 
 
-class Database:
-	def __init__(self, name="exsclaim", configuration_file=None):
-		db_url = get_database_connection_string(configuration_file, name)
+def _coercer(python_type:type) -> Callable[[Any], Any]:
+	"""Converts a value from a csv row into the exact type asyncpg's binary COPY expects for a column."""
+	if python_type is bool:
+		return lambda value: value if value is None or isinstance(value, bool) else str(value).lower() in ("true", "t", "1")
+	if python_type is int:
+		return lambda value: None if value in (None, "") else int(round(float(value)))
+	if python_type is float:
+		return lambda value: None if value in (None, "") else float(value)
+	if python_type is list:
+		return lambda value: None if value is None else [str(item) for item in value]
+	if python_type is UUID:
+		return lambda value: value if value is None or isinstance(value, UUID) else UUID(str(value))
+	return lambda value: None if value is None else str(value)
 
-		self.async_engine = create_async_engine(
-			db_url,
-			echo=True,
-			future=True,
+
+async def clone_run(session:AsyncSession, source_run_id:UUID, run_id:UUID) -> dict[str, int]:
+	"""Copies every result row of one run to another run id, with an INSERT ... SELECT per table, so the rows never leave
+	the database. The copies are only committed along with the rest of the session.
+	:returns: The number of rows copied into each table.
+	"""
+	copied = {}
+	for _type, cls in _RESULT_MODELS.items():
+		table = cls.__table__
+		columns = [
+			literal(run_id, table.c.run_id.type).label("run_id") if column.name == "run_id" else column
+			for column in table.columns
+		]
+		statement = insert(table).from_select(
+			[column.name for column in table.columns],
+			select(*columns).where(table.c.run_id == source_run_id)
 		)
+		copied[_type] = (await session.exec(statement)).rowcount
+	return copied
+
+
+class Database:
+	def __init__(self, name="exsclaim", configuration_file=None, echo:bool = None):
+		db_url = get_database_connection_string(configuration_file, name)
+		# Every Database connected to the same server shares its engine and connection pool
+		self.async_engine = get_async_engine(db_url, echo=echo)
 
 	async def ensure_connection(self):
 		async with self.async_engine.connect() as connection:
 			print(f"Connection successful.")
 
-	async def upload(self, csv_info: dict[str, list[Any]], run_id:UUID):
-		cls_mapping = dict(
-			article=Article,
-			figure=Figure,
-			subfigure=Subfigure,
-			scale=Scale,
-			scale_label=ScaleLabel,
-			subfigure_label=SubfigureLabel
-		)
+	async def upload(self, csv_info: dict[str, Iterable[list[Any]]], run_id:UUID, logger:Logger = None) -> dict[str, int]:
+		"""Uploads the rows of each results table. Kept for existing callers, the rows are loaded with bulk_upload."""
+		return await self.bulk_upload(csv_info, run_id, logger=logger)
 
-		async with AsyncSession(self.async_engine) as session:
-			for _type, cls in cls_mapping.items():
-				rows = csv_info[_type]
-				# Converts each of the objects from JSON form into their respective SQLModel classes, dynamically mapping each attribute to the given value
-				objects = (
-					cls(run_id=run_id, **dict(zip(tuple(cls.model_fields.keys())[1:], row)))
-					for row in rows
+	async def bulk_upload(self, csv_info: dict[str, Iterable[list[Any]]], run_id:UUID, logger:Logger = None) -> dict[str, int]:
+		"""Streams the rows of each results table into Postgres with COPY, which is much faster than adding them through the ORM for large runs.
+
+		Each table is loaded in its own transaction: the rows are copied into a temporary staging table, then upserted
+		into the results table, so rows that are already stored (e.g. from an earlier, partial upload of the same run) are
+		updated with the new values instead of aborting the upload.
+		:param dict csv_info: The rows of each table, in the column order of its model (without run_id), e.g. from
+			Pipeline.iter_table_rows. Each table's rows are consumed as they're copied, so they can be generated lazily.
+		:param UUID run_id: The run the rows belong to.
+		:param logging.Logger logger: Where the number of rows and rows per second of each table are reported.
+		:returns: The number of rows inserted or updated in each table.
+		:raises asyncpg.exceptions.PostgresError: If a table can't be loaded. Tables loaded before it stay committed.
+		"""
+		logger = logger or getLogger(__name__)
+		run_id = run_id if isinstance(run_id, UUID) else UUID(str(run_id))
+		inserted = {}
+
+		async with self.async_engine.connect() as connection:
+			raw_connection = await connection.get_raw_connection()
+			driver_connection = raw_connection.driver_connection
+
+			for _type, cls in _RESULT_MODELS.items():
+				table = cls.__table__
+				columns = tuple(cls.model_fields.keys())
+				coercers = tuple(_coercer(table.columns[column].type.python_type) for column in columns[1:])
+				records = (
+					(run_id, *(coerce(value) for coerce, value in zip(coercers, row)))
+					for row in csv_info.get(_type, ())
 				)
 
-				async with session.begin():
-					try:
-						session.add_all(objects)
-						await session.commit()
-					except IntegrityError as e:
-						if "duplicate key value" in str(e):
-							exception("Attempted to add duplicate primary keys to the database.")
-							await session.rollback()
-							continue
-						else:
-							exception(f"SQLAlchemy error found when uploading the results.")
-							await session.rollback()
-							break
-					except SQLAlchemyError:
-						exception(f"SQLAlchemy error found when uploading the results.")
-						await session.rollback()
-						break
-					except BaseException:
-						exception(f"Non-SQLAlchemy error found when uploading the results.")
-						await session.rollback()
-						break
+				staging = f"staging_{table.name}"
+				column_list = ", ".join(f'"{column}"' for column in columns)
+				key_list = ", ".join(f'"{column.name}"' for column in table.primary_key.columns)
+				updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in columns
+									if column not in table.primary_key.columns)
+				start = perf_counter()
+				async with driver_connection.transaction():
+					await driver_connection.execute(
+						f'CREATE TEMPORARY TABLE "{staging}" (LIKE "{table.schema}"."{table.name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+					)
+					copied = await driver_connection.copy_records_to_table(staging, records=records, columns=columns)
+					# A row can only be upserted once per statement, so only one row of each key is taken from the staging table
+					status = await driver_connection.execute(
+						f'INSERT INTO "{table.schema}"."{table.name}" ({column_list}) '
+						f'SELECT DISTINCT ON ({key_list}) {column_list} FROM "{staging}" ORDER BY {key_list} '
+						f'ON CONFLICT ({key_list}) DO {f"UPDATE SET {updates}" if updates else "NOTHING"}'
+					)
+				elapsed = perf_counter() - start
+
+				# The statuses are "COPY <rows>" and "INSERT 0 <rows>"
+				copied = int(copied.split()[-1])
+				inserted[_type] = int(status.split()[-1])
+				logger.info(f"Uploaded {inserted[_type]:,} of {copied:,} {table.name} rows in {elapsed:.2f}s "
+							f"({copied / elapsed if elapsed else 0:,.0f} rows/s).")
+
+		return inserted
 
 	async def initialize_database(self, ignore_uuid7: bool = True):
 		from sqlalchemy.schema import CreateSchema
@@ -157,6 +361,14 @@ class Database:
 			await conn.execute(CreateSchema("results", if_not_exists=True))
 			await conn.run_sync(SQLModel.metadata.create_all, checkfirst=True)
 
+			# create_all skips the indexes of tables that already exist, so indexes added since they were created are made here
+			def create_indexes(sync_connection):
+				for model in (*_RESULT_MODELS.values(), Results):
+					for index in model.__table__.indexes:
+						index.create(sync_connection, checkfirst=True)
+
+			await conn.run_sync(create_indexes)
+
 		classification_codes = (
 			ClassificationCodes(code="MC", name="microscopy"),
 			ClassificationCodes(code="DF", name="diffraction"),
@@ -29,6 +29,7 @@ class FigureSeparator(ExsclaimTool):
 	Parameters:
 	None
 	"""
+	stage = "figures"
 
 	def __init__(self, search_query:dict, **kwargs):
 		kwargs.setdefault("logger_name", __name__ + ".FigureSeparator")
@@ -138,17 +139,20 @@ class FigureSeparator(ExsclaimTool):
 			if value["figure_name"] not in separated
 		)
 
+		self._report_progress(total=len(figures))
 		for counter, _path in enumerate(figures, start=counter):
 			self.display_info(f">>> ({counter:,} of {+len(figures):,}) Extracting images from: {_path}")
 
 			try:
-				figure_json = self.extract_image_objects(_path.name)
+				figure_json = self._extract_or_reuse_image_objects(_path)
 				new_separated.add(_path.name)
 				exsclaim_dict = self._update_exsclaim(exsclaim_dict, figure_json)
 			except Exception as e:
 				self.display_exception(e, _path)
 				raise e
 
+			self._report_progress(1)
+
 			# Save to file every N iterations (to accommodate restart scenarios)
 			if counter % 1_000 == 0:
 				self._appendJSON(exsclaim_dict, data=new_separated, filename=append_file)
@@ -251,6 +255,38 @@ class FigureSeparator(ExsclaimTool):
 		)
 		return scale_bar_info
 
+	def _extract_or_reuse_image_objects(self, figure_path:Path) -> dict:
+		"""Runs extract_image_objects, unless another query already separated an identical image into subfigures.
+		In that case, the stored subfigures are cropped out of the image again instead of running the models.
+		"""
+		if self.content_store is None:
+			return self.extract_image_objects(figure_path.name)
+
+		digest = self.content_store.file_digest(figure_path)
+		stored = self.content_store.get_result(digest, "separator")
+		if stored is not None:
+			self.save_subfigures(figure_path, stored["master_images"])
+			return dict(figure_name=figure_path.name, **stored)
+
+		figure_json = self.extract_image_objects(figure_path.name)
+		self.content_store.put_result(digest, "separator", dict(master_images=figure_json["master_images"]))
+		return figure_json
+
+	def save_subfigures(self, figure_path:Path, master_images:list[dict]):
+		"""Crops the subfigures described by master_images out of the figure, as extract_image_objects does."""
+		img = cv2.imread(str(figure_path), cv2.IMREAD_COLOR)
+		figure_base_name = figure_path.stem
+
+		for master_image in master_images:
+			geometry = master_image["geometry"]
+			x1, y1 = geometry[0]["x"], geometry[0]["y"]
+			x2, y2 = geometry[3]["x"], geometry[3]["y"]
+			label = master_image["subfigure_label"]["text"]
+
+			subfigure_directory = self.results_directory / "images" / figure_base_name / label
+			subfigure_directory.mkdir(parents=True, exist_ok=True)
+			cv2.imwrite(str(subfigure_directory / f"{figure_base_name}_{label}.png"), img[y1:y2, x1:x2])
+
 	def determine_scale(self, figure_path:Path, figure_json:dict[str, Any]) -> dict[str, Any]:
 		"""Adds scale information to figure by reading and measuring scale bars
 
@@ -13,6 +13,7 @@ from torchvision import transforms
 from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
 
 from . import utils
+from ...utilities import write_digest
 from .dataset import ScaleBarDataset
 from .engine import evaluate, train_one_epoch, get_epoch
 
@@ -139,6 +140,7 @@ def train_object_detector(train_status):
         evaluate(model, data_loader_test, device=device, model_name=model_name)
 
         if epoch % 1 == 0:
+            checkpoint = checkpoints / f"scale_bar_model_{train_status}-{epoch}.pt"
             torch.save(
                 {
                     "epoch": epoch,
@@ -146,8 +148,10 @@ def train_object_detector(train_status):
                     "optimizer_state_dict": optimizer.state_dict(),
                     # 'lr_state_dict': lr_scheduler.state_dict()
                 },
-                checkpoints / f"scale_bar_model_{train_status}-{epoch}.pt",
+                checkpoint,
             )
+            # The API serves checkpoints with the digest in this sidecar file
+            write_digest(checkpoint)
 
 
 def run():
@@ -7,6 +7,7 @@ from pytorch_model_summary import summary
 from torch import nn, optim
 from torchvision import transforms
 
+from ...utilities import write_digest
 from ..models.crnn import CRNN
 from .ctc import ctcBeamSearch
 from .dataset import ScaleLabelDataset
@@ -117,6 +118,7 @@ def train_one_epoch(
         )
     # save checkpoint
     if epoch % save_every == 0:
+        checkpoint = checkpoint_directory / (model_name + "-{}.pt".format(epoch))
         torch.save(
             {
                 "epoch": epoch,
@@ -125,8 +127,10 @@ def train_one_epoch(
                 "lr_state_dict": lr_scheduler.state_dict(),
                 "best_loss": best_loss,
             },
-            checkpoint_directory / (model_name + "-{}.pt".format(epoch)),
+            checkpoint,
         )
+        # The API serves checkpoints with the digest in this sidecar file
+        write_digest(checkpoint)
     return best_loss
 
 
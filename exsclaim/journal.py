@@ -1,9 +1,11 @@
 from .exceptions import JournalScrapeError
-from .utilities import paths
+from .utilities import paths, create_client_session, HTTPCache, PolitenessScheduler, WebDriverPool, WebDriverPools
 
-from aiohttp import ClientSession, ClientResponseError
+from aiohttp import ClientSession
 from abc import ABC, abstractmethod, ABCMeta
-from bs4 import BeautifulSoup, ResultSet, Tag
+from asyncio import FIRST_COMPLETED, Lock, Queue, Semaphore, create_task, gather, to_thread, wait
+from bs4 import BeautifulSoup, ResultSet, SoupStrainer, Tag
+from contextlib import AsyncExitStack, aclosing
 from datetime import datetime
 from itertools import product
 from json import loads
@@ -13,17 +15,34 @@ from os import getenv
 from pathlib import Path
 from random import random, randint
 from re import compile, search, sub, match
-from selenium import webdriver
 from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.by import By
-from selenium_stealth import stealth
-from time import sleep
-from typing import Literal, Type
+from typing import AsyncIterator, Iterable, Literal, Type
 
 
 __all__ = ["JournalFamily", "JournalFamilyStatic", "JournalFamilyDynamic", "ACS", "Nature", "RSC", "Wiley", "COMPATIBLE_JOURNALS"]
 
 
+_PARSER = "lxml"
+
+_BROWSER_HEADERS = {
+	"Accept": 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+	"Accept-encoding": 'gzip, deflate, br, zstd',
+	"Accept-language": 'en-US,en;q=0.8',
+	"Priority": 'u=0, i',
+	"Sec-Ch-Ua": '"Brave";v="137", "Chromium";v="137", "Not/A)Brand";v="24"',
+	"Sec-Ch-Ua-Mobile": '?0',
+	"Sec-Ch-Ua-Platform": '"Linux"',
+	"Sec-Fetch-Dest": 'document',
+	"Sec-Fetch-Mode": 'navigate',
+	"Sec-Fetch-Site": 'none',
+	"Sec-Fetch-User": '?1',
+	"Sec-Gpc": '1',
+	"Upgrade-Insecure-Requests": '1',
+	"User-Agent": 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36',
+}
+
+
 class JournalMeta(ABCMeta):
 	subclasses:dict[str, Type] = dict()
 
@@ -187,6 +206,42 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 	def extra_key(self) -> str:
 		return self._extra_key
 
+	# The names of the tags (along with their descendants) kept when parsing article and search result pages.
+	# None keeps the whole page, while restricting it lets a family skip building the parts of the tree it never reads.
+	_article_tags: tuple[str, ...] | None = None
+	_search_tags: tuple[str, ...] | None = None
+
+	@classmethod
+	def parse(cls, markup:str | bytes, page:Literal["article", "search"] = None) -> BeautifulSoup:
+		"""Parses a page with lxml, keeping only the tags the family needs for the given kind of page.
+		:param markup: The HTML of the page.
+		:param str page: Either "article" or "search", or None to parse the whole page.
+		:rtype: bs4.BeautifulSoup
+		"""
+		tags = {"article": cls._article_tags, "search": cls._search_tags}.get(page, None)
+		return BeautifulSoup(markup, _PARSER, parse_only=SoupStrainer(list(tags)) if tags else None)
+
+	def has_extra_key(self, figure:Tag) -> bool:
+		"""Checks if the extra_key appears anywhere in the figure's HTML, as searching str(figure) did.
+		The attributes of the figure and its descendants are checked first, which finds the keys the families use without
+		serializing the whole subtree. A key made of several classes (e.g. "inline-fig internalNav") matches them in any
+		order. Only when no attribute matches is the figure serialized, so keys in its text or tags are still found.
+		A blank extra_key matches every figure.
+		"""
+		extra_key = self.extra_key
+		if not extra_key or extra_key.isspace():
+			return True
+
+		key_tokens = set(extra_key.split())
+		for tag in (figure, *figure.find_all(True)):
+			for value in tag.attrs.values():
+				if isinstance(value, list):
+					if key_tokens.issubset(value) or extra_key in " ".join(value):
+						return True
+				elif extra_key in value:
+					return True
+		return extra_key in str(figure)
+
 	def __init__(self, search_query: dict, **kwargs):
 		"""Creates an instance of a journal family search using a query
 		Args:
@@ -215,12 +270,50 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 		self.articles_visited = articles_visited
 		self.include_hidden_figures = kwargs.get("include_hidden_figures", False)
 
+		# A session shared by the whole run can be passed in, otherwise one is created (and closed) by this instance
+		self.session: ClientSession | None = kwargs.get("session", None)
+		self._owns_session = False
+		# Likewise, a scheduler shared by the run keeps every instance's requests to a journal within the same pacing
+		self.scheduler: PolitenessScheduler | None = kwargs.get("scheduler", None)
+		self.http_cache: HTTPCache | None = kwargs.get("http_cache", None)
+		# Article pages that were already fetched while searching (e.g. to check their license), keyed by URL.
+		# Sharing it across the run lets get_article_figures reuse them instead of requesting the page again.
+		self.article_cache: dict[str, BeautifulSoup] = kwargs.get("article_cache", {})
+		# A content store shared between queries, which figures are linked from instead of being downloaded again
+		self.content_store = kwargs.get("content_store", None)
+
 	async def __aenter__(self):
 		return self
 
 	async def __aexit__(self, exc_type, exc_val, exc_tb):
 		await self.close()
 
+	def _get_session(self) -> ClientSession:
+		"""Returns the shared session, creating one owned by this instance if none was provided."""
+		if self.session is None or self.session.closed:
+			self.session = create_client_session(**self.search_query.get("connections", {}))
+			self._owns_session = True
+		return self.session
+
+	def _get_scheduler(self) -> PolitenessScheduler:
+		"""Returns the shared politeness scheduler, creating one for this instance if none was provided."""
+		if self.scheduler is None:
+			self.scheduler = PolitenessScheduler(**self.search_query.get("politeness", {}))
+		return self.scheduler
+
+	def _get_http_cache(self) -> HTTPCache:
+		"""Returns the shared HTTP cache, creating one from the query's "http_cache" settings if none was provided."""
+		if self.http_cache is None:
+			self.http_cache = HTTPCache.from_query(self.search_query)
+		return self.http_cache
+
+	async def get_article(self, url:str) -> BeautifulSoup:
+		"""Gets the soup of an article page, reusing (and releasing) it if it was already fetched during the search."""
+		soup = self.article_cache.pop(url, None)
+		if soup is None:
+			soup = await self.get(url, page="article")
+		return soup
+
 	# Helper Methods for retrieving relevant article URLS
 
 	@abstractmethod
@@ -240,7 +333,7 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 			soup of next page
 		"""
 		new_url = f"{url}&{self.page_param}{page_number}"
-		return await self.get(new_url)
+		return await self.get(new_url, page="search")
 
 	@abstractmethod
 	async def get_additional_url_arguments(self, soup: BeautifulSoup) -> tuple[list[str], set[str], list[str]]:
@@ -297,7 +390,7 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 		Returns:
 			A list of all figures in the article as BeautifulSoup Tag objects
 		"""
-		figures = filter(lambda a: self.extra_key in str(a), soup.select("figure"))
+		figures = filter(self.has_extra_key, soup.select("figure"))
 		if not self.include_hidden_figures:
 			# FIXME: Determine if a figure is visible or not
 			figures = filter(lambda figure: figure is not None and figure.contents, figures)
@@ -333,34 +426,16 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 		# figure_list = [
 		#     a for a in soup.find_all("figure") if self.extra_key in str(a)
 		# ]
-		return tuple(filter(lambda a: self.extra_key in str(a), soup.find_all("figure")))
+		return tuple(filter(self.has_extra_key, soup.find_all("figure")))
 
 	@staticmethod
-	async def _get_image(url:str, session:ClientSession, *args, **kwargs) -> bytes:
-		headers = kwargs.get("headers", {
-			"Accept": 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-			"Accept-encoding": 'gzip, deflate, br, zstd',
-			"Accept-language": 'en-US,en;q=0.8',
-			"Priority": 'u=0, i',
-			"Sec-Ch-Ua": '"Brave";v="137", "Chromium";v="137", "Not/A)Brand";v="24"',
-			"Sec-Ch-Ua-Mobile": '?0',
-			"Sec-Ch-Ua-Platform": '"Linux"',
-			"Sec-Fetch-Dest": 'document',
-			"Sec-Fetch-Mode": 'navigate',
-			"Sec-Fetch-Site": 'none',
-			"Sec-Fetch-User": '?1',
-			"Sec-Gpc": '1',
-			"Upgrade-Insecure-Requests": '1',
-			"User-Agent": 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36',
-		})
-
-		async with session.get(url, headers=headers) as response:
-			try:
-				response.raise_for_status()
-			except ClientResponseError as e:
-				raise JournalScrapeError(e.message, e.status, e.headers) from e
-
-			return await response.content.read()
+	async def _download_image(url:str, session:ClientSession, destination:Path, *args, cache:HTTPCache = None, throttle=None,
+							  chunk_size:int = 1 << 16, **kwargs) -> Path:
+		"""Streams the image at url to destination in chunks, so that large images are never held in memory."""
+		headers = kwargs.get("headers", _BROWSER_HEADERS)
+		if cache is None:
+			cache = HTTPCache(enabled=False)
+		return await cache.download(session, url, destination, headers, throttle, chunk_size)
 
 	async def save_figure(self, figure_name: str, image_url: str) -> Path:
 		"""
@@ -370,18 +445,44 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 			image_url: url to image
 		"""
 		out_file = self.results_directory / "figures" / figure_name
-		response = await self.get_image_source(image_url)
-		# urlretrieve(image_url, out_file)
-		with open(out_file, 'wb') as f:
-			f.write(response)
+		if self.content_store is not None and await to_thread(self.content_store.link_figure, image_url, out_file):
+			return out_file
+
+		# The image is written to a temporary file that is only renamed to out_file once complete
+		await self._download_image(image_url, self._get_session(), out_file, cache=self._get_http_cache(),
+								   throttle=self._get_scheduler().slot)
+		if self.content_store is not None:
+			await to_thread(self.content_store.add_figure, image_url, out_file)
 		return out_file
 
+	async def save_figures(self, figures:Iterable[tuple[str, str]]):
+		"""Saves several figures at once, up to the query's "figure_downloads" (default 4) at a time.
+		:param figures: The (figure_name, image_url) pairs of the figures.
+		"""
+		semaphore = Semaphore(max(int(self.search_query.get("figure_downloads", 4)), 1))
+
+		async def download(figure_name:str, image_url:str):
+			async with semaphore:
+				try:
+					await self.save_figure(figure_name, image_url)
+				except JournalScrapeError as e:
+					self.logger.error(f"Could not download figure \"{figure_name}\" from {image_url} (HTTP Status Code: {e.status}). Reason: {e.message}")
+
+		await gather(*(download(figure_name, image_url) for figure_name, image_url in figures))
+
 	async def get_search_query_urls(self) -> tuple[str]:
 		"""Create list of search query urls based on input query json
 
 		Returns:
 			A list of urls (as strings)
 		"""
+		return tuple([search_url async for search_url in self.iter_search_query_urls()])
+
+	async def iter_search_query_urls(self) -> AsyncIterator[str]:
+		"""Lazily yields the search query urls based on the input query json.
+		The request needed to expand a combination of search terms is only made once the previous urls have been consumed,
+		so no further searches are made after the caller stops iterating.
+		"""
 		search_query = self.search_query
 		# creates a list of search terms
 		try:
@@ -392,10 +493,8 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 		except TypeError as e:
 			self.logger.exception(f"{search_query=}")
 			raise e
-		search_product = list(product(*search_list))
 
-		search_urls = []
-		for term in search_product:
+		for term in product(*search_list):
 			url_parameters = "&".join(
 				[self.term_param + self.join.join(term), self.max_page_size]
 			)
@@ -403,7 +502,7 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 			if self.open:
 				search_url += f"&{self.open_param}&"
 
-			soup = await self.get(search_url)
+			soup = await self.get(search_url, page="search")
 
 			years, journal_codes, orderings = await self.get_additional_url_arguments(soup)
 			search_url_args = []
@@ -420,16 +519,19 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 								]
 						)
 						search_url_args.append(args)
-			search_term_urls = [search_url + url_args for url_args in search_url_args]
-			search_urls += search_term_urls
-		# search_urls += 'https://www.nature.com/search?q=electrochromic%20polymer&date_range=&journal=&order=relevance&author=reynolds'
-		# TODO: URL Encode the search query urls
-		return tuple(map(lambda url: url.replace(" ", "%20"), search_urls))
+			# search_urls += 'https://www.nature.com/search?q=electrochromic%20polymer&date_range=&journal=&order=relevance&author=reynolds'
+			# TODO: URL Encode the search query urls
+			for url_args in search_url_args:
+				yield (search_url + url_args).replace(" ", "%20")
 
 	async def get_articles_from_search_url(self, search_url: str) -> set:
-		"""Generates a list of articles from a single search term"""
+		"""Generates a list of articles from a single search term.
+		Once the first page gives the number of result pages, up to the query's "search_prefetch" (default 4) of the
+		remaining pages are requested at once and parsed in whichever order they arrive. Outstanding requests are
+		cancelled as soon as "maximum_scraped" article paths have been found.
+		"""
 		max_scraped = self.search_query["maximum_scraped"]
-		soup = await self.get(search_url)
+		soup = await self.get(search_url, page="search")
 
 		article_paths = set()
 
@@ -441,37 +543,121 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 				return article_paths
 			raise e
 
-		for page_number in range(start_page, stop_page + 1):
-			for article in soup.select("article.u-full-height.c-card.c-card--flush"):
-				tag = article.select_one("a[href]").attrs["href"]
-				url = tag.split('?page=search')[0]
-
-				if url.split("/")[-1] in self.articles_visited or (
-						self.open and not (await self.is_link_to_open_article(tag))
-				):
-					# It is an article but we are not interested
-					continue
+		async for url in self.get_articles_from_results(soup):
+			article_paths.add(url)
+			if len(article_paths) >= max_scraped:
+				return article_paths
 
-				article_paths.add(url)
-				if len(article_paths) >= max_scraped:
-					return article_paths
-			# Get next page at end of loop since page 1 is obtained from
-			# search_url
-			await self.turn_page(search_url, page_number + 1)
+		# Page start_page is obtained from the search_url, so only the pages after it are requested
+		page_numbers = iter(range(start_page + 1, stop_page + 1))
+		prefetch = max(int(self.search_query.get("search_prefetch", 4)), 1)
+		pending = set()
+
+		def request_more_pages():
+			while len(pending) < prefetch and (page_number := next(page_numbers, None)) is not None:
+				pending.add(create_task(self._get_results_page(search_url, page_number)))
+
+		request_more_pages()
+		try:
+			while pending:
+				done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+				for task in done:
+					try:
+						soup = task.result()
+					except JournalScrapeError as e:
+						self.logger.error(f"Could not get a page of search results for {search_url} (HTTP Status Code: {e.status}). Reason: \"{e.message}\".")
+						continue
+
+					async for url in self.get_articles_from_results(soup):
+						article_paths.add(url)
+						if len(article_paths) >= max_scraped:
+							return article_paths
+				request_more_pages()
+		finally:
+			for task in pending:
+				task.cancel()
+			await gather(*pending, return_exceptions=True)
 
 		return article_paths
 
+	async def _get_results_page(self, search_url:str, page_number:int) -> BeautifulSoup:
+		"""Gets a page of search results through turn_page, which may return either the page's soup or its URL."""
+		page = await self.turn_page(search_url, page_number)
+		if isinstance(page, str):
+			page = await self.get(page, page="search")
+		return page
+
+	async def get_articles_from_results(self, soup:BeautifulSoup) -> AsyncIterator[str]:
+		"""Yields the path of every article on a page of search results that hasn't been visited and (if required) is open access."""
+		for article in soup.select("article.u-full-height.c-card.c-card--flush"):
+			tag = article.select_one("a[href]").attrs["href"]
+			url = tag.split('?page=search')[0]
+
+			# The whole card is passed, so that a family can read its access markers instead of requesting the article
+			if url.split("/")[-1] in self.articles_visited or (
+					self.open and not (await self.is_link_to_open_article(article))
+			):
+				# It is an article but we are not interested
+				continue
+
+			yield url
+
 	async def get_article_extensions(self) -> tuple:
 		"""Retrieves a list of article url paths from a search query"""
-		# This returns urls based on the combinations of desired search terms.
-		search_query_urls = self.get_search_query_urls()
+		async with aclosing(self.iter_article_extensions()) as article_paths:
+			return tuple([article_path async for article_path in article_paths])
+
+	async def iter_article_extensions(self) -> AsyncIterator[str]:
+		"""Yields article url paths from a search query as soon as the search that found them completes.
+		Up to the query's "search_concurrency" (default 2) search urls are scraped at once. No new searches are started
+		once "maximum_scraped" paths have been yielded, and the ones still running are cancelled.
+		"""
+		max_scraped = self.search_query["maximum_scraped"]
+		concurrency = max(int(self.search_query.get("search_concurrency", 2)), 1)
+		# An async generator can't be advanced by two tasks at once
+		search_urls, search_urls_lock = self.iter_search_query_urls(), Lock()
+		results = Queue()
+		finished = object()
+
+		async def worker():
+			try:
+				while True:
+					async with search_urls_lock:
+						search_url = await anext(search_urls, None)
+					if search_url is None:
+						break
+
+					try:
+						results.put_nowait(await self.get_articles_from_search_url(search_url))
+					except JournalScrapeError as e:
+						self.logger.error(f"Could not scrape the search results of {search_url} (HTTP Status Code: {e.status}). Reason: \"{e.message}\".")
+			except Exception as e:
+				results.put_nowait(e)
+			finally:
+				results.put_nowait(finished)
+
+		workers = [create_task(worker()) for _ in range(concurrency)]
 		article_paths = set()
-		for search_url in await search_query_urls:
-			new_article_paths = await self.get_articles_from_search_url(search_url)
-			article_paths.update(new_article_paths)
-			if len(article_paths) >= self.search_query["maximum_scraped"]:
-				break
-		return tuple(article_paths)
+		running = len(workers)
+		try:
+			while running:
+				result = await results.get()
+				if result is finished:
+					running -= 1
+					continue
+				if isinstance(result, Exception):
+					raise result
+
+				for article_path in result - article_paths:
+					article_paths.add(article_path)
+					yield article_path
+					if len(article_paths) >= max_scraped:
+						return
+		finally:
+			for task in workers:
+				task.cancel()
+			await gather(*workers, return_exceptions=True)
+			await search_urls.aclose()
 
 	@staticmethod
 	def _get_figure_name(article_name:str, figure_idx:int, extension:str = "jpg") -> str:
@@ -511,7 +697,7 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 		:returns: A dictionary of figure_jsons from an article
 		"""
 		try:
-			soup = await self.get(url)
+			soup = await self.get_article(url)
 		except JournalScrapeError as e:
 			self.logger.error(f"Could not scrape {url} (HTTP Status Code: {e.status}). Reason: \"{e.message}\".")
 			return dict()
@@ -530,6 +716,7 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 
 		self.logger.info(f"Number of subfigures: {len(figure_subtrees):,}.")
 		article_json = {}
+		downloads = []
 
 		for figure_number, figure_subtree in enumerate(figure_subtrees, start=1):
 			captions = self.find_captions(figure_subtree)
@@ -568,19 +755,18 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 			)
 
 			article_json[figure_name] = figure_json
+			downloads.append((figure_name, image_url))
 
-			# save figure as image
-			try:
-				await self.save_figure(figure_name, image_url)
-			except JournalScrapeError as e:
-				self.logger.error(f"Could not download figure \"{figure_name}\" from {image_url} (HTTP Status Code: {e.status}). Reason: {e.message}")
-
+		# save the figures as images, several at a time
+		await self.save_figures(downloads)
 		return article_json
 
 	# region HTTP methods defined by JournalFamilyDynamic and JournalFamilyStatic
 	@abstractmethod
 	async def close(self):
-		...
+		"""Closes the session if this instance created it. A shared session is left open for its owner to close."""
+		if self._owns_session and self.session is not None:
+			await self.session.close()
 
 	@abstractmethod
 	async def get(self, url: str) -> BeautifulSoup:
@@ -591,20 +777,16 @@ class JournalFamily(ABC, metaclass=JournalMeta):
 		:raises: exsclaim.exceptions.JournalScrapeError: If an error occurs while making the request.
 		"""
 		self.logger.info(f"GET request: {url}")
-
-	@abstractmethod
-	async def get_image_source(self, url: str, **kwargs) -> bytes:
-		...
 	# endregion
 
 
 class JournalFamilyStatic(JournalFamily, ABC):
 	def __init__(self, search_query:dict, **kwargs):
 		super().__init__(search_query, **kwargs)
-		self.session = ClientSession()
+		self._get_session()
 
 	async def close(self):
-		await self.session.close()
+		await super().close()
 
 	async def get(self, url: str, *args, **kwargs) -> BeautifulSoup:
 		await super().get(url)
@@ -626,16 +808,9 @@ class JournalFamilyStatic(JournalFamily, ABC):
 		})
 
 		proxy_url = getenv("http_proxy", "http://172.17.0.1:8080")
-		async with self.session.get(url, headers=headers) as response:
-			try:
-				response.raise_for_status()
-			except ClientResponseError as e:
-				raise JournalScrapeError(e.message, e.status, e.headers) from e
-
-			return BeautifulSoup(await response.text(), "html.parser")
-
-	async def get_image_source(self, url: str, *args, **kwargs) -> bytes:
-		return await self._get_image(url, self.session, *args, **kwargs)
+		# Only requests that miss the cache (or need revalidating) take a slot from the scheduler
+		body = await self._get_http_cache().fetch(self._get_session(), url, headers, self._get_scheduler().slot)
+		return self.parse(body, kwargs.get("page", None))
 
 
 class JournalFamilyDynamic(JournalFamily, ABC):
@@ -643,6 +818,9 @@ class JournalFamilyDynamic(JournalFamily, ABC):
 		"""creates an instance of a journal family search using a query
 		Args:
 			search_query: a query json (python dictionary)
+		Keyword Args:
+			driver_pools: The WebDriverPools shared by the run, from which the pool of this family's browser is taken. If
+				they aren't given, a single driver pool is created for this instance.
 		"""
 		super().__init__(search_query, **kwargs)
 		browsers = [chrome, firefox]
@@ -653,57 +831,43 @@ class JournalFamilyDynamic(JournalFamily, ABC):
 		elif sum(browsers) != 1:
 			raise ValueError("Multiple browsers were selected to be used, whereas only one should be selected.")
 
-		if browsers[0]:
-			self._initialize_chrome()
-		elif browsers[1]:
-			self._initialize_firefox()
-
-		stealth(self.driver,
-				languages=["en-US", "en"],
-				vendor="Google Inc.",
-				platform="Win32",
-				webgl_vendor="Intel Inc.",
-				renderer="Intel Iris OpenGL Engine",
-				fix_hairline=True)
+		self._browser = "chrome" if browsers[0] else "firefox"
+		driver_pools: WebDriverPools | None = kwargs.get("driver_pools", None)
+		self.driver_pool: WebDriverPool | None = driver_pools.get(self._browser) if driver_pools is not None else None
+		self._owns_driver_pool = False
 
-	@property
-	def driver(self):
-		return self._driver
+	def _get_driver_pool(self) -> WebDriverPool:
+		"""Returns the shared pool of this family's browser, creating one owned by this instance if none was provided."""
+		if self.driver_pool is None:
+			self.driver_pool = WebDriverPool(size=1, browser=self._browser, logger=self.logger)
+			self._owns_driver_pool = True
+		return self.driver_pool
 
 	async def close(self):
-		if hasattr(self, "_driver"):
-			self._driver.quit()
-
-	def _initialize_chrome(self):
-		from selenium.webdriver.chrome.options import Options
-		# from selenium.webdriver.chrome.service import Service
-
-		options = Options()
-		options.add_argument("--headless")
-		# options.add_argument("--user-data-dir=/tmp/chrome-data")
-		options.add_argument("--no-sandbox")
-		# options.add_argument("--disable-dev-shm-usage")
-		# options.add_argument("--remote-debugging-port=9222")
-		self._driver = webdriver.Chrome(options=options)
-
-	def _initialize_firefox(self):
-		from selenium.webdriver import FirefoxOptions
-
-		options = FirefoxOptions()
-		options.add_argument("-headless")
-		# options.binary_location = ""
-		from pathlib import Path
-		# path = Path("/usr/local/bin/geckodriver")
-		path = Path(__file__).parent.parent / "selenium" / "geckodriver"
-		path = path.resolve()
-		print(f"Path exists: {path.exists()}!")
-		self._driver = webdriver.Firefox(options=options)
-
-	def goto(self, url: str, *args, **kwargs):
+		if self._owns_driver_pool and self.driver_pool is not None:
+			await self.driver_pool.close()
+		await super().close()
+
+	@staticmethod
+	def get_delay(*args, **kwargs) -> float:
+		"""The extra delay (in seconds) requested before loading a page through the wait, random_sleep_bounds or random_sleep keyword arguments."""
 		wait: float | None = kwargs.get("wait", None)
 		random_sleep_bounds: tuple[int, int] | None = kwargs.get("random_sleep_bounds", None)
 		random_sleep: bool | None = kwargs.get("random_sleep", None)
 
+		# TODO: Warn that wait will have priority over random_sleep_bounds, and random_sleep_bounds will have priority over random_sleep
+		if wait is not None:
+			return wait
+		elif random_sleep_bounds is not None:
+			return randint(*random_sleep_bounds)
+		elif random_sleep:
+			return random() * 6
+		return 0.0
+
+	def goto(self, driver, url: str, *args, **kwargs):
+		"""Loads the url in the given driver. This blocks, so it should be run through WebDriverPool.run.
+		Any delay before the page load is handled by the politeness scheduler in get, so that the event loop isn't blocked.
+		"""
 		if kwargs.get("use_default_headers", True):
 			headers = {
 				"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
@@ -712,33 +876,25 @@ class JournalFamilyDynamic(JournalFamily, ABC):
 				"User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:82.0) Gecko/20100101 Firefox/82.0"
 			}
 
-		# TODO: Warn that wait will have priority over random_sleep_bounds, and random_sleep_bounds will have priority over random_sleep
-
-		if wait is not None:
-			sleep(wait)
-		elif random_sleep_bounds is not None:
-			sleep(randint(*random_sleep_bounds))
-		elif random_sleep:
-			sleep(random() * 6)
-
 		try:
-			self._driver.get(url)
+			driver.get(url)
 		except WebDriverException as e:
 			raise JournalScrapeError(e.msg) from e
 
-	def get_page_source(self) -> BeautifulSoup:
-		return BeautifulSoup(self._driver.page_source, "html.parser")
+	@classmethod
+	def get_page_source(cls, driver, page:Literal["article", "search"] = None) -> BeautifulSoup:
+		return cls.parse(driver.page_source, page)
 
 	async def get(self, url: str, *args, **kwargs) -> BeautifulSoup:
 		await super().get(url)
 		# TODO: Figure out who to bypass CloudFlare
-		self.goto(url, *args, **kwargs)
-
-		return self.get_page_source()
+		pool = self._get_driver_pool()
+		# The slot is taken before a driver is checked out, so that a driver isn't held idle while waiting for its turn
+		async with self._get_scheduler().slot(url, self.get_delay(*args, **kwargs)), pool.checkout() as driver:
+			await pool.run(self.goto, driver, url, *args, **kwargs)
+			page_source = await pool.run(lambda: driver.page_source)
 
-	async def get_image_source(self, url: str, *args, **kwargs) -> bytes:
-		async with ClientSession() as session:
-			return await self._get_image(url, session, *args, **kwargs)
+		return self.parse(page_source, kwargs.get("page", None))
 
 
 # ############# JOURNAL FAMILY SPECIFIC INFORMATION ################
@@ -874,6 +1030,11 @@ class ACS(JournalFamilyDynamic):
 
 
 class Nature(JournalFamilyStatic):
+	# Article pages need the figures, the license (in a script), the title and the authors (in links)
+	_article_tags = ("figure", "meta", "title", "script", "a")
+	# Search pages need the result cards, the result count and the pagination
+	_search_tags = ("article", "li", "span", "h1", "a", "title")
+
 	def __init__(self, search_query, *args, **kwargs):
 		super().__init__(search_query, **kwargs)
 		self._domain = "https://www.nature.com"
@@ -938,7 +1099,7 @@ class Nature(JournalFamilyStatic):
 
 	async def get_authors(self, soup:str | BeautifulSoup) -> tuple[str]:
 		if isinstance(soup, str):
-			soup = await self.get(soup)
+			soup = await self.get(soup, page="article")
 		locators = soup.select("a[data-test=\"author-name\"]")
 		# author_regex = compile(r"([\w\s-]+)\s*(ORCID: orcid.org/(\d{4}-\d{4}-\d{4}-\d{5}))?")
 
@@ -1018,22 +1179,32 @@ class Nature(JournalFamilyStatic):
 		# author =
 		return years, journal_codes, orderings
 
-	async def is_link_to_open_article(self, tag:str | BeautifulSoup) -> bool:
-		if isinstance(tag, str):
-			soup = await self.get(self.domain + tag)
-			return self.get_license(soup)[0]
+	async def is_link_to_open_article(self, tag:str | Tag) -> bool:
+		"""Reads the open access marker of a search result card, which is only shown on open articles.
+		If the card can't be found (or only a link was given), the article itself is requested. An open article's soup is then
+		kept in the article cache, so that scraping it doesn't request it a second time.
+		"""
+		if isinstance(tag, Tag):
+			card = tag
+			while card is not None and not (
+					(card.name == "article" and "c-card" in card.get("class", ())) or
+					(card.name == "li" and "app-article-list-row__item" in card.get("class", ()))
+			):
+				card = card.parent
+
+			if card is not None:
+				return any(candidate.get_text().strip().startswith("Open")
+						   for candidate in card.select("span.u-color-open-access"))
 
-		current_tag = tag
-		while current_tag.parent:
-			if current_tag.name == "li" and "app-article-list-row__item" in current_tag["class"]:
-				break
-			current_tag = current_tag.parent
+			link = tag if tag.has_attr("href") else tag.select_one("a[href]")
+			tag = link.attrs["href"]
 
-		candidates = current_tag.select("span.u-color-open-access")
-		for candidate in candidates:
-			if candidate.text.startswith("Open"):
-				return True
-		return False
+		url = self.domain + tag.split('?page=search')[0]
+		soup = await self.get(url, page="article")
+		is_open = self.get_license(soup)[0]
+		if is_open:
+			self.article_cache[url] = soup
+		return is_open
 
 
 class RSC(JournalFamilyDynamic):
@@ -1095,32 +1266,38 @@ class RSC(JournalFamilyDynamic):
 	async def get_articles_from_search_url(self, search_url: str) -> set:
 		"""Generates a list of articles from a single search term"""
 		max_scraped = self.search_query["maximum_scraped"]
-		soup = await self.get(search_url)
-
-		start_page, stop_page, total_articles = await self.get_page_info(soup)
-
 		article_paths = set()
 
-		for page_number in range(start_page, stop_page + 1):
-			for tag in await soup.select("a[href]"):
-				url = tag.attrs["href"].split('?page=search')[0]
-				if url.split("/")[-1] in self.articles_visited:
-					# It is an article but we are not interested
-					continue
+		# Pagination happens through JavaScript, so the same driver has to be kept for every page of results
+		pool = self._get_driver_pool()
+		scheduler = self._get_scheduler()
+		async with AsyncExitStack() as stack:
+			# The slot is taken before the driver is checked out, so that a driver isn't held idle while waiting for its turn
+			async with scheduler.slot(search_url):
+				driver = await stack.enter_async_context(pool.checkout())
+				await pool.run(self.goto, driver, search_url)
+			soup = await pool.run(self.get_page_source, driver, "search")
 
-				if url.startswith('/doi/full/') or url.startswith('/en/content/articlehtml/'):
-					article_paths.add(url)
+			start_page, stop_page, total_articles = await self.get_page_info(soup)
 
-				if len(article_paths) >= max_scraped:
-					return article_paths
+			for page_number in range(start_page, stop_page + 1):
+				for tag in soup.select("a[href]"):
+					url = tag.attrs["href"].split('?page=search')[0]
+					if url.split("/")[-1] in self.articles_visited:
+						# It is an article but we are not interested
+						continue
+
+					if url.startswith('/doi/full/') or url.startswith('/en/content/articlehtml/'):
+						article_paths.add(url)
 
-			# Get next page at end of loop since page 1 is obtained from search_url
-			# search_url = self.turn_page(search_url, page_number + 1)
-			# try:
+					if len(article_paths) >= max_scraped:
+						return article_paths
 
-			element = self.driver.find_element(By.CSS_SELECTOR, ".paging__btn.paging__btn--next")
-			self.driver.execute_script("arguments[0].click();", element)
-			soup = self.get_page_source()
+				# Get next page at end of loop since page 1 is obtained from search_url
+				element = await pool.run(driver.find_element, By.CSS_SELECTOR, ".paging__btn.paging__btn--next")
+				async with scheduler.slot(search_url):
+					await pool.run(driver.execute_script, "arguments[0].click();", element)
+				soup = await pool.run(self.get_page_source, driver, "search")
 		return article_paths
 
 	async def turn_page(self, url, pg_size):
@@ -1218,7 +1395,7 @@ class Wiley(JournalFamilyStatic):
 
 	async def is_link_to_open_article(self, tag):
 		"""Wiley allows filtering for search. Therefore, if self.open is True, all results will be open."""
-		return super().is_link_to_open_article(tag)
+		return await super().is_link_to_open_article(tag)
 
 	def find_captions(self, figure):
 		return figure.select("div.figure__caption.figure__caption-text")
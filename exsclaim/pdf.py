@@ -16,6 +16,8 @@ __all__ = ["PDFScraper"]
 
 
 class PDFScraper(ExsclaimTool):
+	stage = "pdfs"
+
 	def __init__(self, search_query:dict, **kwargs):
 		kwargs.setdefault("logger", __name__ + ".PDFScraper")
 		super().__init__(search_query, **kwargs)
@@ -321,12 +323,15 @@ class PDFScraper(ExsclaimTool):
 			self.display_exception(e, pdf_loc)
 
 		self._end_timer(t0, f"PDFScraper: {pdf_loc}")
+		self._report_progress(1)
 
 	async def run(self, search_query: dict, exsclaim_json: dict):
 		lock = Lock()
+		pdfs = tuple(self.pdf_path.glob("*.pdf", case_sensitive=False))
+		self._report_progress(total=len(pdfs))
 
 		await gather(*[
-			self.runner(exsclaim_json, lock, pdf_loc) for pdf_loc in self.pdf_path.glob("*.pdf", case_sensitive=False)
+			self.runner(exsclaim_json, lock, pdf_loc) for pdf_loc in pdfs
 		])
 
 		return exsclaim_json
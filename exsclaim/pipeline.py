@@ -3,39 +3,169 @@ from .pdf import PDFScraper
 from .exceptions import *
 from .notifications import *
 from .tool import ExsclaimTool, CaptionDistributor, JournalScraper
-from .utilities import paths, PrinterFormatter, ExsclaimFormatter, convert_labelbox_to_coords
+from .utilities import paths, PrinterFormatter, ExsclaimFormatter, ProgressReporter, ResultsArchive, convert_labelbox_to_coords
 from .db import Database
 
 import cv2
 import logging
 import numpy as np
 
-from asyncio import gather
+from asyncpg.exceptions import PostgresError
+from asyncio import gather, get_running_loop, to_thread
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import ExitStack, suppress
 from csv import writer
 from datetime import datetime as dt
 from enum import Flag, auto
 from functools import reduce
 from json import load, dump
 from operator import or_
+from os import link
 from os.path import isfile, splitext
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 from re import sub
 from sqlalchemy.exc import SQLAlchemyError
 from textwrap import wrap, dedent
-from typing import Any, Callable
+from threading import local
+from typing import Any, Callable, Iterator
 from uuid_utils import uuid7
 
 
 __all__ = ["Pipeline", "SaveMethods", "PipelineInterruptionException"]
 
 
+# Per-thread resources of the workers that render visualizations
+_worker_state = local()
+
+# The columns of each results table, in the order to_csv writes them and the results.* tables (minus run_id) store them
+RESULT_COLUMNS: dict[str, tuple[tuple[str, str], ...]] = {
+	"article": (("id", "string"), ("title", "string"), ("url", "string"), ("license", "string"), ("open", "bool"),
+				("authors", "list<string>"), ("abstract", "string")),
+	"figure": (("id", "string"), ("caption", "string"), ("caption_delimiter", "string"), ("url", "string"),
+			   ("figure_path", "string"), ("article_id", "string")),
+	"subfigure": (("id", "string"), ("classification_code", "string"), ("height", "double"), ("width", "double"),
+				  ("nm_height", "double"), ("nm_width", "double"), ("x1", "int64"), ("y1", "int64"), ("x2", "int64"),
+				  ("y2", "int64"), ("caption", "string"), ("keywords", "list<string>"), ("figure_id", "string")),
+	"subfigure_label": (("text", "string"), ("x1", "int64"), ("y1", "int64"), ("x2", "int64"), ("y2", "int64"),
+						("label_confidence", "double"), ("box_confidence", "double"), ("subfigure_id", "string")),
+	"scale_label": (("text", "string"), ("x1", "int64"), ("y1", "int64"), ("x2", "int64"), ("y2", "int64"),
+					("label_confidence", "double"), ("box_confidence", "double"), ("nm", "double"), ("scale_bar_id", "string")),
+	"scale": (("id", "string"), ("x1", "int64"), ("y1", "int64"), ("x2", "int64"), ("y2", "int64"), ("length", "int64"),
+			  ("label_line_distance", "double"), ("confidence", "double"), ("subfigure_id", "string")),
+}
+
+
+# The code each subfigure classification is stored as
+CLASSIFICATION_CODES = {
+	"microscopy": "MC",
+	"diffraction": "DF",
+	"graph": "GR",
+	"basic_photo": "PH",
+	"illustration": "IL",
+	"unclear": "UN",
+	"parent": "PT",
+	"subfigure": "SB"
+}
+
+
+def _figure_rows(figure_name:str, figure_json:dict, articles:set, subfigures:set) -> Iterator[tuple[str, list]]:
+	"""Yields the (table, row) pairs of one figure of the results, skipping the articles and subfigures already seen.
+	The rows follow the column layout in RESULT_COLUMNS, which is shared by the csv, parquet and postgres save methods.
+	"""
+	# create row for unique articles
+	article_id = figure_json["article_name"]
+	if article_id not in articles:
+		yield "article", [
+			article_id,
+			figure_json["title"],
+			figure_json["article_url"],
+			figure_json["license"],
+			figure_json["open"],
+			figure_json.get("authors", []),
+			figure_json.get("abstract", ""),
+		]
+		articles.add(article_id)
+
+	base_name = ".".join(figure_name.split(".")[:-1])
+	figure_id = sub("_fig", "-fig", base_name)
+
+	# create row for figure.csv
+	yield "figure", [
+		figure_id,
+		figure_json["full_caption"],
+		figure_json["caption_delimiter"],
+		figure_json["image_url"],
+		figure_json["figure_path"],
+		figure_json["article_name"],
+	]
+
+	# loop through subfigures
+	for master_image in figure_json.get("master_images", []):
+		subfigure_label = master_image["subfigure_label"]["text"]
+		subfigure_coords = convert_labelbox_to_coords(master_image["geometry"])
+		subfigure_id = f"{figure_id}-{subfigure_label}"
+		if subfigure_id in subfigures:
+			continue
+
+		subfigures.add(subfigure_id)
+		yield "subfigure", [
+			subfigure_id,
+			CLASSIFICATION_CODES[master_image["classification"]],
+			master_image.get("height", None),
+			master_image.get("width", None),
+			master_image.get("nm_height", None),
+			master_image.get("nm_width", None),
+			*subfigure_coords,
+			str(master_image.get("caption", "")),
+			master_image.get("keywords", []),
+			figure_id,
+		]
+
+		if master_image["subfigure_label"].get("geometry", None):
+			subfigure_label_coords = convert_labelbox_to_coords(master_image["subfigure_label"]["geometry"])
+			yield "subfigure_label", [
+				master_image["subfigure_label"]["text"],
+				*subfigure_label_coords,
+				master_image["subfigure_label"].get("label_confidence", None),
+				master_image["subfigure_label"].get("box_confidence", None),
+				subfigure_id,
+			]
+
+		for i, scale_bar in enumerate(master_image.get("scale_bars", [])):
+			scale_bar_id = f"{subfigure_id}-{i}"
+			scale_bar_coords = convert_labelbox_to_coords(scale_bar["geometry"])
+			yield "scale", [
+				scale_bar_id,
+				*scale_bar_coords,
+				scale_bar.get("length", None),
+				scale_bar.get("label_line_distance", None),
+				scale_bar.get("confidence", None),
+				subfigure_id,
+			]
+
+			if scale_bar.get("label", None) is None:
+				continue
+
+			scale_label = scale_bar["label"]
+			scale_label_coords = convert_labelbox_to_coords(scale_label["geometry"])
+			yield "scale_label", [
+				scale_label["text"],
+				*scale_label_coords,
+				scale_label.get("label_confidence", None),
+				scale_label.get("box_confidence", None),
+				scale_label.get("nm", None),
+				scale_bar_id,
+			]
+
+
 class SaveMethods(Flag):
 	SUBFIGURES = auto()
 	VISUALIZATION = auto()
 	BOXES = auto()
 	POSTGRES = auto()
 	CSV = auto()
+	PARQUET = auto()
 
 	@classmethod
 	def from_str(cls, string:str):
@@ -51,6 +181,8 @@ class SaveMethods(Flag):
 				return cls.POSTGRES | cls.CSV
 			case "csv":
 				return cls.CSV
+			case "parquet" | "arrow":
+				return cls.PARQUET
 			case _:
 				raise ValueError(f"There is no corresponding save_method to: {string}.")
 
@@ -78,6 +210,81 @@ def chmod(path:Path, permissions=None):
 			new_path.chmod(permissions)
 
 
+class ParquetResults:
+	"""Writes the results to typed Parquet files, one per table with the same columns as the csv's, as each figure is
+	finished. Each table's rows are written in row groups of batch_size rows, so at most one batch per table is held in
+	memory, and the files are complete once the writer is closed.
+	:param directory: Where the files are written.
+	:param int batch_size: The number of rows in each row group.
+	"""
+	def __init__(self, directory:Path, batch_size:int = 10_000):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+
+		self._pa = pa
+		arrow_types = {
+			"string": pa.string(),
+			"bool": pa.bool_(),
+			"int64": pa.int64(),
+			"double": pa.float64(),
+			"list<string>": pa.list_(pa.string()),
+		}
+		self.batch_size = batch_size
+		directory.mkdir(exist_ok=True)
+		self.paths = {_type: directory / f"{sub('_', '', _type)}.parquet" for _type in RESULT_COLUMNS}
+		self._schemas = {
+			_type: pa.schema([(name, arrow_types[arrow_type]) for name, arrow_type in columns])
+			for _type, columns in RESULT_COLUMNS.items()
+		}
+		self._batches = {_type: [] for _type in RESULT_COLUMNS}
+		# The articles and subfigures already written, which other figures can share
+		self._articles = set()
+		self._subfigures = set()
+
+		with ExitStack() as stack:
+			self._writers = {
+				_type: stack.enter_context(pq.ParquetWriter(self.paths[_type], self._schemas[_type], compression="zstd"))
+				for _type in RESULT_COLUMNS
+			}
+			self._stack = stack.pop_all()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def write_figure(self, figure_name:str, figure_json:dict):
+		for _type, row in _figure_rows(figure_name, figure_json, self._articles, self._subfigures):
+			self.write(_type, row)
+
+	def write(self, _type:str, row:list):
+		self._batches[_type].append(row)
+		if len(self._batches[_type]) >= self.batch_size:
+			self._flush(_type)
+
+	def _flush(self, _type:str):
+		rows = self._batches[_type]
+		if not rows:
+			return
+		pa = self._pa
+		schema = self._schemas[_type]
+		columns = []
+		for index, (field, (_, arrow_type)) in enumerate(zip(schema, RESULT_COLUMNS[_type])):
+			values = [row[index] for row in rows]
+			# Coordinates and lengths may be floats (or numpy scalars) after the models' post-processing
+			if arrow_type == "int64":
+				values = [None if value is None else int(round(float(value))) for value in values]
+			columns.append(pa.array(values, type=field.type))
+		self._writers[_type].write_table(pa.Table.from_arrays(columns, schema=schema))
+		rows.clear()
+
+	def close(self):
+		with self._stack:
+			for _type in RESULT_COLUMNS:
+				self._flush(_type)
+
+
 class Pipeline:
 	"""Defines the exsclaim! pipeline"""
 
@@ -107,6 +314,8 @@ class Pipeline:
 
 		self.results_directory = base_results_dir / self.query_dict["name"]
 		self.results_directory.mkdir(exist_ok=True)
+		# How far each stage has got, which the API streams to the dashboard while the run is going
+		self.progress = ProgressReporter(self.results_directory / ProgressReporter.FILENAME)
 
 		# region Set up logging
 		handlers = []
@@ -127,6 +336,8 @@ class Pipeline:
 
 		# region Check for an existing exsclaim json
 		self.exsclaim_path = self.results_directory / "exsclaim.json"
+		# Set (e.g. by run_pipeline) to archive each stage's outputs as soon as they're written
+		self.archive: ResultsArchive | None = None
 
 		if self.exsclaim_path.exists():
 			with open(self.exsclaim_path, "r") as f:
@@ -226,15 +437,15 @@ class Pipeline:
 			if tools is None:
 				tools: list[ExsclaimTool] = []
 				if journal_scraper:
-					tools.append(JournalScraper(self.query_dict, logger=self.logger))
+					tools.append(JournalScraper(self.query_dict, logger=self.logger, progress=self.progress))
 				if pdf_scraper:
-					tools.append(PDFScraper(self.query_dict, logger=self.logger))
+					tools.append(PDFScraper(self.query_dict, logger=self.logger, progress=self.progress))
 				if caption_distributor:
-					tools.append(CaptionDistributor(self.query_dict, logger=self.logger))
+					tools.append(CaptionDistributor(self.query_dict, logger=self.logger, progress=self.progress))
 				if figure_separator:
-					tools.append(FigureSeparator(self.query_dict, logger=self.logger))
+					tools.append(FigureSeparator(self.query_dict, logger=self.logger, progress=self.progress))
 			else:
-				tools: list[ExsclaimTool] = [cls(self.query_dict, logger=self.logger) for cls in tools]
+				tools: list[ExsclaimTool] = [cls(self.query_dict, logger=self.logger, progress=self.progress) for cls in tools]
 
 			# Ensure that any save methods that need to load something before hand do it before pipeline runs
 			save_methods = SaveMethods.from_list(query_dict.get("save_format", []))
@@ -247,45 +458,55 @@ class Pipeline:
 
 			# run each ExsclaimTool on search query
 			for tool in tools:
+				if tool.stage is not None:
+					self.progress.start(tool.stage)
 				await tool.load()
 				exsclaim_dict = await tool.run(query_dict, exsclaim_dict)
 				await tool.unload()
+				if tool.stage is not None:
+					self.progress.finish(tool.stage)
 
 			self.exsclaim_dict = exsclaim_dict
 
-			# group unassigned objects
-			self.group_objects()
+			# group unassigned objects, saving each figure's rows to Parquet as soon as they're final
+			if SaveMethods.PARQUET in save_methods:
+				with self.parquet_results() as parquet:
+					self.group_objects(on_grouped=parquet.write_figure)
+			else:
+				self.group_objects()
 			# self.exsclaim_dict["subfigures"] = sum(map(lambda x: len(x["master_images"]), self.exsclaim_dict.values()))
 
 			# Save results as specified
-			if SaveMethods.SUBFIGURES in save_methods:
-				self.to_file()
+			self.progress.start("results")
+			if save_methods & (SaveMethods.SUBFIGURES | SaveMethods.VISUALIZATION | SaveMethods.BOXES):
+				await self.render(save_methods)
+			await self.archive_outputs("figures", "images", "extractions", "boxes")
 
-			if SaveMethods.VISUALIZATION in save_methods:
-				extractions = self.results_directory / "extractions"
-				extractions.mkdir(exist_ok=True)
-
-				await gather(*[self.make_visualization(name, json, extractions) for name, json in self.exsclaim_dict.items()])
-
-			if SaveMethods.BOXES in save_methods:
-				for figure in self.exsclaim_dict:
-					self.draw_bounding_boxes(figure)
+			if SaveMethods.PARQUET in save_methods:
+				await self.archive_outputs("parquet")
 
 			if SaveMethods.CSV in save_methods or SaveMethods.POSTGRES in save_methods:
-				csv_info = self.to_csv()
+				self.to_csv(keep_rows=False)
+				await self.archive_outputs("csv")
+
+			if SaveMethods.POSTGRES in save_methods:
+				db = Database()
+				# Each table's rows are generated as they're copied, rather than holding every row of the run
+				rows = {_type: self.iter_table_rows(_type) for _type in RESULT_COLUMNS}
+				try:
+					await db.bulk_upload(rows, run_id=self.query_dict["run_id"], logger=self.logger)
+				except (SQLAlchemyError, PostgresError) as e:
+					self.logger.exception("An error occurred while uploading the results to the database, but the pipeline finished running.")
+					raise PipelineInterruptionException("The results could not be saved to the database, but the pipeline finished running before this happened.") from e
 
-				if SaveMethods.POSTGRES in save_methods:
-					db = Database()
-					try:
-						await db.upload(csv_info, run_id=self.query_dict["run_id"])
-					except SQLAlchemyError as e:
-						self.logger.exception("An error occurred while uploading the results to the database, but the pipeline finished running.")
-						raise PipelineInterruptionException("The results could not be saved to the database, but the pipeline finished running before this happened.") from e
+			self.progress.finish("results")
+			self.progress.close("finished")
 
 			# Creates success messages to be sent to the notifiers
 			message = f"EXSCLAIM! query{f' `{_id}`' if _id is not None else ''} finished at: {dt.now():%Y-%m-%dT%H:%M%z}."
 		except BaseException as e:
 			self.logger.exception(e)
+			self.progress.close("error")
 			message = f"An error occurred at {dt.now():%Y-%m-%dT%H:%M%z} running{' the' if _id is None else ''} EXSCLAIM! query{f' `{_id}`' if _id is not None else ''}."
 			raise PipelineInterruptionException from e
 		finally:
@@ -298,6 +519,15 @@ class Pipeline:
 
 			return self.exsclaim_dict
 
+	async def archive_outputs(self, *names:str):
+		"""Adds the finished outputs in the given folders of the results directory to self.archive, if there is one."""
+		if self.archive is None:
+			return
+		for name in names:
+			path = self.results_directory / name
+			if path.exists():
+				await to_thread(self.archive.add, path)
+
 	@staticmethod
 	def assign_captions(figure:dict) -> tuple[list[dict], dict]:
 		"""Assigns all captions to master_images JSONs for single figure
@@ -359,8 +589,13 @@ class Pipeline:
 
 		return masters, unassigned
 
-	def group_objects(self):
-		"""Pair captions with subfigures for each figure in exsclaim json"""
+	def group_objects(self, on_grouped:Callable[[str, dict], Any] = None):
+		"""Pair captions with subfigures for each figure in exsclaim json
+
+		Args:
+			on_grouped (callable): Called with the name and json of each figure once its objects are matched, which is
+				when its results are final (e.g. to save them as they're produced).
+		"""
 		self.display_info("Matching Image Objects to Caption Text\n")
 		figures = len(self.exsclaim_dict)
 		for counter, figure in enumerate(self.exsclaim_dict, start=1):
@@ -373,6 +608,8 @@ class Pipeline:
 				"master_images": masters,
 				"unassigned": unassigned
 			}
+			if on_grouped is not None:
+				on_grouped(figure, figure_json)
 
 		self.display_info(">>> SUCCESS!\n")
 		with open(self.results_directory / "exsclaim.json", "w") as f:
@@ -385,90 +622,146 @@ class Pipeline:
 	def to_file(self):
 		""" Saves data to a csv and saves subfigures as individual images
 
+		The figures are exported in parallel by a pool of threads (cv2 releases the GIL while decoding and encoding), whose
+		size can be set with the query's "export_workers" key.
+
 		Modifies:
 			Creates directories to save each subfigure
 		"""
-		from .utilities import convert_labelbox_to_coords
-
-		# TODO: Figure_extension and figure should be getting passed into this function
-		def write(figure:np.ndarray, image:dict, directory:Path, figure_extension:str, name_generator:Callable[[str], list[str]], order_c_copy=False):
-			"""
-			An inner function designed to reduce the amount of needed code in the to_file function.
-
-			:param np.ndarray figure: The cv2 image.
-			:param dict image: The image JSON object.
-			:param pathlib.Path directory: The directory where the image should be written.
-			:param Callable[[str], list[str]] name_generator: How the names of the image files should be generated.
-			The only parameter is the determined classification of the image.
-			:param bool order_c_copy: If the path should be copied with order='C' as the only parameter.
-			Added so the call for the master image would be the same as before.
-			"""
+		self.display_info(f"Printing Master Image Objects to: {self.results_directory / 'images'}\n")
+		with ThreadPoolExecutor(max_workers=self.query_dict.get("export_workers", None), thread_name_prefix="to_file") as executor:
+			# Consuming the results re-raises any unexpected exception from the workers
+			for _ in executor.map(self._export_figure, self.exsclaim_dict):
+				pass
+
+		self.display_info(">>> SUCCESS!\n")
+
+	async def render(self, save_methods:SaveMethods):
+		"""Saves the subfigures, visualizations and bounding boxes requested in save_methods in a single pass.
+
+		Each figure is decoded at most once, and only if one of the requested artefacts is missing, and every artefact is
+		drawn from that copy. The figures are rendered in parallel by a pool of threads, whose size can be set with the
+		query's "export_workers" key.
+		"""
+		if SaveMethods.SUBFIGURES in save_methods:
+			self.display_info(f"Printing Master Image Objects to: {self.results_directory / 'images'}\n")
+		if SaveMethods.VISUALIZATION in save_methods:
+			(self.results_directory / "extractions").mkdir(exist_ok=True)
+		if SaveMethods.BOXES in save_methods:
+			(self.results_directory / "boxes").mkdir(exist_ok=True)
+
+		loop = get_running_loop()
+		with ThreadPoolExecutor(max_workers=self.query_dict.get("export_workers", None), thread_name_prefix="render") as executor:
+			await gather(*[
+				loop.run_in_executor(executor, self.render_figure, figure_name, save_methods)
+				for figure_name in self.exsclaim_dict
+			])
+
+		self.display_info(">>> SUCCESS!\n")
+
+	def render_figure(self, figure_name:str, save_methods:SaveMethods):
+		"""Saves each of the artefacts requested in save_methods that doesn't exist yet. The figure is decoded the first
+		time one of them needs it, and that copy is shared by the rest."""
+		figure_json = self.exsclaim_dict[figure_name]
+		full_figure = None
+
+		def load_figure() -> Image.Image:
+			nonlocal full_figure
+			if full_figure is None:
+				with Image.open(self.results_directory / "figures" / figure_json["figure_name"]) as image:
+					full_figure = image.convert("RGB")
+			return full_figure
+
+		try:
+			if SaveMethods.SUBFIGURES in save_methods:
+				# cv2 expects the channels in BGR order
+				self._export_figure(figure_name, lambda: np.ascontiguousarray(np.asarray(load_figure())[:, :, ::-1]))
+
+			extractions = self.results_directory / "extractions"
+			if SaveMethods.VISUALIZATION in save_methods and not (extractions / figure_name).is_file():
+				self.render_visualization(figure_name, figure_json, extractions, load_figure)
+
+			if SaveMethods.BOXES in save_methods and not (self.results_directory / "boxes" / figure_name).is_file():
+				self.draw_bounding_boxes(figure_name, load_figure=load_figure)
+		except OSError as e:
+			self.logger.exception(f"Error rendering {figure_name}. It may be damaged! {e}")
+		except Exception as e:
+			self.logger.exception(f"Error rendering {figure_name}. {e}")
+
+	def _export_figure(self, figure_name:str, load_figure:Callable[[], np.ndarray | None] = None):
+		"""Saves each master, inset, and dependent image of a figure as their own file in a directory according to label.
+		The figure is only decoded (by load_figure, which defaults to cv2.imread) if a crop can't be reused from the ones
+		extract_image_objects already wrote. Those crops are PNGs, so for figures in other formats the (much smaller) crop
+		is converted instead of being linked.
+		"""
+		figure_root_name, figure_extension = splitext(figure_name) # figure_name is <figure_root_name>.<figure_extension>
+		figure_dict = self.exsclaim_dict[figure_name]
+		images_directory = self.results_directory / "images" / figure_root_name
+
+		def name(image:dict, *parts:str) -> str:
+			_class = (image.get("classification", None) or "uas")[:3].lower()
+			return "_".join((figure_root_name, *parts, _class)) + figure_extension
+
+		# (image JSON, directory, file name, existing crop that can be reused instead) for every file to write
+		writes: list[tuple[dict, Path, str, Path | None]] = []
+		for master_image in figure_dict.get("master_images", []):
+			label = master_image['subfigure_label']['text']
+
+			# create a directory for each master image in <results_dir>/images/<figure_name>/<subfigure_label>
+			directory = images_directory / label
+			existing_crop = directory / f"{figure_root_name}_{label}.png"
+			writes.append((master_image, directory, name(master_image, label), existing_crop))
+
+			# Repeat for dependents of the master image to file
+			for dependent_id, dependent_image in enumerate(master_image.get("dependent_images", [])):
+				dependent_root_name = directory / "dependent"
+				writes.append((dependent_image, dependent_root_name, name(dependent_image, label, f"dep{dependent_id}"), None))
+
+				# Repeat for insets of dependents of master image to file
+				for inset_id, inset_image in enumerate(dependent_image.get("inset_images", [])):
+					writes.append((inset_image, dependent_root_name / "inset", name(inset_image, label, f"ins{inset_id}"), None))
+
+			# Write insets of masters to file
+			for inset_id, inset_image in enumerate(master_image.get("inset_images", [])):
+				writes.append((inset_image, directory / "inset", name(inset_image, label, f"ins{inset_id}"), None))
+
+		for directory in {directory for _, directory, _, _ in writes}:
 			directory.mkdir(exist_ok=True, parents=True)
-			_class = image.get("classification", "uas")[:3].lower()
-			_name = '_'.join(name_generator(_class)) + figure_extension
+
+		figure = None
+		for image, directory, _name, existing_crop in writes:
+			destination = directory / _name
+			if existing_crop is not None and existing_crop.is_file():
+				# If the crop can't be reused, it is cropped from the figure again below
+				if existing_crop.suffix.lower() == destination.suffix.lower():
+					with suppress(OSError):
+						destination.unlink(missing_ok=True)
+						link(existing_crop, destination)
+						continue
+				else:
+					with suppress(Exception):
+						if (crop := cv2.imread(str(existing_crop))) is not None and cv2.imwrite(str(destination), crop):
+							continue
+
+			if figure is None:
+				figure = load_figure() if load_figure is not None else cv2.imread(str(self.results_directory / "figures" / figure_name))
+				if figure is None:
+					self.logger.error(f"Error printing {figure_name} to file. It may be damaged!")
+					return
 
 			# save image to file
 			x1, y1, x2, y2 = convert_labelbox_to_coords(image['geometry'])
-			patch = figure[y1:y2, x1:x2]
-			if order_c_copy:
-				patch = patch.copy(order='C')
-
 			try:
-				cv2.imwrite(str(directory / _name), patch)
+				cv2.imwrite(str(destination), figure[y1:y2, x1:x2])
 			except Exception as err:
-				self.logger.exception((f"Error in saving cropped master image of figure: {figure_root_name}. {err}"))
-
-		self.display_info(f"Printing Master Image Objects to: {self.results_directory / 'images'}\n")
-		for figure_name in self.exsclaim_dict:
-			figure_root_name, figure_extension = splitext(figure_name) # figure_name is <figure_root_name>.<figure_extension>
-			try:
-				figure = cv2.imread(self.results_directory / "figures" / figure_name)
-			except Exception as e:
-				self.logger.exception(f"Error printing {figure_name} to file. It may be damaged! {e}")
-				continue
+				self.logger.exception(f"Error in saving cropped image {_name} of figure: {figure_root_name}. {err}")
 
-			# save each master, inset, and dependent image as their own file in a directory according to label
-			figure_dict = self.exsclaim_dict[figure_name]
-			for master_image in figure_dict.get("master_images", []):
-				master_class = master_image['classification'][0:3].lower() if master_image['classification'] is not None else 'uas'
-
-				# create a directory for each master image in <results_dir>/images/<figure_name>/<subfigure_label>
-				directory = self.results_directory / "images" / figure_root_name / master_image['subfigure_label']['text']
-				write(figure, master_image, directory, figure_extension,
-					  lambda _class: [figure_root_name,
-									  master_image['subfigure_label']['text'],
-									  _class],
-					  order_c_copy=True)
-
-				# Repeat for dependents of the master image to file
-				for dependent_id, dependent_image in enumerate(master_image.get("dependent_images", [])):
-					dependent_root_name = directory / "dependent"
-					write(figure, dependent_image, dependent_root_name, figure_extension,
-						  lambda _class: [figure_root_name,
-										  master_image['subfigure_label']['text'],
-										  f"dep{dependent_id}", _class])
-
-					# Repeat for insets of dependents of master image to file
-					for inset_id, inset_image in enumerate(dependent_image.get("inset_images", [])):
-						inset_root_name = dependent_root_name / "inset"
-						write(figure, inset_root_name, inset_image, figure_extension,
-							  lambda _class: [figure_root_name,
-											  master_image['subfigure_label']['text'],
-											  f"ins{inset_id}", _class])
-
-				# Write insets of masters to file
-				for inset_id, inset_image in enumerate(master_image.get("inset_images", [])):
-					inset_root_name = directory / "inset"
-					write(figure, inset_root_name, inset_image, figure_extension,
-						  lambda _class: [figure_root_name,
-										  master_image['subfigure_label']['text'],
-										  f"ins{inset_id}", _class])
-
-		self.display_info(">>> SUCCESS!\n")
-
-	async def make_visualization(self, figure_name:str, figure_json:dict, extractions):
+	async def make_visualization(self, figure_name:str, figure_json:dict, extractions, executor:Executor = None):
 		"""Save subfigures and their labels as images
 
+		The drawing is done by render_visualization on the executor (or the event loop's default executor), so several
+		figures are rendered at once without blocking the event loop.
+
 		Args:
 			figure_name (str): A path to the image (.png, .jpg, or .gif)
 				file containing the article figure
@@ -476,16 +769,27 @@ class Pipeline:
 			Creates images and text files in <save_path>/extractions folders
 			showing details about each subfigure
 		"""
+		await get_running_loop().run_in_executor(executor, self.render_visualization, figure_name, figure_json, extractions)
+
+	def render_visualization(self, figure_name:str, figure_json:dict, extractions:Path,
+							 load_figure:Callable[[], Image.Image] = None):
+		"""Draws the extraction sheet of a figure: each subfigure, with the detected objects outlined, above its details.
+
+		Args:
+			figure_name (str): The name of the figure in the exsclaim json
+			figure_json (dict): The Figure JSON
+			extractions (Path): The directory the sheet is saved to
+			load_figure (Callable): Returns the decoded RGB figure, which is read from the figures directory if it isn't given
+		"""
 		def draw_box(draw_full_figure, geometry, width=2, outline="green", **kwargs):
 			coords = convert_labelbox_to_coords(geometry)
 			bounding_box = tuple(map(int, coords))
 			draw_full_figure.rectangle(bounding_box, width=width, outline=outline, **kwargs)
 
-		# def draw_box(image, geometry, thickness=2, outline=(0, 255, 0), **kwargs):
-		# 	x1, y1, x2, y2 = tuple(map(int, convert_labelbox_to_coords(geometry)))
-		# 	cv2.rectangle(image, (x1, y1), (x2, y2), outline, thickness=thickness, **kwargs)
-
 		master_images = figure_json.get("master_images", [])
+		if not master_images:
+			self.logger.info(f"{figure_name} has no subfigures to visualize.")
+			return
 
 		# to handle older versions that didn't store height and width
 		for master_image in master_images:
@@ -503,26 +807,19 @@ class Pipeline:
 		# Make and save images
 		labeled_image = Image.new(mode="RGB", size=(image_width, image_height))
 		draw = ImageDraw.Draw(labeled_image)
-		try:
-			font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
-		except OSError as e:
-			self.display_info(f"Could not create font DejaVuSans.ttf, using default. {e}")
-			font = ImageFont.load_default()
-
-		labeled_image = np.zeros(shape=(image_height, image_width, 3), dtype=np.uint8)
-		font = cv2.freetype.createFreeType2()
-		font.loadFontData(fontFileName="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", id=0)
+		font = self._visualization_font()
 
-		figures_path = self.results_directory / "figures"
-		full_figure = Image.open(figures_path / figure_json["figure_name"]).convert("RGB")
+		if load_figure is None:
+			full_figure = Image.open(self.results_directory / "figures" / figure_json["figure_name"]).convert("RGB")
+		else:
+			full_figure = load_figure().copy()
 		draw_full_figure = ImageDraw.Draw(full_figure)
-		# full_figure = cv2.imread(str(figures_path / figure_json["figure_name"]))
 
 		image_y = 0
 		for subfigure_json in master_images:
 			x1, y1, x2, y2 = tuple(map(int, convert_labelbox_to_coords(subfigure_json["geometry"])))
 			classification = subfigure_json["classification"]
-			caption: str = subfigure_json.get("caption", "")
+			caption: str = subfigure_json.get("caption", "") or ""
 			caption = "\n".join(wrap(caption, width=100))
 
 			subfigure_label = subfigure_json["subfigure_label"]["text"]
@@ -540,23 +837,31 @@ class Pipeline:
 				draw_box(draw_full_figure, label_geometry)
 
 			# Draw image
-			subfigure = full_figure.crop((int(x1), int(y1), int(x2), int(y2)))
-			# subfigure = full_figure[y1:y2, x1:x2]
+			subfigure = full_figure.crop((x1, y1, x2, y2))
 			text = f"Subfigure Label: {subfigure_label}\nClassification: {classification}\nScale Bar Label: {scale_bar_label}\nCaption:\n{caption}"
-			text.encode("utf-8")
 
 			labeled_image.paste(subfigure, box=(0, image_y))
-			labeled_image[image_y:, 0:] = subfigure
 			image_y += int(subfigure_json["height"])
 
 			draw.text((0, image_y), text, fill="white", font=font)
-			# font.text(labeled_image, text, (0, image_y), color=(255, 255, 255))
 			image_y += image_buffer
 
 		labeled_image.save(extractions / figure_name)
-	# cv2.imwrite(str(extractions / figure_name), labeled_image)
 
-	def draw_bounding_boxes(self, figure_name:str, draw_scale=False, draw_labels=False, draw_subfigures=True):
+	def _visualization_font(self) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+		"""Loads the visualization font once per worker thread, since FreeType fonts shouldn't be shared between threads."""
+		font = getattr(_worker_state, "font", None)
+		if font is None:
+			try:
+				font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+			except OSError as e:
+				self.display_info(f"Could not create font DejaVuSans.ttf, using default. {e}")
+				font = ImageFont.load_default()
+			_worker_state.font = font
+		return font
+
+	def draw_bounding_boxes(self, figure_name:str, draw_scale=False, draw_labels=False, draw_subfigures=True,
+							load_figure:Callable[[], Image.Image] = None):
 		"""Save figures with bounding boxes drawn
 
 		Args:
@@ -564,6 +869,7 @@ class Pipeline:
 			draw_scale (bool): If True, draws scale object bounding boxes
 			draw_labels (bool): If True, draws subfigure label bounding boxes
 			draw_subfigures (bool): If True, draws subfigure bounding boxes
+			load_figure (Callable): Returns the decoded RGB figure, which is read from the figures directory if it isn't given
 		Modifies:
 			Creates images and text files in <save_path>/boxes folders
 			showing details about each subfigure
@@ -578,8 +884,10 @@ class Pipeline:
 		figure_json = self.exsclaim_dict[figure_name]
 		master_images = figure_json.get("master_images", [])
 
-		figures_path = self.results_directory / "figures"
-		full_figure = Image.open(figures_path / figure_json["figure_name"]).convert("RGB")
+		if load_figure is None:
+			full_figure = Image.open(self.results_directory / "figures" / figure_json["figure_name"]).convert("RGB")
+		else:
+			full_figure = load_figure().copy()
 		draw_full_figure = ImageDraw.Draw(full_figure)
 
 		scale_objects = []
@@ -627,128 +935,63 @@ class Pipeline:
 		del draw_full_figure
 		full_figure.save(boxes_directory / figure_name)
 
-	def to_csv(self) -> dict[str, list[Any]]:
+	def iter_result_rows(self) -> Iterator[tuple[str, list]]:
+		"""Yields the (table, row) pairs of the results, one figure at a time.
+		The rows follow the column layout in RESULT_COLUMNS, which is shared by the csv, parquet and postgres save methods.
+		"""
+		articles = set()
+		subfigures = set()
+		for figure_name, figure_json in self.exsclaim_dict.items():
+			yield from _figure_rows(figure_name, figure_json, articles, subfigures)
+
+	def iter_table_rows(self, table:str) -> Iterator[list]:
+		"""Yields the rows of one table of the results, in the column layout in RESULT_COLUMNS."""
+		for _type, row in self.iter_result_rows():
+			if _type == table:
+				yield row
+
+	def to_csv(self, keep_rows:bool = True) -> dict[str, list[Any]]:
 		"""Places data in a set of csv's ready for database upload
 
+		Args:
+			keep_rows (bool): If the rows are also returned (e.g. to upload them to the database). Otherwise, each row is
+				dropped once it's written, and the returned lists are empty.
 		Modifies:
 			Creates csv/ folder with article, figure, scalebar, scalebarlabel, subfigure, and subfigurelabel csvs.
 		"""
-		exsclaim_json = self.exsclaim_dict
 		csv_dir = self.results_directory / "csv"
 		csv_dir.mkdir(exist_ok=True)
 
-		articles = set()
-		subfigures = set()
-		classification_codes = {
-			"microscopy": "MC",
-			"diffraction": "DF",
-			"graph": "GR",
-			"basic_photo": "PH",
-			"illustration": "IL",
-			"unclear": "UN",
-			"parent": "PT",
-			"subfigure": "SB"
-		}
-
-		csv_info = {
-			"article": [],
-			"figure": [],
-			"subfigure": [],
-			"subfigure_label": [],
-			"scale_label": [],
-			"scale": []
-		}
+		csv_info = {_type: [] for _type in RESULT_COLUMNS}
 
-		for figure_name, figure_json in exsclaim_json.items():
-			# create row for unique articles
-			article_id = figure_json["article_name"]
-			if article_id not in articles:
-				csv_info["article"].append([
-					article_id,
-					figure_json["title"],
-					figure_json["article_url"],
-					figure_json["license"],
-					figure_json["open"],
-					figure_json.get("authors", []),
-					figure_json.get("abstract", ""),
-				])
-				articles.add(article_id)
-
-			base_name = ".".join(figure_name.split(".")[:-1])
-			figure_id = sub("_fig", "-fig", base_name)
-
-			# create row for figure.csv
-			csv_info["figure"].append([
-				figure_id,
-				figure_json["full_caption"],
-				figure_json["caption_delimiter"],
-				figure_json["image_url"],
-				figure_json["figure_path"],
-				figure_json["article_name"],
-			])
+		# Save the rows to the csvs as they're generated
+		with ExitStack() as stack:
+			csv_writers = {
+				_type: writer(stack.enter_context(open(csv_dir / f"{sub('_', '', _type)}.csv", "w", encoding="utf-8", newline="")))
+				for _type in RESULT_COLUMNS
+			}
+			for _type, row in self.iter_result_rows():
+				csv_writers[_type].writerow(row)
+				if keep_rows:
+					csv_info[_type].append(row)
 
-			# loop through subfigures
-			for master_image in figure_json.get("master_images", []):
-				subfigure_label = master_image["subfigure_label"]["text"]
-				subfigure_coords = convert_labelbox_to_coords(master_image["geometry"])
-				subfigure_id = f"{figure_id}-{subfigure_label}"
-				if subfigure_id in subfigures:
-					continue
+		return csv_info
 
-				subfigures.add(subfigure_id)
-				csv_info["subfigure"].append([
-					subfigure_id,
-					classification_codes[master_image["classification"]],
-					master_image.get("height", None),
-					master_image.get("width", None),
-					master_image.get("nm_height", None),
-					master_image.get("nm_width", None),
-					*subfigure_coords,
-					str(master_image.get("caption", "")),
-					master_image.get("keywords", []),
-					figure_id,
-				])
-
-				if master_image["subfigure_label"].get("geometry", None):
-					subfigure_label_coords = convert_labelbox_to_coords(master_image["subfigure_label"]["geometry"])
-					csv_info["subfigure_label"].append([
-						master_image["subfigure_label"]["text"],
-						*subfigure_label_coords,
-						master_image["subfigure_label"].get("label_confidence", None),
-						master_image["subfigure_label"].get("box_confidence", None),
-						subfigure_id,
-					])
-
-				for i, scale_bar in enumerate(master_image.get("scale_bars", [])):
-					scale_bar_id = f"{subfigure_id}-{i}"
-					scale_bar_coords = convert_labelbox_to_coords(scale_bar["geometry"])
-					csv_info["scale"].append([
-						scale_bar_id,
-						*scale_bar_coords,
-						scale_bar.get("length", None),
-						scale_bar.get("label_line_distance", None),
-						scale_bar.get("confidence", None),
-						subfigure_id,
-					])
-
-					if scale_bar.get("label", None) is None:
-						continue
+	def parquet_results(self, batch_size:int = None) -> ParquetResults:
+		"""Opens a writer of the results' Parquet files, in row groups of batch_size (or the query's
+		"parquet_batch_size", default 10,000) rows."""
+		return ParquetResults(self.results_directory / "parquet", batch_size or self.query_dict.get("parquet_batch_size", 10_000))
 
-					scale_label = scale_bar["label"]
-					scale_label_coords = convert_labelbox_to_coords(scale_label["geometry"])
-					csv_info["scale_label"].append([
-						scale_label["text"],
-						*scale_label_coords,
-						scale_label.get("label_confidence", None),
-						scale_label.get("box_confidence", None),
-						scale_label.get("nm", None),
-						scale_bar_id,
-					])
-
-		# Save lists of rows to csvs
-		for _type, rows in csv_info.items():
-			with open(csv_dir / f"{sub('_', '', _type)}.csv", "w", encoding="utf-8", newline="") as file:
-				csv_writer = writer(file)
-				csv_writer.writerows(rows)
+	def to_parquet(self, batch_size:int = None) -> dict[str, Path]:
+		"""Saves the results held in exsclaim_dict as typed Parquet files, one per table, with the same columns as the csv's.
+		The pipeline writes them as group_objects finishes each figure instead.
 
-		return csv_info
+		Modifies:
+			Creates parquet/ folder with article, figure, scale, scalelabel, subfigure, and subfigurelabel parquet files.
+		Returns:
+			The path to the Parquet file of each table.
+		"""
+		with self.parquet_results(batch_size) as parquet:
+			for figure_name, figure_json in self.exsclaim_dict.items():
+				parquet.write_figure(figure_name, figure_json)
+		return parquet.paths
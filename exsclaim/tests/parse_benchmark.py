@@ -0,0 +1,67 @@
+"""Micro-benchmark of the HTML parsing used by the journal families.
+
+Compares parsing whole article pages with html.parser and filtering figures by serializing them (the previous behavior)
+against parsing with lxml, restricted to the tags Nature needs, and filtering figures with has_extra_key. Each family's
+extra_key is timed, since a blank key (Nature) matches without looking at the figure, a key in the figures' attributes
+is found without serializing them, and a key that isn't in the figures falls back to serializing each one.
+
+To run from the repository root:
+```
+python -m exsclaim.tests.parse_benchmark
+```
+"""
+import pathlib
+import timeit
+
+from bs4 import BeautifulSoup
+
+from exsclaim import journal
+
+
+ARTICLES = sorted((pathlib.Path(__file__).parent / "data" / "nature_articles").glob("*.html"))
+# The extra_key of each family, along with a key found in the attributes of Nature's figures
+EXTRA_KEYS = {
+	"Nature": " ",
+	"ACS": "inline-fig internalNav",
+	"RSC": "/image/article",
+	"Nature figure class": "js-c-reading-companion-figures-item c-article-section__figure",
+}
+
+
+def full_parse(pages, extra_key):
+	figures = 0
+	for page in pages:
+		soup = BeautifulSoup(page, "html.parser")
+		figures += len(tuple(filter(lambda a: extra_key in str(a), soup.select("figure"))))
+	return figures
+
+
+def restricted_parse(pages, family):
+	figures = 0
+	for page in pages:
+		soup = journal.Nature.parse(page, "article")
+		figures += len(tuple(filter(family.has_extra_key, soup.select("figure"))))
+	return figures
+
+
+def main(repeat=5):
+	pages = [article.read_text(encoding="utf-8") for article in ARTICLES]
+	family = journal.Nature.__new__(journal.Nature)
+
+	for key_name, extra_key in EXTRA_KEYS.items():
+		family._extra_key = extra_key
+		print(f"{key_name} ({extra_key!r}): {full_parse(pages, extra_key)} figures with str(figure), "
+			  f"{restricted_parse(pages, family)} with has_extra_key")
+
+		results = {}
+		for name, statement in (("html.parser, whole page", lambda: full_parse(pages, extra_key)),
+								("lxml, SoupStrainer", lambda: restricted_parse(pages, family))):
+			results[name] = min(timeit.repeat(statement, number=1, repeat=repeat))
+			print(f"\t{name:<25} {results[name] * 1000:>8.1f} ms for {len(pages)} articles")
+
+		baseline, restricted = results.values()
+		print(f"\tSpeedup: {baseline / restricted:.2f}x")
+
+
+if __name__ == "__main__":
+	main()
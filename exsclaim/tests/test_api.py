@@ -1,16 +1,27 @@
 from exsclaim.api import app
-from exsclaim.db import async_engine, Database
+from exsclaim.api.models import Results, Status
+from exsclaim.db import Article, get_async_engine, Database, dispose_engines
+from exsclaim.db.postgres import get_database_connection_string
 
 import pytest
 
 from asyncio import run
 from contextlib import contextmanager
+from datetime import datetime as dt, timezone as tz
 from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlmodel.ext.asyncio.session import AsyncSession
+from urllib.parse import parse_qs, urlsplit
+from uuid import uuid4
 
 
-client = TestClient(app)
+# TrustedHostMiddleware rejects TestClient's default host of testserver
+BASE_URL = "http://localhost"
+client = TestClient(app, base_url=BASE_URL)
 
 
 def get_valid_query() -> dict:
@@ -31,7 +42,7 @@ def get_valid_query() -> dict:
 @contextmanager
 async def db(): # TODO: Get the session working here
 	async_session = sessionmaker(
-		bind=async_engine, class_=AsyncSession, expire_on_commit=False
+		bind=get_async_engine(), class_=AsyncSession, expire_on_commit=False
 	)
 
 	async with async_session() as session:
@@ -54,6 +65,82 @@ def test_v1_articles():
 	assert response.status_code == 200
 
 
+@pytest.fixture
+def run_with_articles():
+	"""A finished run with three articles, deleted after the test."""
+	run_id = uuid4()
+
+	async def with_session(callback):
+		engine = create_async_engine(get_database_connection_string(), poolclass=NullPool)
+		try:
+			async with AsyncSession(engine) as session, session.begin():
+				await callback(session)
+		finally:
+			await engine.dispose()
+
+	async def add(session):
+		now = dt.now(tz.utc)
+		session.add(Results(id=run_id, search_query={}, status=Status.FINISHED, start_time=now, end_time=now))
+		await session.flush()
+		for i in range(3):
+			session.add(Article(run_id=run_id, id=f"article-{i}", title=f"Article {i}", url=f"https://example.com/{i}",
+								license=None, open=True, authors=[], abstract=None))
+
+	async def remove(session):
+		await session.exec(delete(Article).where(Article.run_id == run_id))
+		await session.exec(delete(Results).where(Results.id == run_id))
+
+	async def setup():
+		try:
+			await Database().initialize_database()
+		except (OSError, DBAPIError) as e:
+			pytest.skip(f"The database isn't available: {e}")
+		finally:
+			# The shared engine's connections belong to this event loop, not the test client's
+			await dispose_engines()
+		await with_session(add)
+
+	run(setup())
+	yield run_id
+	run(with_session(remove))
+
+
+def test_v1_page_parameter_is_rejected():
+	response = client.get(f"/results/v1/{uuid4()}/articles", params=dict(page=2))
+	assert response.status_code == 400
+	message = response.json()["message"]
+	assert "page parameter is no longer supported" in message
+	assert "after and limit" in message
+
+
+def test_v1_articles_keyset_pagination(run_with_articles):
+	url = f"/results/v1/{run_with_articles}/articles"
+	with TestClient(app, base_url=BASE_URL) as client:
+		response = client.get(url, params=dict(limit=2))
+		assert response.status_code == 200
+		assert [article["id"] for article in response.json()] == ["article-0", "article-1"]
+		assert response.headers["X-Next-After"] == "article-1"
+		link, rel = response.headers["Link"].split("; ")
+		link = urlsplit(link.strip("<>"))
+		assert rel == "rel=\"next\""
+		assert link.path == url
+		assert parse_qs(link.query) == dict(after=["article-1"], limit=["2"])
+
+		response = client.get(url, params=dict(limit=2, after=response.headers["X-Next-After"]))
+		assert response.status_code == 200
+		assert [article["id"] for article in response.json()] == ["article-2"]
+		assert "X-Next-After" not in response.headers
+		assert "Link" not in response.headers
+
+
+def test_v1_articles_without_pagination_are_all_sent(run_with_articles):
+	with TestClient(app, base_url=BASE_URL) as client:
+		response = client.get(f"/results/v1/{run_with_articles}/articles")
+		assert response.status_code == 200
+		assert [article["id"] for article in response.json()] == ["article-0", "article-1", "article-2"]
+		assert "X-Next-After" not in response.headers
+
+
 def test_incorrect_journal_family():
 	query = get_valid_query()
 	query["journal_family"] = "I don't exist"
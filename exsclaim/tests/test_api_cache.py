@@ -0,0 +1,209 @@
+import io
+import itertools
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from uuid import uuid4
+
+from exsclaim.api.cache import ArchiveCache, CachedResponse, ResponseCache, archive_name, transcode_archive
+from exsclaim.utilities import digest_path
+
+
+def fake_request(path, **query_params):
+    """The parts of a starlette Request that ResponseCache reads"""
+    return SimpleNamespace(url=SimpleNamespace(path=path),
+                           query_params=SimpleNamespace(multi_items=lambda: list(query_params.items())))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_hit(self):
+        cache = ResponseCache(ttl=60)
+        request = fake_request("/results/v1/run/articles", limit="10")
+        response = cache.put(request, CachedResponse(b"[]"))
+        self.assertIs(cache.get(fake_request("/results/v1/run/articles", limit="10")), response)
+        self.assertIsNone(cache.get(fake_request("/results/v1/run/articles", limit="20")))
+
+    def test_entries_expire(self):
+        cache = ResponseCache(ttl=60)
+        request = fake_request("/results/v1/run/articles")
+        with mock.patch("exsclaim.api.cache.monotonic", return_value=1_000):
+            cache.put(request, CachedResponse(b"[]"))
+            cache.mark_finished("run")
+        with mock.patch("exsclaim.api.cache.monotonic", return_value=1_059):
+            self.assertIsNotNone(cache.get(request))
+            self.assertTrue(cache.is_finished("run"))
+        with mock.patch("exsclaim.api.cache.monotonic", return_value=1_061):
+            self.assertIsNone(cache.get(request))
+            self.assertFalse(cache.is_finished("run"))
+        self.assertEqual(cache._size, 0)
+
+    def test_expired_runs_are_pruned(self):
+        cache = ResponseCache(ttl=60)
+        with mock.patch("exsclaim.api.cache.monotonic", return_value=1_000):
+            cache.mark_finished("old")
+            cache.mark_finished("run")
+        with mock.patch("exsclaim.api.cache.monotonic", return_value=1_030):
+            cache.mark_finished("run")
+        with mock.patch("exsclaim.api.cache.monotonic", return_value=1_061):
+            cache.mark_finished("new")
+            self.assertEqual(list(cache._finished_runs), ["run", "new"])
+            self.assertTrue(cache.is_finished("run"))
+
+    def test_invalidate_forgets_the_run(self):
+        cache = ResponseCache(ttl=60)
+        run_id, other_run_id = uuid4(), uuid4()
+        for _id in (run_id, other_run_id):
+            cache.mark_finished(_id)
+            cache.put(fake_request(f"/results/v1/{_id}/articles"), CachedResponse(b"[]"))
+            cache.put(fake_request(f"/results/v1/{_id}/figures/"), CachedResponse(b"[]"))
+
+        cache.invalidate(run_id)
+        self.assertFalse(cache.is_finished(run_id))
+        self.assertIsNone(cache.get(fake_request(f"/results/v1/{run_id}/articles")))
+        self.assertIsNone(cache.get(fake_request(f"/results/v1/{run_id}/figures/")))
+        self.assertIsNotNone(cache.get(fake_request(f"/results/v1/{other_run_id}/articles")))
+
+    def test_least_recently_used_responses_are_evicted(self):
+        body = bytes(range(256)) * 4
+        size = CachedResponse(body).size
+        cache = ResponseCache(max_bytes=2 * size, ttl=60)
+        a, b, c = (fake_request(f"/results/v1/run/{name}") for name in "abc")
+        cache.put(a, CachedResponse(body))
+        cache.put(b, CachedResponse(body))
+        cache.get(a)
+        cache.put(c, CachedResponse(body))
+
+        self.assertIsNotNone(cache.get(a))
+        self.assertIsNone(cache.get(b))
+        self.assertLessEqual(cache._size, cache.max_bytes)
+
+
+class TestTranscodeArchive(unittest.TestCase):
+    FILES = {
+        "run/exsclaim.json": b"{}",
+        "run/figures/fig1.png": bytes(range(256)) * 300,
+        "run/images/fig1/a/fig1_a.png": b"subfigure",
+    }
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.source = self.directory / "run.tar.gz"
+        with tarfile.open(self.source, "w:gz") as tar:
+            for name in ("run", "run/figures", "run/images", "run/images/fig1", "run/images/fig1/a"):
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tar.addfile(info)
+            for name, data in self.FILES.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def transcode(self, compression):
+        return b"".join(transcode_archive(self.source, compression, chunk_size=1_000))
+
+    def test_archive_name(self):
+        self.assertEqual(archive_name(self.source), "run")
+
+    def test_zip_round_trip(self):
+        with zipfile.ZipFile(io.BytesIO(self.transcode("zip"))) as archive:
+            self.assertIsNone(archive.testzip())
+            for name, data in self.FILES.items():
+                self.assertEqual(archive.read(name), data)
+            self.assertIn("run/figures/", archive.namelist())
+
+    def test_tar_round_trips(self):
+        for compression, mode in (("tar", "r:"), ("xztar", "r:xz"), ("bztar", "r:bz2")):
+            with self.subTest(compression), tarfile.open(fileobj=io.BytesIO(self.transcode(compression)), mode=mode) as tar:
+                for name, data in self.FILES.items():
+                    self.assertEqual(tar.extractfile(name).read(), data)
+                self.assertTrue(tar.getmember("run/figures").isdir())
+
+    def test_gztar_is_not_transcoded(self):
+        with self.assertRaises(ValueError):
+            self.transcode("gztar")
+
+
+class TestArchiveCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        # Every access happens a second after the last one, so the least recently used file is always clear
+        clock = itertools.count(1_000_000)
+        patcher = mock.patch("exsclaim.api.cache.time", side_effect=lambda: next(clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add(self, cache, result_id, data):
+        return cache.build(result_id, "zip", iter((data[:5], data[5:])))
+
+    def test_build_caches_the_chunks(self):
+        cache = ArchiveCache(self.directory, max_bytes=1_000)
+        path, digest, cached = self.add(cache, "a", b"0123456789")
+
+        self.assertTrue(cached)
+        self.assertEqual(digest, "84d89877f0d4041efb6bf91a16f0248f2fd573e6af05c19f96bedb9f882f7882")
+        self.assertEqual(cache.get("a", "zip"), path)
+        self.assertEqual(path.read_bytes(), b"0123456789")
+        self.assertTrue(digest_path(path).read_text().startswith(digest))
+
+    def test_interrupted_builds_are_not_cached(self):
+        def chunks():
+            yield b"01234"
+            raise OSError("The source archive couldn't be read")
+
+        cache = ArchiveCache(self.directory, max_bytes=1_000)
+        with self.assertRaises(OSError):
+            cache.build("a", "zip", chunks())
+
+        self.assertIsNone(cache.get("a", "zip"))
+        self.assertFalse(list(self.directory.iterdir()))
+
+    def test_least_recently_used_files_are_evicted(self):
+        cache = ArchiveCache(self.directory, max_bytes=25)
+        self.add(cache, "a", b"a" * 10)
+        self.add(cache, "b", b"b" * 10)
+        cache.get("a", "zip")
+        self.add(cache, "c", b"c" * 10)
+
+        self.assertIsNotNone(cache.get("a", "zip"))
+        self.assertIsNone(cache.get("b", "zip"))
+        self.assertFalse(digest_path(cache.path("b", "zip")).exists())
+        self.assertIsNotNone(cache.get("c", "zip"))
+        self.assertLessEqual(cache._size, cache.max_bytes)
+
+    def test_files_larger_than_the_cache_are_not_kept(self):
+        cache = ArchiveCache(self.directory, max_bytes=5)
+        path, digest, cached = self.add(cache, "a", b"0123456789")
+
+        # The file is still sent, from a temporary file
+        self.assertFalse(cached)
+        self.assertEqual(path.read_bytes(), b"0123456789")
+        self.assertEqual(digest, "84d89877f0d4041efb6bf91a16f0248f2fd573e6af05c19f96bedb9f882f7882")
+        self.assertIsNone(cache.get("a", "zip"))
+        self.assertEqual(cache._size, 0)
+
+    def test_builds_without_a_writable_cache_use_temporary_files(self):
+        blocker = self.directory / "file"
+        blocker.write_bytes(b"")
+        cache = ArchiveCache(blocker / "cache", max_bytes=1_000)
+        path, digest, cached = self.add(cache, "a", b"0123456789")
+        self.addCleanup(path.unlink)
+
+        self.assertFalse(cached)
+        self.assertEqual(path.read_bytes(), b"0123456789")
+        self.assertEqual(path.suffix, ".zip")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import shutil
+import tempfile
+import unittest
+from contextlib import asynccontextmanager
+from pathlib import Path
+from unittest import mock
+
+from exsclaim.utilities.cache import HTTPCache
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+class FakeResponse:
+    def __init__(self, status, body=b"", headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.content = FakeContent(body)
+        self.released = False
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self):
+        return self.body
+
+
+class FakeSession:
+    """Answers each GET with the next of the given responses, and records the requests and how many are still open."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.open = 0
+        self.max_open = 0
+
+    @asynccontextmanager
+    async def get(self, url, headers=None):
+        self.requests.append((url, dict(headers or {})))
+        response = self.responses.pop(0)
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+        try:
+            yield response
+        finally:
+            self.open -= 1
+            response.released = True
+
+
+class TestHTTPCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def cache(self, **kwargs):
+        return HTTPCache(self.directory, enabled=True, **kwargs)
+
+    def test_disabled_by_default(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            self.assertFalse(HTTPCache.from_query({}).enabled)
+            self.assertTrue(HTTPCache.from_query({"http_cache": True}).enabled)
+            self.assertTrue(HTTPCache.from_query({"http_cache": {"ttl": 60}}).enabled)
+            self.assertFalse(HTTPCache.from_query({"http_cache": False}).enabled)
+        with mock.patch.dict("os.environ", {"EXSCLAIM_HTTP_CACHE": "1"}):
+            self.assertTrue(HTTPCache.from_query({}).enabled)
+
+    async def test_miss_then_hit(self):
+        cache = self.cache()
+        session = FakeSession(FakeResponse(200, b"page", {"ETag": '"1"'}))
+        self.assertEqual(await cache.fetch(session, "https://example.com/a"), b"page")
+        self.assertEqual(await cache.fetch(session, "https://example.com/a"), b"page")
+        self.assertEqual(len(session.requests), 1)
+
+    async def test_not_modified_renews_the_cached_body(self):
+        cache = self.cache(ttl=0)
+        session = FakeSession(FakeResponse(200, b"page", {"ETag": '"1"'}), FakeResponse(304))
+        await cache.fetch(session, "https://example.com/a")
+        self.assertEqual(await cache.fetch(session, "https://example.com/a"), b"page")
+        self.assertEqual(session.requests[1][1]["If-None-Match"], '"1"')
+
+    async def test_not_modified_after_eviction_releases_the_first_response(self):
+        cache = self.cache(ttl=0)
+        session = FakeSession(FakeResponse(200, b"old", {"ETag": '"1"'}), FakeResponse(304), FakeResponse(200, b"new"))
+        await cache.fetch(session, "https://example.com/a")
+        body_path, _ = cache._paths(next(iter(cache._index)))
+        body_path.unlink()
+
+        self.assertEqual(await cache.fetch(session, "https://example.com/a"), b"new")
+        self.assertNotIn("If-None-Match", session.requests[2][1])
+        self.assertEqual(session.max_open, 1)
+
+    async def test_expired_entries_are_revalidated(self):
+        cache = self.cache(ttl=60)
+        session = FakeSession(FakeResponse(200, b"old", {"ETag": '"1"'}), FakeResponse(200, b"new", {"ETag": '"2"'}))
+        await cache.fetch(session, "https://example.com/a")
+        with mock.patch("exsclaim.utilities.cache.time", return_value=cache._read_meta(next(iter(cache._index)))["stored_at"] + 61):
+            self.assertEqual(await cache.fetch(session, "https://example.com/a"), b"new")
+        self.assertEqual(len(session.requests), 2)
+
+    async def test_least_recently_used_bodies_are_evicted(self):
+        cache = self.cache(max_size=10)
+        session = FakeSession(*(FakeResponse(200, body) for body in (b"aaaa", b"bbbb", b"cccc", b"aaaa")))
+        await cache.fetch(session, "https://example.com/a")
+        await cache.fetch(session, "https://example.com/b")
+        await cache.fetch(session, "https://example.com/c")
+        self.assertLessEqual(cache._size, 10)
+
+        # a was the least recently used, so it was removed and has to be requested again
+        await cache.fetch(session, "https://example.com/a")
+        self.assertEqual(len(session.requests), 4)
+
+    async def test_downloads_are_copied_out_of_the_cache(self):
+        cache = self.cache()
+        session = FakeSession(FakeResponse(200, b"image"))
+        first, second = self.directory / "first.png", self.directory / "second.png"
+        await cache.download(session, "https://example.com/a.png", first, chunk_size=2)
+        await cache.download(session, "https://example.com/a.png", second, chunk_size=2)
+
+        self.assertEqual(len(session.requests), 1)
+        self.assertEqual(second.read_bytes(), b"image")
+        body_path, _ = cache._paths(next(iter(cache._index)))
+        self.assertNotEqual(body_path.stat().st_ino, second.stat().st_ino)
+
+    async def test_downloads_larger_than_the_cache_are_not_cached(self):
+        cache = self.cache(max_size=4)
+        destination = self.directory / "a.png"
+        session = FakeSession(FakeResponse(200, b"too large", {"Content-Length": "9"}))
+        await cache.download(session, "https://example.com/a.png", destination)
+        self.assertEqual(destination.read_bytes(), b"too large")
+        self.assertFalse(list(self.directory.glob("*/*.body")))
+
+        # Without a Content-Length, the body is moved out of the cache once it's known to be too large
+        destination = self.directory / "b.png"
+        session = FakeSession(FakeResponse(200, b"too large"))
+        await cache.download(session, "https://example.com/b.png", destination)
+        self.assertEqual(destination.read_bytes(), b"too large")
+        self.assertFalse(list(self.directory.glob("*/*.body")))
+        self.assertEqual(cache._size, 0)
+
+    async def test_offline_misses_raise(self):
+        from exsclaim.exceptions import JournalScrapeError
+
+        cache = self.cache(offline=True)
+        with self.assertRaises(JournalScrapeError):
+            await cache.fetch(FakeSession(), "https://example.com/a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+from exsclaim.api.models import Results, Status
+from exsclaim.db import Database, Job, JobQueue, JobStatus, dispose_engines
+from exsclaim.db.postgres import get_database_connection_string
+
+import pytest
+
+from asyncio import run
+from datetime import datetime as dt, timedelta, timezone as tz
+from sqlalchemy import delete
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid import uuid4
+
+
+# Older than any real job, so the test's jobs are the first ones claimed
+CREATED_AT = dt(2000, 1, 1, tzinfo=tz.utc)
+
+
+def run_with_queue(test, lease:float = 60.0):
+	"""Runs the test with a JobQueue on its own engine, so each test's event loop has its own connections. The jobs the
+	test adds are deleted afterwards."""
+	async def main():
+		try:
+			await Database().initialize_database()
+		except (OSError, DBAPIError) as e:
+			pytest.skip(f"The database isn't available: {e}")
+		finally:
+			# The shared engine's connections belong to this test's event loop
+			await dispose_engines()
+
+		engine = create_async_engine(get_database_connection_string(), poolclass=NullPool)
+
+		queue = JobQueue(engine, lease=lease)
+		job_ids = []
+		try:
+			await test(queue, job_ids)
+		finally:
+			async with AsyncSession(engine) as session, session.begin():
+				await session.exec(delete(Job).where(Job.id.in_(job_ids)))
+				await session.exec(delete(Results).where(Results.id.in_(job_ids)))
+			await engine.dispose()
+
+	run(main())
+
+
+async def add_job(queue:JobQueue, job_ids:list, search_query:str = "/tmp/search_query.json", **fields) -> Job:
+	job = Job(id=uuid4(), search_query=search_query, created_at=CREATED_AT + timedelta(seconds=len(job_ids)), **fields)
+	job_ids.append(job.id)
+	async with queue._session() as session, session.begin():
+		session.add(Results(id=job.id, search_query={}, status=Status.RUNNING))
+		session.add(job)
+	return job
+
+
+async def get_job(queue:JobQueue, job_id) -> Job:
+	async with queue._session() as session:
+		return await session.get(Job, job_id)
+
+
+def test_claim_takes_the_oldest_queued_job():
+	async def test(queue, job_ids):
+		first = await add_job(queue, job_ids)
+		await add_job(queue, job_ids)
+
+		job = await queue.claim("worker-a")
+		assert job.id == first.id
+		assert job.status == JobStatus.RUNNING
+		assert job.worker == "worker-a"
+		assert job.attempts == 1
+		assert job.heartbeat_at is not None
+
+	run_with_queue(test)
+
+
+def test_claim_skips_running_jobs_with_a_live_lease():
+	async def test(queue, job_ids):
+		running = await add_job(queue, job_ids, status=JobStatus.RUNNING, worker="worker-a",
+								heartbeat_at=dt.now(tz.utc))
+		queued = await add_job(queue, job_ids)
+
+		job = await queue.claim("worker-b")
+		assert job.id == queued.id
+		assert (await get_job(queue, running.id)).worker == "worker-a"
+
+	run_with_queue(test)
+
+
+def test_claim_takes_over_jobs_whose_lease_expired():
+	async def test(queue, job_ids):
+		crashed = await add_job(queue, job_ids, status=JobStatus.RUNNING, worker="worker-a", attempts=1,
+								heartbeat_at=dt.now(tz.utc) - timedelta(minutes=5))
+
+		job = await queue.claim("worker-b")
+		assert job.id == crashed.id
+		assert job.worker == "worker-b"
+		assert job.attempts == 2
+
+	run_with_queue(test)
+
+
+def test_claim_finishes_expired_jobs_that_were_cancelled():
+	async def test(queue, job_ids):
+		cancelled = await add_job(queue, job_ids, status=JobStatus.RUNNING, worker="worker-a", cancel_requested=True,
+								  heartbeat_at=dt.now(tz.utc) - timedelta(minutes=5))
+
+		assert await queue.claim("worker-b") is None
+		assert (await get_job(queue, cancelled.id)).status == JobStatus.DONE
+		async with queue._session() as session:
+			assert (await session.get(Results, cancelled.id)).status == Status.KILLED
+
+	run_with_queue(test)
+
+
+def test_heartbeat_renews_the_lease():
+	async def test(queue, job_ids):
+		job = await add_job(queue, job_ids, status=JobStatus.RUNNING, worker="worker-a",
+							heartbeat_at=dt.now(tz.utc) - timedelta(minutes=5))
+
+		assert await queue.heartbeat(job.id) is False
+		assert await queue.claim("worker-b") is None
+
+	run_with_queue(test)
+
+
+def test_cancelling_a_queued_job_removes_its_results(tmp_path):
+	async def test(queue, job_ids):
+		search_query = tmp_path / "run" / "search_query.json"
+		search_query.parent.mkdir()
+		search_query.write_text("{}")
+		job = await add_job(queue, job_ids, search_query=str(search_query))
+
+		assert await queue.cancel(job.id)
+		assert (await get_job(queue, job.id)).status == JobStatus.DONE
+		assert not search_query.parent.exists()
+		assert not await queue.cancel(job.id)
+
+	run_with_queue(test)
+
+
+def test_cancelling_a_running_job_asks_its_worker_to_stop(tmp_path):
+	async def test(queue, job_ids):
+		search_query = tmp_path / "search_query.json"
+		search_query.write_text("{}")
+		job = await add_job(queue, job_ids, search_query=str(search_query), status=JobStatus.RUNNING,
+							worker="worker-a", heartbeat_at=dt.now(tz.utc))
+
+		assert await queue.cancel(job.id)
+		assert (await get_job(queue, job.id)).status == JobStatus.RUNNING
+		assert search_query.exists()
+		assert await queue.heartbeat(job.id) is True
+
+	run_with_queue(test)
+
+
+def test_release_requeues_a_running_job():
+	async def test(queue, job_ids):
+		job = await add_job(queue, job_ids)
+		await queue.claim("worker-a")
+		await queue.release(job.id)
+
+		released = await get_job(queue, job.id)
+		assert released.status == JobStatus.QUEUED
+		assert released.worker is None
+		assert released.heartbeat_at is None
+		assert (await queue.claim("worker-b")).id == job.id
+
+	run_with_queue(test)
@@ -96,5 +96,36 @@ class TestNature(unittest.TestCase):
             self.assertIsInstance(figure, bs4.element.Tag)
 
 
+class TestHasExtraKey(unittest.TestCase):
+    def has_extra_key(self, extra_key, html):
+        family = journal.Nature.__new__(journal.Nature)
+        family._extra_key = extra_key
+        return family.has_extra_key(BeautifulSoup(html, "lxml").figure)
+
+    def test_blank_keys_match_every_figure(self):
+        self.assertTrue(self.has_extra_key(" ", "<figure><img src='a.png'></figure>"))
+
+    def test_attributes_are_matched(self):
+        self.assertTrue(self.has_extra_key("/image/article", "<figure><a href='/image/article/1.gif'></a></figure>"))
+        self.assertFalse(self.has_extra_key("/image/article", "<figure><a href='/figures/1'></a></figure>"))
+
+    def test_classes_match_in_any_order(self):
+        html = "<figure><a class='internalNav inline-fig'></a></figure>"
+        self.assertTrue(self.has_extra_key("inline-fig internalNav", html))
+
+    def test_text_and_tags_are_matched(self):
+        self.assertTrue(self.has_extra_key("Fig. 1", "<figure><figcaption>Fig. 1 A figure</figcaption></figure>"))
+        self.assertTrue(self.has_extra_key("<figcaption", "<figure><figcaption>A figure</figcaption></figure>"))
+
+    def test_agrees_with_searching_the_figure_html(self):
+        """has_extra_key agrees with searching the serialized figures of real articles"""
+        keys = ("inline-fig internalNav", "/image/article", "c-article-section__figure-link", "Fig. 2")
+        for article in (pathlib.Path(__file__).parent / "data" / "nature_articles").glob("*.html"):
+            soup = BeautifulSoup(article.read_text(encoding="utf-8"), "lxml")
+            for figure in soup.select("figure"):
+                for key in keys:
+                    self.assertEqual(key in str(figure), self.has_extra_key(key, str(figure)), (article.name, key))
+
+
 if __name__ == "__main__":
     unittest.main()
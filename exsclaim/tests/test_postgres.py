@@ -0,0 +1,41 @@
+from exsclaim.db.postgres import _coercer
+
+from uuid import UUID, uuid4
+
+
+def test_bool_coercer():
+	coerce = _coercer(bool)
+	assert coerce(True) is True
+	assert coerce(False) is False
+	for value in ("True", "true", "t", "1", 1):
+		assert coerce(value) is True
+	for value in ("False", "false", "f", "0", 0, ""):
+		assert coerce(value) is False
+	assert coerce(None) is None
+
+
+def test_list_coercer():
+	coerce = _coercer(list)
+	assert coerce(["a", "b"]) == ["a", "b"]
+	assert coerce([1, 2.5]) == ["1", "2.5"]
+	assert coerce(("a",)) == ["a"]
+	assert coerce([]) == []
+	assert coerce(None) is None
+
+
+def test_number_coercers():
+	assert _coercer(int)("3.6") == 4
+	assert _coercer(int)(2) == 2
+	assert _coercer(float)("0.5") == 0.5
+	for python_type in (int, float):
+		assert _coercer(python_type)(None) is None
+		assert _coercer(python_type)("") is None
+
+
+def test_uuid_and_str_coercers():
+	run_id = uuid4()
+	assert _coercer(UUID)(run_id) is run_id
+	assert _coercer(UUID)(str(run_id)) == run_id
+	assert _coercer(UUID)(None) is None
+	assert _coercer(str)(12) == "12"
+	assert _coercer(str)(None) is None
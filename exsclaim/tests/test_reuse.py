@@ -0,0 +1,143 @@
+from exsclaim.api.models import Results, Status
+from exsclaim.api.reuse import FINGERPRINT_KEY, find_reusable_run, link_archive, query_fingerprint
+from exsclaim.db import Article, Database, clone_run, dispose_engines
+from exsclaim.db.postgres import get_database_connection_string
+from exsclaim.utilities import digest_path, write_digest
+
+import pytest
+
+from asyncio import run
+from datetime import datetime as dt, timedelta, timezone as tz
+from sqlalchemy import delete, func
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid import uuid4
+
+
+def get_query(**changes) -> dict:
+	query = dict(
+		name="reuse_test",
+		run_id=str(uuid4()),
+		journal_family="nature",
+		maximum_scraped=5,
+		sortby="relevant",
+		query={"search_field_1": dict(term="electronic polymers", synonyms=["conducting polymers", "organic semiconductors"])},
+		open=True,
+		llm="llama3.2",
+		save_format=["boxes", "postgres"],
+		notifications={"ntfy": [], "emails": []},
+	)
+	query.update(changes)
+	return query
+
+
+def test_fingerprint_ignores_case_and_whitespace():
+	query = get_query()
+	query["query"]["search_field_1"]["term"] = "  Electronic\tPOLYMERS "
+	query["journal_family"] = "Nature"
+	assert query_fingerprint(query) == query_fingerprint(get_query())
+
+
+def test_fingerprint_ignores_the_order_of_synonyms():
+	query = get_query()
+	query["query"]["search_field_1"]["synonyms"].reverse()
+	assert query_fingerprint(query) == query_fingerprint(get_query())
+
+
+def test_fingerprint_ignores_the_name_and_run_details():
+	query = get_query(name="another name", run_id=str(uuid4()), model_key="secret",
+					  notifications={"ntfy": [{"url": "https://ntfy.sh/exsclaim"}]})
+	assert query_fingerprint(query) == query_fingerprint(get_query())
+
+
+def test_fingerprint_changes_with_the_search():
+	fingerprint = query_fingerprint(get_query())
+	assert query_fingerprint(get_query(journal_family="acs")) != fingerprint
+	assert query_fingerprint(get_query(maximum_scraped=6)) != fingerprint
+	assert query_fingerprint(get_query(query={"search_field_1": dict(term="batteries", synonyms=[])})) != fingerprint
+
+
+def test_link_archive(tmp_path):
+	source = tmp_path / "source.tar.gz"
+	source.write_bytes(b"archive")
+	write_digest(source)
+	destination = tmp_path / "destination.tar.gz"
+
+	assert link_archive(source, destination)
+	assert destination.read_bytes() == b"archive"
+	assert digest_path(destination).is_file()
+	assert not link_archive(tmp_path / "missing.tar.gz", tmp_path / "other.tar.gz")
+
+
+def run_with_session(test):
+	"""Runs the test with a session on its own engine, deleting the runs it records in run_ids afterwards."""
+	async def main():
+		try:
+			await Database().initialize_database()
+		except (OSError, DBAPIError) as e:
+			pytest.skip(f"The database isn't available: {e}")
+		finally:
+			# The shared engine's connections belong to this test's event loop
+			await dispose_engines()
+
+		engine = create_async_engine(get_database_connection_string(), poolclass=NullPool)
+
+		run_ids = []
+		try:
+			async with AsyncSession(engine, expire_on_commit=False) as session:
+				await test(session, run_ids)
+		finally:
+			async with AsyncSession(engine) as session, session.begin():
+				await session.exec(delete(Article).where(Article.run_id.in_(run_ids)))
+				await session.exec(delete(Results).where(Results.id.in_(run_ids)))
+			await engine.dispose()
+
+	run(main())
+
+
+async def add_run(session, run_ids:list, fingerprint:str, status:Status = Status.FINISHED, age:timedelta = timedelta(0)):
+	run_id = uuid4()
+	run_ids.append(run_id)
+	end_time = dt.now(tz.utc) - age
+	session.add(Results(id=run_id, search_query={FINGERPRINT_KEY: fingerprint}, status=status,
+						start_time=end_time, end_time=end_time))
+	await session.commit()
+	return run_id
+
+
+def test_find_reusable_run():
+	async def test(session, run_ids):
+		fingerprint = uuid4().hex
+		await add_run(session, run_ids, fingerprint, age=timedelta(hours=2))
+		newest = await add_run(session, run_ids, fingerprint, age=timedelta(hours=1))
+		await add_run(session, run_ids, fingerprint, status=Status.ERROR)
+		await add_run(session, run_ids, uuid4().hex)
+
+		assert await find_reusable_run(session, fingerprint, timedelta(days=1)) == newest
+		assert await find_reusable_run(session, fingerprint, timedelta(minutes=30)) is None
+		assert await find_reusable_run(session, fingerprint, timedelta(0)) is None
+		assert await find_reusable_run(session, uuid4().hex, timedelta(days=1)) is None
+
+	run_with_session(test)
+
+
+def test_clone_run():
+	async def test(session, run_ids):
+		source = await add_run(session, run_ids, uuid4().hex)
+		clone = await add_run(session, run_ids, uuid4().hex)
+		for i in range(3):
+			session.add(Article(run_id=source, id=f"article-{i}", title=f"Article {i}", url=f"https://example.com/{i}",
+								license=None, open=True, authors=[], abstract=None))
+		await session.commit()
+
+		copied = await clone_run(session, source, clone)
+		await session.commit()
+
+		assert copied["article"] == 3
+		count = select(func.count()).select_from(Article).where(Article.run_id == clone)
+		assert (await session.exec(count)).one() == 3
+
+	run_with_session(test)
@@ -9,12 +9,15 @@ interchangeable.
 """
 
 from .caption import LLM
+from .db import ContentStore
 from .exceptions import JournalScrapeError
 from .journal import JournalFamily
-from .utilities import initialize_results_dir, PrinterFormatter
+from .utilities import initialize_results_dir, PrinterFormatter, create_client_session, HTTPCache, PolitenessScheduler, WebDriverPools, \
+	ProgressReporter
 
 from abc import ABC, abstractmethod
-from asyncio import gather, Lock, Semaphore
+from asyncio import create_task, gather, Lock, Semaphore, to_thread
+from contextlib import aclosing
 from json import dump, load, JSONEncoder
 from logging import getLogger, StreamHandler
 from os import PathLike
@@ -41,6 +44,9 @@ class ExsclaimEncoder(JSONEncoder):
 
 
 class ExsclaimTool(ABC):
+	# The name of the stage this tool's progress is reported as
+	stage: str = None
+
 	def __init__(self, search_query, **kwargs):
 		logger = kwargs.get("logger", None)
 		if logger is None:
@@ -54,6 +60,10 @@ class ExsclaimTool(ABC):
 		self.default_permissions = search_query.get("default_permissions", 0o775)
 		self.logger = logger
 		self.search_query = search_query
+		# Articles, figures and results shared with other queries, if the query or environment enables a content store
+		self.content_store = ContentStore.from_query(self.search_query)
+		# Set by the Pipeline running the tool
+		self.progress: ProgressReporter | None = kwargs.get("progress", None)
 
 	async def load(self):
 		...
@@ -132,6 +142,11 @@ class ExsclaimTool(ABC):
 		context = f"\t({context})" if context else ""
 		self.display_info(f">>> Time Elapsed: {time_diff:,.2f} sec{context}\n")
 
+	def _report_progress(self, done:int = 0, total:int = None):
+		"""Adds to the amount done in (and the total of) this tool's stage, if its progress is being reported."""
+		if self.progress is not None and self.stage is not None:
+			self.progress.advance(self.stage, done, total)
+
 	@abstractmethod
 	async def run(self, search_query:dict, exsclaim_json:dict):
 		pass
@@ -157,6 +172,8 @@ class JournalScraper(ExsclaimTool):
 	Parameters:
 	None
 	"""
+	stage = "articles"
+
 	def __init__(self, search_query:dict, **kwargs):
 		kwargs.setdefault("logger_name", __name__ + ".JournalScraper")
 		super().__init__(search_query, **kwargs)
@@ -174,16 +191,20 @@ class JournalScraper(ExsclaimTool):
 	def _run_loop_function(self, search_query, exsclaim_json: dict, figure: Path, new_separated: set):
 		return exsclaim_json
 
-	async def runner(self, exsclaim_json:dict, search_query:dict, article:str, journal_family_name:str, lock:Lock):
+	async def runner(self, exsclaim_json:dict, search_query:dict, article:str, journal_family_name:str, lock:Lock,
+					 journal_kwargs:dict):
 		# Extract figures, captions, and metadata from each article
 		t0 = self._start_timer()
 		self.display_info(f">>> Extracting figures from: {article.split('/')[-1]}")
 		try:
-			async with JournalFamily(journal_family_name, search_query,
-								 scrape_hidden_articles=search_query.get("scrape_hidden_articles", False)) as journal:
+			async with JournalFamily(journal_family_name, search_query, **journal_kwargs) as journal:
 				url = journal.domain + article
 				try:
-					article_dict = await journal.get_article_figures(url)
+					article_dict = await self._get_stored_article(journal, article)
+					if article_dict is None:
+						article_dict = await journal.get_article_figures(url)
+						if self.content_store is not None and article_dict:
+							await to_thread(self.content_store.put_article, article.split('/')[-1], url, article_dict)
 
 					async with lock:
 						self._update_exsclaim(exsclaim_json, article_dict)
@@ -194,6 +215,22 @@ class JournalScraper(ExsclaimTool):
 			self.display_exception(e, article)
 
 		self._end_timer(t0, f"JournalScraper: {article}")
+		self._report_progress(1)
+
+	async def _get_stored_article(self, journal:JournalFamily, article:str) -> dict | None:
+		"""Returns the figures a previous query scraped from the article, linking their images into this query's results."""
+		if self.content_store is None:
+			return None
+
+		article_dict = await to_thread(self.content_store.get_article, article.split('/')[-1])
+		if article_dict is None:
+			return None
+
+		self.display_info(f">>> Reusing the stored figures of: {article.split('/')[-1]}")
+		for figure_name, figure_json in article_dict.items():
+			figure_json["figure_path"] = str(Path(self.search_query["name"]) / "figures" / figure_name)
+		await journal.save_figures((figure_name, figure_json["image_url"]) for figure_name, figure_json in article_dict.items())
+		return article_dict
 
 	async def run(self, search_query:dict, exsclaim_json:dict):
 		"""Run the JournalScraper to find relevant article figures
@@ -211,14 +248,40 @@ class JournalScraper(ExsclaimTool):
 
 		self.display_info(f"Running Journal Scraper\n")
 
-		async with JournalFamily(journal_family_name, search_query,
-								 scrape_hidden_articles=search_query.get("scrape_hidden_articles", False)) as journal:
-			extensions = await journal.get_article_extensions()
-
-		lock = Lock()
-		await gather(*[
-			self.runner(exsclaim_json, search_query, extension, journal_family_name, lock) for extension in extensions
-		])
+		# Every JournalFamily in this run shares one connection pool, so connections to the journal are reused.
+		# Dynamic families also share a pool of browsers per browser type, which are only launched once a page is requested.
+		# All of them are paced by one scheduler, so concurrent runners can't exceed the journal's request rate together.
+		async with (create_client_session(**search_query.get("connections", {})) as session,
+					WebDriverPools(size=search_query.get("browsers", 2), logger=self.logger) as driver_pools):
+			journal_kwargs = dict(
+				scrape_hidden_articles=search_query.get("scrape_hidden_articles", False),
+				session=session,
+				driver_pools=driver_pools,
+				scheduler=PolitenessScheduler(**search_query.get("politeness", {})),
+				http_cache=HTTPCache.from_query(search_query),
+				article_cache={},
+				content_store=self.content_store,
+			)
+
+			# Each article starts being scraped as soon as the search that found it completes
+			lock = Lock()
+			runners = []
+			try:
+				async with (JournalFamily(journal_family_name, search_query, **journal_kwargs) as journal,
+							aclosing(journal.iter_article_extensions()) as extensions):
+					async for extension in extensions:
+						self._report_progress(total=1)
+						runners.append(create_task(
+							self.runner(exsclaim_json, search_query, extension, journal_family_name, lock, journal_kwargs)
+						))
+
+				await gather(*runners)
+			finally:
+				# If the search or a runner failed (or the run was cancelled), the runners still going are stopped before
+				# the session and browsers they use are closed
+				for runner in runners:
+					runner.cancel()
+				await gather(*runners, return_exceptions=True)
 
 		return exsclaim_json
 
@@ -232,6 +295,7 @@ class CaptionDistributor(ExsclaimTool):
 	model_path: str
 		Absolute path to caption nlp model
 	"""
+	stage = "captions"
 
 	def __init__(self, search_query:dict, **kwargs):
 		kwargs.setdefault("logger_name", __name__ + ".CaptionDistributor")
@@ -295,8 +359,20 @@ class CaptionDistributor(ExsclaimTool):
 
 				llm = LLM.from_search_query(search_query)
 
-				caption_dict = await llm.separate_captions(caption_text)
-				keywords = await llm.get_keywords(caption_text)
+				# The same caption separated by the same LLM in another query is reused
+				stored = None
+				if self.content_store is not None:
+					digest = self.content_store.digest(caption_text)
+					stored = await to_thread(self.content_store.get_result, digest, "captions", search_query["llm"])
+
+				if stored is not None:
+					caption_dict, keywords = stored["caption_dict"], tuple(stored["keywords"])
+				else:
+					caption_dict = await llm.separate_captions(caption_text)
+					keywords = await llm.get_keywords(caption_text)
+					if self.content_store is not None and caption_dict is not None:
+						await to_thread(self.content_store.put_result, digest, "captions",
+										dict(caption_dict=caption_dict, keywords=list(keywords)), search_query["llm"])
 
 			if caption_dict is not None:
 				self.logger.debug(f"Full caption dict: \"{caption_dict}\".")
@@ -310,6 +386,7 @@ class CaptionDistributor(ExsclaimTool):
 			self.display_exception(e, figure)
 
 		self._end_timer(t0, f"CaptionDistributor: {figure} ({i:,} of {num_captions:,}).")
+		self._report_progress(1)
 
 	async def run(self, search_query:dict, exsclaim_json:dict, limit_llms_to:Optional[int] = 5):
 		"""Run the CaptionDistributor to distribute subfigure captions
@@ -350,6 +427,7 @@ class CaptionDistributor(ExsclaimTool):
 		]
 
 		num_figures = len(figures)
+		self._report_progress(total=num_figures)
 		lock = Lock()
 		await gather(*[
 			self._runner(exsclaim_json, search_query, _path, new_separated, lock, semaphore, i+1, num_figures)
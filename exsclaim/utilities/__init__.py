@@ -1,6 +1,11 @@
+from .archive import *
 from .boxes import *
+from .browser import *
+from .cache import *
 from .download import *
 from .files import *
+from .http import *
 from .logging import *
 from .models import *
 from .paths import *
+from .progress import *
@@ -0,0 +1,212 @@
+"""Compressed archives of a run's results, written in parallel while the pipeline is still running"""
+from .files import write_digest
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from hashlib import sha256
+from os import PathLike, cpu_count, replace
+from pathlib import Path
+from queue import Queue
+from tarfile import TarFile, open as tar_open
+from threading import Lock, Thread
+from typing import BinaryIO
+from uuid import uuid4
+from zlib import DEFLATED, compressobj
+
+try:
+	import zstandard
+except (ImportError, ModuleNotFoundError):
+	zstandard = None
+
+
+__all__ = ["ResultsArchive"]
+
+
+def _gzip_member(block:bytes, level:int) -> bytes:
+	"""Compresses a block into a complete gzip member. Concatenated members form a valid gzip file."""
+	compressor = compressobj(level, DEFLATED, 31)
+	return compressor.compress(block) + compressor.flush()
+
+
+class _HashingFile:
+	"""Wraps a file opened for writing, computing the sha256 of everything written to it."""
+	def __init__(self, file:BinaryIO):
+		self._file = file
+		self.hasher = sha256()
+
+	def write(self, data:bytes) -> int:
+		self.hasher.update(data)
+		return self._file.write(data)
+
+	def flush(self):
+		self._file.flush()
+
+	def close(self):
+		self._file.close()
+
+	@property
+	def closed(self) -> bool:
+		return self._file.closed
+
+
+class _ParallelGzipWriter:
+	"""A write-only file object that gzips fixed-size blocks on a pool of threads.
+
+	Blocks are compressed independently, and a writer thread appends them to the underlying file in the order they were
+	written. At most 2 * workers blocks are held in memory at a time, so a fast producer waits for the compressors.
+	"""
+	def __init__(self, file:BinaryIO, level:int, workers:int, block_size:int):
+		self._file = file
+		self._level = level
+		self._block_size = block_size
+		self._buffer = bytearray()
+		self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive_compress")
+		self._pending: Queue[Future | None] = Queue(maxsize=2 * workers)
+		self._error: BaseException | None = None
+		self._writer = Thread(target=self._write_blocks, name="archive_writer", daemon=True)
+		self._writer.start()
+
+	def write(self, data:bytes) -> int:
+		if self._error is not None:
+			raise self._error
+		self._buffer += data
+		while len(self._buffer) >= self._block_size:
+			self._submit(bytes(self._buffer[:self._block_size]))
+			del self._buffer[:self._block_size]
+		return len(data)
+
+	def _submit(self, block:bytes):
+		self._pending.put(self._executor.submit(_gzip_member, block, self._level))
+
+	def _write_blocks(self):
+		while (future := self._pending.get()) is not None:
+			try:
+				compressed = future.result()
+				if self._error is None:
+					self._file.write(compressed)
+			except BaseException as e:
+				# Keeps draining the queue so the producer is never left blocked on it
+				self._error = self._error or e
+
+	def close(self):
+		if self._buffer:
+			self._submit(bytes(self._buffer))
+			self._buffer.clear()
+		self._pending.put(None)
+		self._writer.join()
+		self._executor.shutdown()
+		self._file.close()
+		if self._error is not None:
+			raise self._error
+
+
+class ResultsArchive:
+	"""A tar archive of a results directory that files can be added to as soon as the stage producing them finishes.
+
+	The tar stream is compressed on worker threads while it is written, either as block-parallel gzip (a .tar.gz that
+	any gzip reader can extract) or, if the optional zstandard package is installed, as multithreaded zstd. Closing the
+	archive adds whatever in the results directory hasn't been added yet, so only the files still changing at the end
+	of a run (e.g. exsclaim.json and the logs) are compressed after it finishes. The archive is written to a temporary
+	file and only appears at its final path once it is complete, next to a sidecar file holding its sha256 digest, which is
+	computed from the bytes as they're written.
+	:param base_name: The path of the archive, without its extension (like shutil.make_archive).
+	:param root_dir: The directory that the names in the archive are relative to.
+	:param base_dir: The directory, relative to root_dir, that is archived.
+	:param str format: One of ResultsArchive.FORMATS.
+	:param int level: The compression level. Defaults to 6 for gzip and 3 for zstd.
+	:param int workers: The number of compression threads. Defaults to the number of CPUs.
+	:param int block_size: The number of uncompressed bytes in each independently compressed gzip block.
+	"""
+	FORMATS = {"tar": ".tar", "gztar": ".tar.gz", "zsttar": ".tar.zst"}
+
+	def __init__(self, base_name:PathLike[str], root_dir:PathLike[str], base_dir:PathLike[str], format:str = "gztar",
+				 level:int = None, workers:int = None, block_size:int = 1 << 20):
+		if not self.supports(format):
+			raise ValueError(f"Unsupported archive format \"{format}\". Expected one of {', '.join(self.available_formats())}.")
+
+		self.path = Path(f"{base_name}{self.FORMATS[format]}")
+		self.root_dir = Path(root_dir)
+		self.base_dir = self.root_dir / base_dir
+		self.format = format
+
+		workers = workers or cpu_count() or 1
+		self._temporary = self.path.with_name(f".{self.path.name}.{uuid4().hex}.tmp")
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		file = self._file = _HashingFile(open(self._temporary, "wb"))
+		match format:
+			case "gztar":
+				self._stream = _ParallelGzipWriter(file, 6 if level is None else level, workers, block_size)
+			case "zsttar":
+				compressor = zstandard.ZstdCompressor(level=3 if level is None else level, threads=workers)
+				self._stream = compressor.stream_writer(file, closefd=True)
+			case _:
+				self._stream = file
+
+		self._tar: TarFile = tar_open(fileobj=self._stream, mode="w|")
+		self._lock = Lock()
+		self._added: set[Path] = set()
+		self._closed = False
+
+	@classmethod
+	def available_formats(cls) -> tuple[str, ...]:
+		return tuple(_format for _format in cls.FORMATS if _format != "zsttar" or zstandard is not None)
+
+	@classmethod
+	def supports(cls, format:str) -> bool:
+		return format in cls.available_formats()
+
+	def add(self, path:PathLike[str]):
+		"""Adds a file, or every file under a directory, that hasn't been added yet. Safe to call from several threads.
+		Files shouldn't change after being added, since only their contents at this point are archived.
+		"""
+		path = Path(path)
+		paths = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+		with self._lock:
+			if self._closed:
+				raise ValueError(f"The archive {self.path} is already closed.")
+			for file in paths:
+				if file in self._added or file == self._temporary:
+					continue
+				self._tar.add(file, arcname=str(file.relative_to(self.root_dir)), recursive=False)
+				self._added.add(file)
+
+	def close(self) -> Path:
+		"""Adds the rest of the results directory, finishes compressing, and moves the archive to its final path."""
+		self.add(self.base_dir)
+		with self._lock:
+			self._closed = True
+			try:
+				self._tar.close()
+				self._stream.close()
+				self._file.close()
+				replace(self._temporary, self.path)
+				write_digest(self.path, self._file.hasher.hexdigest())
+			except BaseException:
+				with suppress(OSError):
+					self._temporary.unlink()
+				raise
+		return self.path
+
+	def abort(self):
+		"""Stops writing the archive and removes the partially written file."""
+		with self._lock:
+			if self._closed:
+				return
+			self._closed = True
+			with suppress(Exception):
+				self._tar.close()
+			with suppress(Exception):
+				self._stream.close()
+			with suppress(Exception):
+				self._file.close()
+			with suppress(OSError):
+				self._temporary.unlink()
+
+	def __enter__(self) -> "ResultsArchive":
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
@@ -0,0 +1,173 @@
+"""A pool of headless browsers shared by the dynamic journal families of a run"""
+from asyncio import Queue, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from functools import partial
+from logging import Logger, getLogger
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium_stealth import stealth
+from typing import Any, AsyncIterator, Callable, Literal
+
+
+__all__ = ["WebDriverPool", "WebDriverPools"]
+
+
+class WebDriverPool:
+	"""Keeps up to `size` long-lived WebDriver sessions that are checked out for each page load.
+
+	Drivers are only launched when they are first needed, so a pool that is never used never starts a browser.
+	Every blocking Selenium call should go through :meth:`run`, which executes it on a thread dedicated to the pool,
+	allowing several pages to load at once without blocking the event loop. A driver that stops responding while it
+	is checked out is quit and replaced with a new one.
+	"""
+	def __init__(self, size:int = 2, browser:Literal["chrome", "firefox"] = "chrome", logger:Logger = None):
+		self.size = max(int(size), 1)
+		self.browser = browser
+		self.logger = logger or getLogger(__name__)
+
+		self._idle: Queue[Any | None] = Queue()
+		self._drivers = set()
+		self._created = 0
+		self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="webdriver")
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		await self.close()
+
+	async def run(self, func:Callable, *args, **kwargs) -> Any:
+		"""Runs a blocking (Selenium) function on one of the pool's threads."""
+		loop = get_running_loop()
+		return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+	@asynccontextmanager
+	async def checkout(self) -> AsyncIterator[webdriver.Remote]:
+		"""Lends a driver for the duration of the context, returning it to the pool (or replacing it if it crashed) afterward."""
+		driver = await self._acquire()
+		try:
+			yield driver
+		except BaseException:
+			if await self._is_alive(driver):
+				self._idle.put_nowait(driver)
+			else:
+				await self._recycle(driver)
+			raise
+		else:
+			self._idle.put_nowait(driver)
+
+	async def close(self):
+		"""Quits every driver the pool has launched."""
+		drivers, self._drivers = self._drivers, set()
+		for driver in drivers:
+			with suppress(WebDriverException):
+				await self.run(driver.quit)
+		self._created = 0
+		self._executor.shutdown(wait=False)
+
+	async def _acquire(self):
+		while True:
+			# There is no await between the check and the increment, so two coroutines can't reserve the same slot
+			if self._idle.empty() and self._created < self.size:
+				self._created += 1
+				try:
+					return await self._launch()
+				except BaseException:
+					self._created -= 1
+					raise
+
+			driver = await self._idle.get()
+			if driver is not None:
+				return driver
+			# None is put in the queue when a replacement could not be launched, so the waiter can try to launch one itself
+
+	async def _launch(self):
+		driver = await self.run(self._create_driver)
+		self._drivers.add(driver)
+		return driver
+
+	async def _recycle(self, driver):
+		self.logger.warning("A WebDriver stopped responding and is being replaced.")
+		self._drivers.discard(driver)
+		with suppress(WebDriverException):
+			await self.run(driver.quit)
+
+		try:
+			self._idle.put_nowait(await self._launch())
+		except BaseException:
+			self.logger.exception("Could not launch a replacement WebDriver.")
+			self._created -= 1
+			self._idle.put_nowait(None)
+
+	async def _is_alive(self, driver) -> bool:
+		try:
+			await self.run(lambda: driver.current_url)
+			return True
+		except WebDriverException:
+			return False
+
+	def _create_driver(self):
+		match self.browser:
+			case "chrome":
+				driver = self._initialize_chrome()
+			case "firefox":
+				driver = self._initialize_firefox()
+			case _:
+				raise ValueError(f"Unsupported browser \"{self.browser}\".")
+
+		stealth(driver,
+				languages=["en-US", "en"],
+				vendor="Google Inc.",
+				platform="Win32",
+				webgl_vendor="Intel Inc.",
+				renderer="Intel Iris OpenGL Engine",
+				fix_hairline=True)
+		return driver
+
+	@staticmethod
+	def _initialize_chrome():
+		from selenium.webdriver.chrome.options import Options
+
+		options = Options()
+		options.add_argument("--headless")
+		# options.add_argument("--user-data-dir=/tmp/chrome-data")
+		options.add_argument("--no-sandbox")
+		# options.add_argument("--disable-dev-shm-usage")
+		# options.add_argument("--remote-debugging-port=9222")
+		return webdriver.Chrome(options=options)
+
+	@staticmethod
+	def _initialize_firefox():
+		from selenium.webdriver import FirefoxOptions
+
+		options = FirefoxOptions()
+		options.add_argument("-headless")
+		return webdriver.Firefox(options=options)
+
+
+class WebDriverPools:
+	"""The WebDriverPool of each browser used in a run, so families that use different browsers can share one set of pools.
+	A browser's pool is only created once a family asks for it, and every pool holds up to `size` drivers.
+	"""
+	def __init__(self, size:int = 2, logger:Logger = None):
+		self.size = size
+		self.logger = logger or getLogger(__name__)
+		self._pools: dict[str, WebDriverPool] = {}
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		await self.close()
+
+	def get(self, browser:Literal["chrome", "firefox"]) -> WebDriverPool:
+		if (pool := self._pools.get(browser)) is None:
+			pool = self._pools[browser] = WebDriverPool(size=self.size, browser=browser, logger=self.logger)
+		return pool
+
+	async def close(self):
+		"""Quits the drivers of every pool."""
+		pools, self._pools = self._pools, {}
+		for pool in pools.values():
+			await pool.close()
@@ -0,0 +1,371 @@
+"""An on-disk cache for the pages and images requested from journals"""
+from ..exceptions import JournalScrapeError
+
+from aiohttp import ClientSession, ClientResponseError
+from asyncio import to_thread
+from contextlib import nullcontext, suppress
+from hashlib import sha256
+from json import dump, load
+from os import PathLike, getenv, replace, utime
+from pathlib import Path
+from shutil import copyfile
+from threading import Lock
+from time import time
+from typing import AsyncContextManager, Callable
+from uuid import uuid4
+
+
+__all__ = ["HTTPCache"]
+
+
+class HTTPCache:
+	"""Stores response bodies on disk by URL, along with the validators (ETag, Last-Modified) needed to revalidate them.
+
+	A cached response is served without a request while it is younger than `ttl`. Once it is older, a conditional GET is
+	made and a ``304 Not Modified`` response renews the cached copy instead of downloading it again. When the cache grows
+	past `max_size`, the least recently used responses are removed. In offline mode no requests are made at all, and a URL
+	that isn't cached raises a JournalScrapeError with a 504 status.
+	:param str directory: Where the responses are stored. Defaults to $EXSCLAIM_HTTP_CACHE_DIR or ~/.exsclaim/http_cache.
+	:param float ttl: How long (in seconds) a response is served without being revalidated.
+	:param int max_size: The maximum number of bytes of response bodies that are kept.
+	:param bool offline: If True, responses are only ever served from the cache.
+	:param bool enabled: If False (the default), every request goes straight to the network and nothing is stored.
+	"""
+	def __init__(self, directory:str | Path = None, ttl:float = 86_400, max_size:int = 1 << 30, offline:bool = False,
+				 enabled:bool = False):
+		if directory is None:
+			directory = getenv("EXSCLAIM_HTTP_CACHE_DIR", None) or Path.home() / ".exsclaim" / "http_cache"
+		self.directory = Path(directory)
+		self.ttl = float(ttl)
+		self.max_size = int(max_size)
+		self.offline = offline
+		self.enabled = enabled or offline
+
+		self._lock = Lock()
+		# Maps a key to the [size, last access time] of its body, loaded from the directory the first time it's needed
+		self._index: dict[str, list] | None = None
+		self._size = 0
+
+	@classmethod
+	def from_query(cls, search_query:dict) -> "HTTPCache":
+		"""Creates the cache described by the query's "http_cache" key, which is either a boolean or the keyword arguments
+		of HTTPCache. Without the key, the cache is only enabled if $EXSCLAIM_HTTP_CACHE is set, so scrapes always see
+		current pages unless a cache was asked for.
+		"""
+		config = search_query.get("http_cache", None)
+		if config is None:
+			config = bool(getenv("EXSCLAIM_HTTP_CACHE", None))
+		if isinstance(config, bool):
+			config = dict(enabled=config)
+		return cls(**dict(dict(enabled=True), **config))
+
+	async def fetch(self, session:ClientSession, url:str, headers:dict = None,
+					throttle:Callable[[str], AsyncContextManager] = None) -> bytes:
+		"""Returns the body of a GET request to url, from the cache if possible.
+		:param aiohttp.ClientSession session: The session used if a request has to be made.
+		:param str url: The requested URL.
+		:param dict headers: The headers of the request.
+		:param throttle: Called with the url to get a context manager that is held only while a request is actually made (e.g. PolitenessScheduler.slot).
+		:rtype: bytes
+		:raises exsclaim.exceptions.JournalScrapeError: If the request fails, or the url isn't cached in offline mode.
+		"""
+		headers = dict(headers or {})
+		if not self.enabled:
+			async with (throttle(url) if throttle else nullcontext()):
+				return await self._request(session, url, headers)
+
+		key = sha256(url.encode("utf-8")).hexdigest()
+		meta = await to_thread(self._read_meta, key)
+
+		if meta is not None and (self.offline or time() - meta["stored_at"] < self.ttl):
+			body = await to_thread(self._read_body, key)
+			if body is not None:
+				return body
+
+		if self.offline:
+			raise JournalScrapeError(f"{url} is not in the HTTP cache and requests can't be made while offline.", 504)
+
+		if meta is not None:
+			if meta.get("etag"):
+				headers["If-None-Match"] = meta["etag"]
+			if meta.get("last_modified"):
+				headers["If-Modified-Since"] = meta["last_modified"]
+
+		async with (throttle(url) if throttle else nullcontext()):
+			async with session.get(url, headers=headers) as response:
+				not_modified = response.status == 304 and meta is not None
+				body = None if not_modified else await self._read_response(response)
+				response_headers = response.headers
+
+			if not_modified:
+				body = await to_thread(self._revalidate, key, meta, response_headers)
+				if body is not None:
+					return body
+				# The body was evicted in the meantime, so it has to be downloaded again unconditionally, once the
+				# first response has been released
+				headers.pop("If-None-Match", None)
+				headers.pop("If-Modified-Since", None)
+				return await self._request(session, url, headers, key)
+
+		await to_thread(self._write, key, url, body, response_headers)
+		return body
+
+	async def download(self, session:ClientSession, url:str, destination:PathLike[str], headers:dict = None,
+					   throttle:Callable[[str], AsyncContextManager] = None, chunk_size:int = 1 << 16) -> Path:
+		"""Saves the body of a GET request to url at destination, from the cache if possible.
+		Unlike fetch, the body is never held in memory: it is streamed in chunks into the cache (or straight to destination
+		if the cache is disabled or the body is larger than max_size) and the file only appears at destination once it is
+		complete. Cached bodies are copied to destination, so changing the file never changes the cache.
+		:param aiohttp.ClientSession session: The session used if a request has to be made.
+		:param str url: The requested URL.
+		:param destination: Where the body should be saved.
+		:param dict headers: The headers of the request.
+		:param throttle: Called with the url to get a context manager that is held only while a request is actually made.
+		:param int chunk_size: The number of bytes read from the response at a time.
+		:rtype: pathlib.Path
+		:raises exsclaim.exceptions.JournalScrapeError: If the request fails, or the url isn't cached in offline mode.
+		"""
+		destination = Path(destination)
+		headers = dict(headers or {})
+		if not self.enabled:
+			async with (throttle(url) if throttle else nullcontext()), session.get(url, headers=headers) as response:
+				self._raise_for_status(response)
+				await self._stream(response, destination, chunk_size)
+			return destination
+
+		key = sha256(url.encode("utf-8")).hexdigest()
+		meta = await to_thread(self._read_meta, key)
+
+		if meta is not None and (self.offline or time() - meta["stored_at"] < self.ttl):
+			if await to_thread(self._copy_body, key, destination):
+				return destination
+
+		if self.offline:
+			raise JournalScrapeError(f"{url} is not in the HTTP cache and requests can't be made while offline.", 504)
+
+		if meta is not None:
+			if meta.get("etag"):
+				headers["If-None-Match"] = meta["etag"]
+			if meta.get("last_modified"):
+				headers["If-Modified-Since"] = meta["last_modified"]
+
+		body_path, _ = self._paths(key)
+		async with (throttle(url) if throttle else nullcontext()), session.get(url, headers=headers) as response:
+			if response.status == 304 and meta is not None:
+				await to_thread(self._revalidate, key, meta, response.headers, False)
+			else:
+				self._raise_for_status(response)
+				if self._content_length(response) > self.max_size:
+					# Caching it would evict everything else, so it's saved without being cached
+					await self._stream(response, destination, chunk_size)
+					return destination
+
+				await to_thread(body_path.parent.mkdir, parents=True, exist_ok=True)
+				size = await self._stream(response, body_path, chunk_size)
+				if size > self.max_size:
+					# The response didn't say how large it was, so it's only known to be too large now
+					await to_thread(self._discard, key, body_path, destination)
+					return destination
+				await to_thread(self._record, key, url, size, response.headers)
+
+		if await to_thread(self._copy_body, key, destination):
+			return destination
+
+		# The body was evicted in the meantime, so it has to be downloaded again unconditionally
+		headers.pop("If-None-Match", None)
+		headers.pop("If-Modified-Since", None)
+		async with (throttle(url) if throttle else nullcontext()), session.get(url, headers=headers) as response:
+			self._raise_for_status(response)
+			await self._stream(response, destination, chunk_size)
+		return destination
+
+	@staticmethod
+	async def _stream(response, destination:Path, chunk_size:int) -> int:
+		"""Writes the response body to a temporary file next to destination, which is renamed to destination once complete.
+		The file is written by a worker thread, so a slow disk doesn't hold up the event loop."""
+		temporary = _temporary(destination)
+		size = 0
+		try:
+			f = await to_thread(open, temporary, "wb")
+			try:
+				async for chunk in response.content.iter_chunked(chunk_size):
+					await to_thread(f.write, chunk)
+					size += len(chunk)
+			finally:
+				await to_thread(f.close)
+			await to_thread(replace, temporary, destination)
+		except BaseException:
+			with suppress(OSError):
+				temporary.unlink()
+			raise
+		return size
+
+	@staticmethod
+	def _content_length(response) -> int:
+		"""The size of the response's body from its Content-Length header, or 0 if it isn't known."""
+		try:
+			return int(response.headers.get("Content-Length", 0))
+		except (TypeError, ValueError):
+			return 0
+
+	async def _request(self, session:ClientSession, url:str, headers:dict, key:str = None) -> bytes:
+		async with session.get(url, headers=headers) as response:
+			body = await self._read_response(response)
+		if key is not None:
+			await to_thread(self._write, key, url, body, response.headers)
+		return body
+
+	@staticmethod
+	def _raise_for_status(response):
+		try:
+			response.raise_for_status()
+		except ClientResponseError as e:
+			raise JournalScrapeError(e.message, e.status, e.headers) from e
+
+	@classmethod
+	async def _read_response(cls, response) -> bytes:
+		cls._raise_for_status(response)
+		return await response.read()
+
+	# region Storage, run in a worker thread
+	def _paths(self, key:str) -> tuple[Path, Path]:
+		folder = self.directory / key[:2]
+		return folder / f"{key}.body", folder / f"{key}.json"
+
+	def _load_index(self):
+		if self._index is not None:
+			return
+		self._index = {}
+		self._size = 0
+		for body in self.directory.glob("*/*.body"):
+			with suppress(OSError):
+				stat = body.stat()
+				self._index[body.stem] = [stat.st_size, stat.st_mtime]
+				self._size += stat.st_size
+
+	def _read_meta(self, key:str) -> dict | None:
+		_, meta_path = self._paths(key)
+		try:
+			with open(meta_path, "r") as f:
+				return load(f)
+		except (OSError, ValueError):
+			return None
+
+	def _read_body(self, key:str) -> bytes | None:
+		body_path, _ = self._paths(key)
+		try:
+			body = body_path.read_bytes()
+		except OSError:
+			return None
+
+		# The modification time of the body is used as its last access time for eviction
+		now = time()
+		with suppress(OSError):
+			utime(body_path, (now, now))
+		with self._lock:
+			self._load_index()
+			if key in self._index:
+				self._index[key][1] = now
+		return body
+
+	def _copy_body(self, key:str, destination:Path) -> bool:
+		"""Copies the cached body to destination. Returns False if it isn't cached.
+		The body is copied rather than linked, so the figures of a run (which are e.g. chmod-ed and archived) never share a
+		file with the cache."""
+		body_path, _ = self._paths(key)
+		temporary = _temporary(destination)
+		try:
+			copyfile(body_path, temporary)
+			replace(temporary, destination)
+		except OSError:
+			with suppress(OSError):
+				temporary.unlink()
+			return False
+
+		now = time()
+		with suppress(OSError):
+			utime(body_path, (now, now))
+		with self._lock:
+			self._load_index()
+			if key in self._index:
+				self._index[key][1] = now
+		return True
+
+	def _revalidate(self, key:str, meta:dict, headers, read:bool = True) -> bytes | None:
+		meta["stored_at"] = time()
+		meta["etag"] = headers.get("ETag", meta.get("etag"))
+		meta["last_modified"] = headers.get("Last-Modified", meta.get("last_modified"))
+		self._write_meta(key, meta)
+		return self._read_body(key) if read else None
+
+	def _write(self, key:str, url:str, body:bytes, headers):
+		if len(body) > self.max_size:
+			return
+
+		body_path, _ = self._paths(key)
+		body_path.parent.mkdir(parents=True, exist_ok=True)
+		temporary = _temporary(body_path)
+		temporary.write_bytes(body)
+		replace(temporary, body_path)
+		self._record(key, url, len(body), headers)
+
+	def _record(self, key:str, url:str, size:int, headers):
+		"""Writes the metadata of a body that was just stored, and evicts old bodies if the cache is now too large."""
+		self._write_meta(key, dict(
+			url=url,
+			etag=headers.get("ETag", None),
+			last_modified=headers.get("Last-Modified", None),
+			stored_at=time(),
+			size=size,
+		))
+
+		with self._lock:
+			self._load_index()
+			previous = self._index.get(key)
+			self._size += size - (previous[0] if previous else 0)
+			self._index[key] = [size, time()]
+			self._evict()
+
+	def _discard(self, key:str, body_path:Path, destination:Path):
+		"""Moves a body that's too large to keep out of the cache to destination, and forgets it."""
+		try:
+			replace(body_path, destination)
+		except OSError:
+			# destination is on another file system
+			temporary = _temporary(destination)
+			copyfile(body_path, temporary)
+			replace(temporary, destination)
+			body_path.unlink(missing_ok=True)
+
+		_, meta_path = self._paths(key)
+		meta_path.unlink(missing_ok=True)
+		with self._lock:
+			self._load_index()
+			if (previous := self._index.pop(key, None)) is not None:
+				self._size -= previous[0]
+
+	def _write_meta(self, key:str, meta:dict):
+		_, meta_path = self._paths(key)
+		temporary = _temporary(meta_path)
+		with open(temporary, "w") as f:
+			dump(meta, f)
+		replace(temporary, meta_path)
+
+	def _evict(self):
+		if self._size <= self.max_size:
+			return
+
+		for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+			for path in self._paths(key):
+				with suppress(OSError):
+					path.unlink()
+			del self._index[key]
+			self._size -= size
+			if self._size <= self.max_size:
+				break
+	# endregion
+
+
+def _temporary(path:Path) -> Path:
+	"""A unique temporary path next to path, so concurrent writers never share a partially written file."""
+	return path.with_name(f".{path.name}.{uuid4().hex}.tmp")
@@ -1,8 +1,13 @@
 """Functions for reading and writing files."""
 import yaml
 
+from hashlib import sha256
+from os import PathLike, replace
+from pathlib import Path
+from uuid import uuid4
 
-__all__ = ["load_yaml"]
+
+__all__ = ["load_yaml", "digest_path", "file_digest", "write_digest", "read_digest"]
 
 
 def load_yaml(filename):
@@ -11,3 +16,50 @@ def load_yaml(filename):
             return yaml.safe_load(stream)
         except yaml.YAMLError as exc:
             print(exc)
+
+
+def digest_path(path:PathLike[str]) -> Path:
+    """The sidecar file holding the sha256 digest of path, in the format written by sha256sum."""
+    path = Path(path)
+    return path.with_name(f"{path.name}.sha256")
+
+
+def file_digest(path:PathLike[str], chunk_size:int = 1 << 20) -> str:
+    """The sha256 hex digest of a file, read chunk_size bytes at a time."""
+    hasher = sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def write_digest(path:PathLike[str], digest:str = None) -> str:
+    """Writes the sha256 digest of path (computed if it isn't given) to its sidecar file and returns it."""
+    path = Path(path)
+    digest = digest or file_digest(path)
+    sidecar = digest_path(path)
+    temporary = sidecar.with_name(f".{sidecar.name}.{uuid4().hex}.tmp")
+    temporary.write_text(f"{digest}  {path.name}\n")
+    replace(temporary, sidecar)
+    return digest
+
+
+def read_digest(path:PathLike[str], compute:bool = True) -> str | None:
+    """Returns the sha256 digest of path from its sidecar file.
+    A missing sidecar, or one older than the file, is (re)written if compute is True; otherwise None is returned.
+    """
+    path = Path(path)
+    sidecar = digest_path(path)
+    try:
+        if sidecar.stat().st_mtime >= path.stat().st_mtime:
+            return sidecar.read_text().split(maxsplit=1)[0]
+    except (OSError, IndexError):
+        pass
+
+    if not compute:
+        return None
+    try:
+        return write_digest(path)
+    except PermissionError:
+        # The digest is still returned when the sidecar can't be written
+        return file_digest(path)
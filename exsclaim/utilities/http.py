@@ -0,0 +1,89 @@
+"""Helpers for the HTTP connections shared across a single EXSCLAIM! run"""
+from aiohttp import ClientSession, TCPConnector
+from asyncio import Lock, Semaphore, get_running_loop, sleep
+from contextlib import asynccontextmanager
+from random import uniform
+from typing import AsyncIterator
+from urllib.parse import urlsplit
+
+
+__all__ = ["create_client_session", "PolitenessScheduler"]
+
+
+def create_client_session(limit:int = 100, limit_per_host:int = 8, ttl_dns_cache:int = 300, keepalive_timeout:float = 30.0,
+						  **kwargs) -> ClientSession:
+	"""Creates a ClientSession whose connection pool is meant to be shared by every request in a run.
+	Reusing one connector lets DNS lookups, TCP connections and TLS handshakes to a journal's domain be paid once
+	instead of once per article or figure.
+	:param int limit: The total number of simultaneous connections the pool will open.
+	:param int limit_per_host: The number of simultaneous connections the pool will open to a single host.
+	:param int ttl_dns_cache: How long (in seconds) resolved DNS entries are kept.
+	:param float keepalive_timeout: How long (in seconds) an idle connection is kept open for reuse.
+	:param kwargs: Any additional keyword arguments are passed to the ClientSession.
+	:rtype: aiohttp.ClientSession
+	"""
+	connector = TCPConnector(
+		limit=limit,
+		limit_per_host=limit_per_host,
+		ttl_dns_cache=ttl_dns_cache,
+		use_dns_cache=True,
+		keepalive_timeout=keepalive_timeout,
+	)
+	return ClientSession(connector=connector, **kwargs)
+
+
+class _HostState:
+	__slots__ = ("in_flight", "lock", "next_start")
+
+	def __init__(self, max_in_flight:int):
+		self.in_flight = Semaphore(max_in_flight)
+		self.lock = Lock()
+		self.next_start = 0.0
+
+
+class PolitenessScheduler:
+	"""Paces the requests made to each host without blocking the event loop.
+
+	Requests to the same host are started at least `min_interval` (plus up to `jitter`) seconds apart, and no more than
+	`max_in_flight` of them are outstanding at once. Requests to different hosts never wait on each other. Hosts that
+	need different pacing can be given their own settings through `hosts`, e.g.
+	``{"pubs.acs.org": {"min_interval": 5, "max_in_flight": 1}}``.
+	:param float min_interval: The minimum time (in seconds) between the start of two requests to a host.
+	:param float jitter: The upper bound of a random delay (in seconds) added on top of min_interval.
+	:param int max_in_flight: The number of simultaneous requests allowed to a host.
+	:param dict hosts: Per-host overrides of the above settings, keyed by hostname.
+	"""
+	def __init__(self, min_interval:float = 0.5, jitter:float = 0.5, max_in_flight:int = 4, hosts:dict[str, dict] = None):
+		self.defaults = dict(min_interval=float(min_interval), jitter=float(jitter), max_in_flight=max(int(max_in_flight), 1))
+		self.hosts = {host.lower(): {**self.defaults, **settings} for host, settings in (hosts or {}).items()}
+		self._states: dict[str, _HostState] = {}
+
+	def settings(self, host:str) -> dict:
+		"""The pacing settings that apply to the given host."""
+		return self.hosts.get(host.lower(), self.defaults)
+
+	def _state(self, host:str) -> _HostState:
+		state = self._states.get(host)
+		if state is None:
+			state = self._states[host] = _HostState(int(self.settings(host)["max_in_flight"]))
+		return state
+
+	@asynccontextmanager
+	async def slot(self, url:str, delay:float = 0.0) -> AsyncIterator[None]:
+		"""Waits until a request to the url's host may start, and holds one of the host's in-flight slots for the context.
+		:param str url: The URL (or bare hostname) that will be requested.
+		:param float delay: An additional delay (in seconds) required before this particular request.
+		"""
+		host = (urlsplit(url).hostname or url).lower()
+		settings = self.settings(host)
+		state = self._state(host)
+
+		async with state.in_flight:
+			async with state.lock:
+				loop = get_running_loop()
+				start = max(loop.time() + delay, state.next_start)
+				state.next_start = start + settings["min_interval"] + uniform(0, settings["jitter"])
+				wait = start - loop.time()
+			if wait > 0:
+				await sleep(wait)
+			yield
@@ -2,8 +2,9 @@
 
 Model names are mapped to googleids in model_names_to_google_ids."""
 from .download import download_file_from_google_drive
+from .files import write_digest
 from aiohttp import ClientSession
-from asyncio import Lock
+from asyncio import Lock, to_thread
 from hashlib import sha256
 from io import BytesIO
 from pathlib import Path
@@ -57,6 +58,8 @@ async def download_model_checkpoint(file_path:Path, exsclaim_domain:str = "https
 
 	with open(file_path, 'wb') as file:
 		file.write(buffer.getvalue())
+	# Saves the verified digest next to the checkpoint, so serving it never needs to hash it
+	write_digest(file_path, received_digest.lower())
 
 
 # FIXME: Convert all usages of this to async
@@ -73,6 +76,7 @@ async def load_model_from_checkpoint(model:nn.Module, model_name: Literal["class
         checkpoints_path.mkdir(exist_ok=True)
         file_id = model_names_to_googleids[model_name]
         await download_file_from_google_drive(file_id, checkpoint)
+        await to_thread(write_digest, checkpoint)
 
     if cuda:
         model.load_state_dict(load(checkpoint))
@@ -0,0 +1,99 @@
+"""Per-stage progress of a run, written to its results directory for the API to stream to clients"""
+from contextlib import suppress
+from datetime import datetime as dt, timezone as tz
+from json import JSONDecodeError, dump, load
+from os import PathLike, replace
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+
+__all__ = ["ProgressReporter", "read_progress"]
+
+
+def read_progress(path:PathLike[str]) -> dict | None:
+	"""Reads a run's progress.json, or returns None if it doesn't exist (yet, or anymore) or can't be read."""
+	with suppress(OSError, JSONDecodeError), open(path, "r", encoding="utf-8") as f:
+		return load(f)
+	return None
+
+
+class ProgressReporter:
+	"""Counts how much of each stage of a run (e.g. articles scraped, captions split, figures separated) is done.
+
+	The counts are written to a JSON file, replaced atomically so readers never see a partial write, at most once every
+	min_interval seconds unless a stage starts or finishes. The file looks like:
+	{"state": "running", "stage": "captions", "sequence": 12, "updated": "...",
+	 "stages": {"articles": {"state": "done", "done": 20, "total": 20}, "captions": {"state": "running", "done": 3, "total": 57}}}
+	:param path: Where the progress is written, normally <results directory>/progress.json.
+	:param float min_interval: The minimum number of seconds between writes of routine updates.
+	"""
+	FILENAME = "progress.json"
+
+	def __init__(self, path:PathLike[str], min_interval:float = 0.5):
+		self.path = Path(path)
+		self.min_interval = min_interval
+		self._lock = Lock()
+		self._state = "running"
+		self._stage: str | None = None
+		self._stages: dict[str, dict] = {}
+		self._sequence = 0
+		self._last_write = 0.0
+
+	def start(self, stage:str, total:int = None):
+		"""Marks a stage as running. The total can be left out and added later, e.g. once a search finishes."""
+		with self._lock:
+			self._stage = stage
+			self._stages[stage] = dict(state="running", done=0, total=total)
+			self._write(force=True)
+
+	def advance(self, stage:str, done:int = 1, total:int = None):
+		"""Adds to the amount done in a stage, and to its total (if given). Safe to call from several threads."""
+		with self._lock:
+			counts = self._stages.setdefault(stage, dict(state="running", done=0, total=None))
+			counts["done"] += done
+			if total:
+				counts["total"] = (counts["total"] or 0) + total
+			self._write()
+
+	def finish(self, stage:str):
+		with self._lock:
+			counts = self._stages.setdefault(stage, dict(state="running", done=0, total=None))
+			counts["state"] = "done"
+			if counts["total"] is None:
+				counts["total"] = counts["done"]
+			self._write(force=True)
+
+	def close(self, state:str = "finished"):
+		"""Records how the run ended (finished or error)."""
+		with self._lock:
+			self._state = state
+			self._stage = None
+			self._write(force=True)
+
+	def to_json(self) -> dict:
+		return dict(
+			state=self._state,
+			stage=self._stage,
+			sequence=self._sequence,
+			updated=dt.now(tz.utc).isoformat(),
+			stages={stage: dict(counts) for stage, counts in self._stages.items()},
+		)
+
+	def _write(self, force:bool = False):
+		now = monotonic()
+		if not force and now - self._last_write < self.min_interval:
+			return
+
+		self._sequence += 1
+		self._last_write = now
+		temporary = self.path.with_name(f".{self.path.name}.{uuid4().hex}.tmp")
+		# Progress is only informational, so failing to write it never interrupts the run
+		with suppress(OSError):
+			with open(temporary, "w", encoding="utf-8") as f:
+				dump(self.to_json(), f)
+			replace(temporary, self.path)
+			return
+		with suppress(OSError):
+			temporary.unlink()
@@ -0,0 +1,136 @@
+"""Runs the pipelines queued through the API, in processes separate from the API's web workers"""
+from .api.models import Status
+from .db import Database, JobQueue, Job
+
+import logging
+
+from asyncio import CancelledError, Semaphore, Task, TimeoutError, create_subprocess_exec, create_task, gather, shield, \
+	sleep, wait_for
+from asyncio.subprocess import Process
+from contextlib import suppress
+from os import getenv, getpid, killpg
+from pathlib import Path
+from shutil import rmtree
+from signal import SIGKILL, SIGTERM
+from socket import gethostname
+from sys import executable
+
+
+__all__ = ["PipelineWorker"]
+
+
+class PipelineWorker:
+	"""Claims jobs from the queue and runs each one's pipeline as a subprocess, at most `concurrency` at a time.
+
+	Running the pipeline in its own process keeps a crashing or memory hungry run from taking the worker down with it, and
+	lets a cancelled run be stopped by terminating its process. When a run ends, its status (finished, error or killed)
+	is written to its row in results.
+	:param int concurrency: The number of pipelines run at once.
+	:param float poll_interval: How often (in seconds) the queue is checked for new jobs, and running jobs for cancellation.
+	:param str name: Identifies the worker in the jobs table. Jobs a previous worker with the same name left running are requeued on start up.
+	:param Database database: The database holding the queue. Defaults to the one in the environment variables.
+	:param float termination_timeout: How long (in seconds) a cancelled run has to exit before it's killed.
+	:param float lease: How long (in seconds) a job can go without a heartbeat before another worker can claim it, e.g.
+		after this worker crashed. Defaults to $EXSCLAIM_JOB_LEASE, or 120. Running jobs send a heartbeat every poll_interval.
+	"""
+	def __init__(self, concurrency:int = 1, poll_interval:float = 2.0, name:str = None, database:Database = None,
+				 termination_timeout:float = 30.0, lease:float = None, logger:logging.Logger = None):
+		self.concurrency = concurrency
+		self.poll_interval = poll_interval
+		self.name = name or getenv("EXSCLAIM_WORKER_NAME", None) or f"{gethostname()}:{getpid()}"
+		lease = float(getenv("EXSCLAIM_JOB_LEASE", 120.0)) if lease is None else lease
+		if lease <= poll_interval:
+			raise ValueError(f"The lease ({lease}s) must be longer than the poll interval ({poll_interval}s).")
+		self.queue = JobQueue((database or Database()).async_engine, lease=lease)
+		self.termination_timeout = termination_timeout
+		self.logger = logger or logging.getLogger(__name__)
+
+	async def run(self):
+		"""Drains the queue until cancelled. Runs still going when the worker is cancelled are stopped and requeued."""
+		if recovered := await self.queue.recover(self.name):
+			self.logger.info(f"Requeued {recovered} job(s) left running by a previous worker named {self.name}.")
+
+		slots = Semaphore(self.concurrency)
+		tasks: set[Task] = set()
+
+		def on_done(task:Task):
+			tasks.discard(task)
+			slots.release()
+
+		self.logger.info(f"Worker {self.name} is running up to {self.concurrency} pipeline(s) at once.")
+		try:
+			while True:
+				await slots.acquire()
+				try:
+					job = await self.queue.claim(self.name)
+				except BaseException:
+					slots.release()
+					raise
+
+				if job is None:
+					slots.release()
+					await sleep(self.poll_interval)
+					continue
+
+				task = create_task(self.run_job(job), name=f"job_{job.id}")
+				tasks.add(task)
+				task.add_done_callback(on_done)
+		finally:
+			for task in tuple(tasks):
+				task.cancel()
+			await gather(*tasks, return_exceptions=True)
+
+	async def run_job(self, job:Job):
+		search_query = Path(job.search_query)
+		results_dir = search_query.parent
+		command = [executable, "-m", "exsclaim", "query", str(search_query), "--journal_scraper", "--caption_distributor",
+				   "--figure_separator", "--compress", "gztar", "--compress_location", str(results_dir)]
+		if getenv("EXSCLAIM_DEBUG") is not None:
+			command.append("--verbose")
+
+		self.logger.info(f"Starting job {job.id} (attempt {job.attempts}).")
+		status = Status.ERROR
+		process = None
+		try:
+			process = await create_subprocess_exec(*command, start_new_session=True)
+			while True:
+				try:
+					return_code = await wait_for(shield(process.wait()), self.poll_interval)
+				except TimeoutError:
+					# Renews the job's lease, so no other worker claims it while it's running
+					if await self.queue.heartbeat(job.id):
+						self.logger.info(f"Job {job.id} was cancelled, stopping it.")
+						await self.terminate(process)
+						status = Status.KILLED
+						break
+					continue
+
+				status = Status.FINISHED if return_code == 0 else Status.ERROR
+				break
+		except CancelledError:
+			# The worker is shutting down, so the job is put back for another worker to run from the start
+			if process is not None:
+				await self.terminate(process)
+			await shield(self.queue.release(job.id))
+			raise
+		except Exception:
+			self.logger.exception(f"Job {job.id} could not be run.")
+
+		if results_dir.is_dir():
+			rmtree(results_dir.absolute(), ignore_errors=True)
+		await self.queue.finish(job.id, status)
+		self.logger.info(f"Job {job.id} ended with status: {status}.")
+
+	async def terminate(self, process:Process):
+		"""Asks the run's process group (the pipeline and e.g. its browsers) to exit, and kills it if it hasn't after
+		termination_timeout seconds."""
+		if process.returncode is not None:
+			return
+		with suppress(ProcessLookupError):
+			killpg(process.pid, SIGTERM)
+		try:
+			await wait_for(process.wait(), self.termination_timeout)
+		except TimeoutError:
+			with suppress(ProcessLookupError):
+				killpg(process.pid, SIGKILL)
+			await process.wait()